@@ -0,0 +1,187 @@
+"""
+Cold storage for old ``attendance_logs``.
+
+Logs older than ``ATTENDANCE_ARCHIVE_AFTER_DAYS`` are moved out of Firestore
+into one gzip NDJSON segment per UTC day::
+
+    <ATTENDANCE_ARCHIVE_DIR>/manifest.json
+    <ATTENDANCE_ARCHIVE_DIR>/2026/01/2026-01-10.ndjson.gz
+
+The manifest records every segment (path, record count, first/last
+timestamp) and ``archived_before``: every log older than that timestamp lives
+in a segment, not in Firestore. Readers use it to decide whether a query
+range has to read through to the archive at all.
+"""
+import gzip
+import json
+import os
+import tempfile
+import threading
+from datetime import datetime, time, timedelta, timezone
+from pathlib import Path
+
+from django.conf import settings
+
+
+MANIFEST_NAME = "manifest.json"
+PAGE_SIZE = 500
+
+_manifest_lock = threading.Lock()
+_manifest_cache = {"mtime": None, "manifest": None}
+
+
+def archive_dir() -> Path:
+    return Path(settings.ATTENDANCE_ARCHIVE_DIR)
+
+
+def _empty_manifest() -> dict:
+    return {"version": 1, "archived_before": None, "segments": {}}
+
+
+def load_manifest() -> dict:
+    """Read the manifest, re-reading only when the file changed on disk."""
+    path = archive_dir() / MANIFEST_NAME
+    try:
+        mtime = path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return _empty_manifest()
+
+    with _manifest_lock:
+        if _manifest_cache["mtime"] != mtime:
+            with open(path, "r", encoding="utf-8") as f:
+                _manifest_cache["manifest"] = json.load(f)
+            _manifest_cache["mtime"] = mtime
+        return _manifest_cache["manifest"]
+
+
+def _atomic_write(path: Path, data: bytes):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def _segment_path(day: str) -> str:
+    year, month, _ = day.split("-")
+    return f"{year}/{month}/{day}.ndjson.gz"
+
+
+def _read_segment(relative_path: str) -> list:
+    with gzip.open(archive_dir() / relative_path, "rt", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _write_segment(manifest: dict, day: str, logs: list):
+    """Merge ``logs`` into the day's segment (deduplicated by log id)."""
+    segment = manifest["segments"].get(day)
+    if segment:
+        by_id = {log["id"]: log for log in _read_segment(segment["path"])}
+    else:
+        by_id = {}
+    by_id.update((log["id"], log) for log in logs)
+
+    merged = sorted(by_id.values(), key=lambda log: log.get("timestamp") or "")
+    payload = "".join(json.dumps(log, separators=(",", ":")) + "\n" for log in merged)
+
+    relative_path = _segment_path(day)
+    _atomic_write(archive_dir() / relative_path, gzip.compress(payload.encode("utf-8")))
+    manifest["segments"][day] = {
+        "path": relative_path,
+        "count": len(merged),
+        "first": merged[0].get("timestamp"),
+        "last": merged[-1].get("timestamp"),
+    }
+
+
+def _save_manifest(manifest: dict):
+    data = json.dumps(manifest, indent=2, sort_keys=True).encode("utf-8")
+    _atomic_write(archive_dir() / MANIFEST_NAME, data)
+
+
+def archive_cutoff(older_than_days: int) -> datetime:
+    """Midnight UTC ``older_than_days`` days ago; logs before it get archived."""
+    today = datetime.now(timezone.utc).date()
+    return datetime.combine(today - timedelta(days=older_than_days), time.min, tzinfo=timezone.utc)
+
+
+def archive_logs(db, older_than_days: int, dry_run: bool = False) -> dict:
+    """Move logs older than the cutoff from Firestore into day segments.
+
+    Segments and the manifest are written before the Firestore documents are
+    deleted, so an interrupted run loses nothing; re-running merges by log id.
+    """
+    cutoff = archive_cutoff(older_than_days).isoformat()
+    query = db.collection("attendance_logs").where("timestamp", "<", cutoff)
+
+    if dry_run:
+        pending = sum(1 for _ in query.select([]).stream())
+        return {"cutoff": cutoff, "archived": pending, "days": []}
+
+    manifest = load_manifest()
+    manifest = json.loads(json.dumps(manifest))  # don't mutate the shared cache
+    archived, days = 0, set()
+
+    while True:
+        docs = list(query.order_by("timestamp").limit(PAGE_SIZE).stream())
+        if not docs:
+            break
+
+        by_day = {}
+        for doc in docs:
+            log = doc.to_dict()
+            log["id"] = doc.id
+            by_day.setdefault((log.get("timestamp") or "")[:10], []).append(log)
+
+        for day, logs in by_day.items():
+            _write_segment(manifest, day, logs)
+            days.add(day)
+        _save_manifest(manifest)
+
+        batch = db.batch()
+        for doc in docs:
+            batch.delete(doc.reference)
+        batch.commit()
+        archived += len(docs)
+
+    if manifest["archived_before"] is None or cutoff > manifest["archived_before"]:
+        manifest["archived_before"] = cutoff
+    _save_manifest(manifest)
+
+    return {"cutoff": cutoff, "archived": archived, "days": sorted(days)}
+
+
+def reaches_archive(start=None) -> bool:
+    """True when a range starting at ``start`` (ISO string or None) may include archived logs."""
+    archived_before = load_manifest()["archived_before"]
+    return archived_before is not None and (start is None or start < archived_before)
+
+
+def read_archived_logs(start=None, end=None, student_id=None, newest_first=False):
+    """Yield archived logs with ``start <= timestamp < end`` (ISO strings, both optional)."""
+    segments = load_manifest()["segments"]
+    days = sorted(segments, reverse=newest_first)
+
+    for day in days:
+        segment = segments[day]
+        if start is not None and segment["last"] < start:
+            continue
+        if end is not None and segment["first"] >= end:
+            continue
+
+        logs = _read_segment(segment["path"])
+        if newest_first:
+            logs.reverse()
+        for log in logs:
+            timestamp = log.get("timestamp") or ""
+            if start is not None and timestamp < start:
+                continue
+            if end is not None and timestamp >= end:
+                continue
+            if student_id and log.get("student_id") != student_id:
+                continue
+            yield log
@@ -0,0 +1,118 @@
+"""
+One document per student per day.
+
+With ``ATTENDANCE_STORAGE_MODE`` set to ``days`` or ``both``, each check-in
+upserts ``attendance_days/{YYYY-MM-DD}_{uid}``::
+
+    {date, student_id, first_seen, last_seen, scan_count,
+     first_device_id, last_device_id, fingerprint_id, status}
+
+The first scan of the day creates the document; later scans bump
+``scan_count`` and ``last_seen``. "Present on a day" is then a count
+aggregation over ``date``, and a day's reads scale with the number of
+students present rather than the number of scans.
+
+``logs`` (the default) keeps only the raw scan log in ``attendance_logs``,
+``days`` keeps only day documents, ``both`` writes both. History, CSV
+export, archiving and report jobs read the raw log, so they need ``logs`` or
+``both``.
+"""
+from datetime import date, datetime
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from firebase_admin import firestore
+from google.api_core.exceptions import AlreadyExists
+
+from backend_project.batch import memoized
+
+
+DAYS_COLLECTION = "attendance_days"
+STORAGE_MODES = ("logs", "days", "both")
+
+
+def storage_mode() -> str:
+    mode = settings.ATTENDANCE_STORAGE_MODE
+    if mode not in STORAGE_MODES:
+        raise ImproperlyConfigured(
+            f"ATTENDANCE_STORAGE_MODE must be one of {', '.join(STORAGE_MODES)}, not {mode!r}"
+        )
+    return mode
+
+
+def stores_logs() -> bool:
+    return storage_mode() in ("logs", "both")
+
+
+def stores_days() -> bool:
+    return storage_mode() in ("days", "both")
+
+
+def day_ref(db, day: date, uid: str):
+    return db.collection(DAYS_COLLECTION).document(f"{day.isoformat()}_{uid}")
+
+
+def record_scan(db, log: dict, moment: datetime) -> bool:
+    """Upsert the student's day document for ``log``; True if this was their first scan that day.
+
+    ``create`` fails if the document exists, so exactly one scan per student
+    per day (across every worker) sees True.
+    """
+    day = moment.date()
+    ref = day_ref(db, day, log["student_id"])
+    try:
+        ref.create({
+            "date": day.isoformat(),
+            "student_id": log["student_id"],
+            "status": log.get("status"),
+            "first_seen": log["timestamp"],
+            "last_seen": log["timestamp"],
+            "scan_count": 1,
+            "first_device_id": log.get("device_id"),
+            "last_device_id": log.get("device_id"),
+            "fingerprint_id": log.get("fingerprint_id"),
+        })
+        return True
+    except AlreadyExists:
+        ref.update({
+            "last_seen": log["timestamp"],
+            "last_device_id": log.get("device_id"),
+            "scan_count": firestore.Increment(1),
+        })
+        return False
+
+
+def count_present(db, day: date) -> int:
+    """Unique students present on ``day``, as a server-side count aggregation."""
+    query = db.collection(DAYS_COLLECTION).where("date", "==", day.isoformat())
+    return memoized(("count_present", day), lambda: query.count().get()[0][0].value)
+
+
+def day_records(db, day: date):
+    """Every student's day document for ``day``, most recently seen first (read-only within a batch)."""
+
+    def load():
+        query = db.collection(DAYS_COLLECTION).where("date", "==", day.isoformat())
+        records = []
+        for doc in query.stream():
+            record = doc.to_dict()
+            record["id"] = doc.id
+            records.append(record)
+        records.sort(key=lambda record: record.get("last_seen") or "", reverse=True)
+        return records
+
+    return memoized(("day_records", day), load)
+
+
+def as_log(record: dict) -> dict:
+    """A day document in the shape of an ``attendance_logs`` entry (first scan of the day)."""
+    return {
+        "id": record.get("id"),
+        "student_id": record.get("student_id"),
+        "timestamp": record.get("first_seen"),
+        "status": record.get("status") or "Present",
+        "device_id": record.get("first_device_id"),
+        "fingerprint_id": record.get("fingerprint_id"),
+        "last_seen": record.get("last_seen"),
+        "scan_count": record.get("scan_count"),
+    }
@@ -0,0 +1,146 @@
+"""
+Check-in histograms: counts per time bucket, broken down by device.
+
+``scans`` counts every check-in in the raw log, read through to the archive
+with only the fields the histogram needs. ``arrivals`` counts each student's
+first scan of a day; when day documents are stored (see ``days``) those come
+straight from the ``attendance_days`` rollups, one small document per
+student-day instead of every scan, and otherwise from the log.
+
+Rows are loaded once into flat lists of epoch seconds and device indexes,
+and bucketed in a single counting pass over them. With ``fold="day"`` the
+buckets are times of day (UTC) summed over every day in the range, which is
+what capacity planning wants; otherwise they run from ``start`` to ``end``.
+"""
+from datetime import datetime, timedelta, timezone
+
+from attendance.archive import read_archived_logs, reaches_archive
+from attendance.days import DAYS_COLLECTION, stores_days, stores_logs
+from attendance.logs import range_query
+
+
+KINDS = ("scans", "arrivals")
+FOLDS = ("none", "day")
+DAY_SECONDS = 86400
+UNKNOWN_DEVICE = "unknown"
+
+
+class HistogramError(ValueError):
+    """Raised for a histogram that can't be built from the stored data or parameters."""
+
+
+def _seconds(timestamp):
+    try:
+        return datetime.fromisoformat(timestamp).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def _log_rows(db, start: str, end: str):
+    """``(timestamp, device_id, student_id)`` for every scan in ``[start, end)``, oldest first."""
+    if reaches_archive(start):
+        for log in read_archived_logs(start, end):
+            yield log.get("timestamp"), log.get("device_id"), log.get("student_id")
+    query = range_query(db, start, end).select(["timestamp", "device_id", "student_id"])
+    for doc in query.stream():
+        log = doc.to_dict()
+        yield log.get("timestamp"), log.get("device_id"), log.get("student_id")
+
+
+def _first_scans(rows):
+    """Keep each student's first scan per (UTC) day; ``rows`` must be oldest first."""
+    seen = set()
+    for timestamp, device_id, student_id in rows:
+        key = ((timestamp or "")[:10], student_id)
+        if key not in seen:
+            seen.add(key)
+            yield timestamp, device_id, student_id
+
+
+def _day_rows(db, start: str, end: str):
+    """First scans from ``attendance_days``, one per student-day in ``[start, end)``."""
+    query = db.collection(DAYS_COLLECTION).where("date", ">=", start[:10]).where("date", "<=", end[:10])
+    for doc in query.select(["first_seen", "first_device_id", "student_id"]).stream():
+        record = doc.to_dict()
+        first_seen = record.get("first_seen") or ""
+        if start <= first_seen < end:
+            yield first_seen, record.get("first_device_id"), record.get("student_id")
+
+
+def load(rows):
+    """``(seconds, device indexes, device names)`` from ``(timestamp, device_id, ...)`` rows."""
+    seconds, devices, names = [], [], {}
+    for timestamp, device_id, _ in rows:
+        moment = _seconds(timestamp)
+        if moment is None:
+            continue
+        seconds.append(moment)
+        devices.append(names.setdefault(device_id or UNKNOWN_DEVICE, len(names)))
+    return seconds, devices, list(names)
+
+
+def bucket_counts(seconds, devices, device_count: int, origin: float, width: float, buckets: int, fold: bool):
+    """``[device][bucket]`` counts; rows outside the buckets are dropped."""
+    counts = [[0] * buckets for _ in range(device_count)]
+    for moment, device in zip(seconds, devices):
+        index = int(((moment % DAY_SECONDS) if fold else (moment - origin)) // width)
+        if 0 <= index < buckets:
+            counts[device][index] += 1
+    return counts
+
+
+def build(db, start: str, end: str, kind: str, bucket_minutes: int, fold: str, max_buckets: int) -> dict:
+    """The histogram of ``kind`` over ``[start, end)`` (ISO timestamps)."""
+    if kind not in KINDS:
+        raise HistogramError(f"kind must be one of {', '.join(KINDS)}")
+    if fold not in FOLDS:
+        raise HistogramError(f"fold must be one of {', '.join(FOLDS)}")
+    if bucket_minutes <= 0:
+        raise HistogramError("bucket_minutes must be positive")
+
+    width = bucket_minutes * 60
+    origin = datetime.fromisoformat(start).timestamp()
+    if fold == "day":
+        if DAY_SECONDS % width:
+            raise HistogramError("bucket_minutes must divide a day when fold=day")
+        buckets = DAY_SECONDS // width
+    else:
+        buckets = -int(-(datetime.fromisoformat(end).timestamp() - origin) // width)
+    if buckets <= 0:
+        raise HistogramError("end must be after start")
+    if buckets > max_buckets:
+        raise HistogramError(f"{buckets} buckets requested, at most {max_buckets}; use wider buckets")
+
+    if kind == "arrivals" and stores_days():
+        source, rows = "days", _day_rows(db, start, end)
+    elif stores_logs():
+        source, rows = "logs", _log_rows(db, start, end)
+        if kind == "arrivals":
+            rows = _first_scans(rows)
+    else:
+        raise HistogramError("scans need the raw log; ATTENDANCE_STORAGE_MODE only stores day documents")
+
+    seconds, devices, names = load(rows)
+    counts = bucket_counts(seconds, devices, len(names), origin, width, buckets, fold == "day")
+    total = [sum(column) for column in zip(*counts)] if counts else [0] * buckets
+
+    if fold == "day":
+        labels = [f"{minute // 60:02d}:{minute % 60:02d}" for minute in range(0, 1440, bucket_minutes)]
+    else:
+        first = datetime.fromtimestamp(origin, tz=timezone.utc)
+        labels = [(first + timedelta(seconds=width * index)).isoformat() for index in range(buckets)]
+
+    peak = max(range(buckets), key=total.__getitem__)
+    return {
+        "kind": kind,
+        "source": source,
+        "start": start,
+        "end": end,
+        "bucket_minutes": bucket_minutes,
+        "fold": fold,
+        "buckets": labels,
+        "total": total,
+        "by_device": dict(zip(names, counts)),
+        "count": sum(total),
+        "peak": {"bucket": labels[peak], "count": total[peak]},
+    }
@@ -0,0 +1,231 @@
+"""
+Simulated ESP32 scanner fleet for end-to-end capacity testing.
+
+Every simulated device is an asyncio task that talks plain HTTP/1.1 to a
+running backend (one connection per request, like the firmware's
+``HTTPClient``). Devices follow a few arrival patterns seen in practice:
+
+- a steady trickle of scans between classes,
+- class-start bursts where every device scans back to back at once,
+- double scans (the same finger read twice within a second),
+- offline replay (scans buffered during a Wi-Fi drop, then sent in a rush).
+
+Like the firmware, a device resends a check-in that timed out with the same
+``seq``. If the first attempt did reach the server, the backend replays its
+stored response (``Idempotent-Replayed: true``); the summary reports how often
+that happened.
+
+Point the backend at the Firestore emulator (``FIRESTORE_EMULATOR_HOST``) so
+a run never touches production data.
+"""
+import asyncio
+import json
+import random
+import time
+from dataclasses import dataclass, field
+from urllib.parse import urlsplit
+
+
+@dataclass
+class LoadProfile:
+    duration: float = 30.0
+    fingerprints: list = field(default_factory=lambda: list(range(1, 101)))
+    idle_scans_per_minute: float = 2.0
+    burst_interval: float = 20.0
+    burst_size: int = 8
+    scan_gap: float = 1.2
+    double_scan_ratio: float = 0.1
+    offline_ratio: float = 0.05
+    offline_seconds: float = 5.0
+    verify_ratio: float = 0.2
+    timeout: float = 10.0
+    honor_retry_after: bool = True
+
+
+@dataclass
+class Sample:
+    endpoint: str
+    status: int
+    latency: float
+    replayed: bool = False
+
+
+async def http_request(base_url: str, method: str, path: str, body=None, headers=None, timeout: float = 10.0):
+    """Send one request on a fresh connection; returns ``(status, headers, body)``."""
+    parts = urlsplit(base_url)
+    host = parts.hostname
+    port = parts.port or (443 if parts.scheme == "https" else 80)
+    payload = json.dumps(body).encode("utf-8") if body is not None else b""
+
+    lines = [
+        f"{method} {parts.path.rstrip('/')}{path} HTTP/1.1",
+        f"Host: {parts.netloc}",
+        "Connection: close",
+        f"Content-Length: {len(payload)}",
+    ]
+    if body is not None:
+        lines.append("Content-Type: application/json")
+    lines.extend(f"{name}: {value}" for name, value in (headers or {}).items())
+    request = ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + payload
+
+    async def exchange():
+        reader, writer = await asyncio.open_connection(host, port, ssl=parts.scheme == "https" or None)
+        try:
+            writer.write(request)
+            await writer.drain()
+            raw = await reader.read()
+        finally:
+            writer.close()
+        head, _, content = raw.partition(b"\r\n\r\n")
+        head_lines = head.decode("latin-1").split("\r\n")
+        status = int(head_lines[0].split(" ", 2)[1])
+        response_headers = {}
+        for line in head_lines[1:]:
+            name, _, value = line.partition(":")
+            response_headers[name.strip().lower()] = value.strip()
+        return status, response_headers, content
+
+    return await asyncio.wait_for(exchange(), timeout)
+
+
+class SimulatedDevice:
+    def __init__(self, device_id: str, base_url: str, profile: LoadProfile, samples: list, rng: random.Random):
+        self.device_id = device_id
+        self.base_url = base_url
+        self.profile = profile
+        self.samples = samples
+        self.rng = rng
+        self.seq = 0
+
+    async def _call(self, endpoint: str, method: str, path: str, body=None):
+        for _ in range(2):
+            started = time.perf_counter()
+            try:
+                status, headers, _ = await http_request(
+                    self.base_url, method, path, body,
+                    headers={"X-Device-ID": self.device_id},
+                    timeout=self.profile.timeout,
+                )
+            except asyncio.TimeoutError:
+                status, headers = 0, {}
+            except OSError:
+                status, headers = -1, {}
+            replayed = headers.get("idempotent-replayed") == "true"
+            self.samples.append(Sample(endpoint, status, time.perf_counter() - started, replayed))
+            if status == 429 and self.profile.honor_retry_after:
+                await asyncio.sleep(float(headers.get("retry-after", "1")))
+            elif status != 0:
+                return status
+        return status
+
+    async def scan(self, fingerprint_id=None):
+        fingerprint_id = fingerprint_id or self.rng.choice(self.profile.fingerprints)
+        if self.rng.random() < self.profile.verify_ratio:
+            await self._call("verify_fingerprint", "GET", f"/fingerprint/verify/{fingerprint_id}/")
+        self.seq += 1
+        await self._call(
+            "check_in", "POST", "/attendance/check-in/",
+            {"fingerprint_id": fingerprint_id, "device_id": self.device_id, "seq": self.seq},
+        )
+        return fingerprint_id
+
+    async def _scan_maybe_twice(self):
+        fingerprint_id = await self.scan()
+        if self.rng.random() < self.profile.double_scan_ratio:
+            await asyncio.sleep(self.rng.uniform(0.2, 1.0))
+            await self.scan(fingerprint_id)
+
+    async def run(self, deadline: float):
+        profile = self.profile
+        loop = asyncio.get_running_loop()
+        # Stagger devices a little so bursts aren't perfectly synchronized.
+        next_burst = loop.time() + self.rng.uniform(0, 1.0)
+
+        while loop.time() < deadline:
+            now = loop.time()
+            if now >= next_burst:
+                if self.rng.random() < profile.offline_ratio:
+                    # Wi-Fi drop: scans pile up locally, then replay back to back.
+                    await asyncio.sleep(profile.offline_seconds)
+                    for _ in range(profile.burst_size):
+                        await self.scan()
+                else:
+                    for _ in range(profile.burst_size):
+                        await self._scan_maybe_twice()
+                        await asyncio.sleep(profile.scan_gap * self.rng.uniform(0.5, 1.5))
+                next_burst += profile.burst_interval
+                continue
+
+            rate = profile.idle_scans_per_minute / 60.0
+            pause = self.rng.expovariate(rate) if rate > 0 else next_burst - now
+            if now + pause >= next_burst:
+                await asyncio.sleep(max(0.0, min(next_burst, deadline) - now))
+                continue
+            await asyncio.sleep(pause)
+            await self._scan_maybe_twice()
+
+
+def _percentile(sorted_values: list, fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def summarize(samples: list, devices: int, elapsed: float) -> dict:
+    """Throughput, latency percentiles and outcome rates for one step."""
+    def describe(group):
+        latencies = sorted(s.latency * 1000 for s in group)
+        total = len(group)
+        ok = sum(1 for s in group if 200 <= s.status < 300)
+        not_found = sum(1 for s in group if s.status == 404)
+        throttled = sum(1 for s in group if s.status == 429)
+        replayed = sum(1 for s in group if s.replayed)
+        errors = total - ok - not_found - throttled
+        return {
+            "requests": total,
+            "throughput_rps": round(total / elapsed, 1) if elapsed else 0.0,
+            "ok_rps": round(ok / elapsed, 1) if elapsed else 0.0,
+            "p50_ms": round(_percentile(latencies, 0.50), 1),
+            "p95_ms": round(_percentile(latencies, 0.95), 1),
+            "p99_ms": round(_percentile(latencies, 0.99), 1),
+            "max_ms": round(latencies[-1], 1) if latencies else 0.0,
+            "not_found_rate": round(not_found / total, 4) if total else 0.0,
+            "throttled_rate": round(throttled / total, 4) if total else 0.0,
+            "replayed_rate": round(replayed / total, 4) if total else 0.0,
+            "error_rate": round(errors / total, 4) if total else 0.0,
+        }
+
+    endpoints = sorted({s.endpoint for s in samples})
+    return {
+        "devices": devices,
+        "elapsed_s": round(elapsed, 1),
+        "all": describe(samples),
+        "endpoints": {name: describe([s for s in samples if s.endpoint == name]) for name in endpoints},
+    }
+
+
+async def run_step(base_url: str, devices: int, profile: LoadProfile, seed: int = 0) -> dict:
+    samples = []
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    deadline = started + profile.duration
+    fleet = [
+        SimulatedDevice(f"loadgen-{i:04d}", base_url, profile, samples, random.Random(seed * 100003 + i))
+        for i in range(devices)
+    ]
+    await asyncio.gather(*(device.run(deadline) for device in fleet))
+    return summarize(samples, devices, loop.time() - started)
+
+
+async def seed_students(base_url: str, fingerprints: list, timeout: float = 10.0) -> int:
+    """Register one load-test student per fingerprint id; returns how many succeeded."""
+    ok = 0
+    for fingerprint_id in fingerprints:
+        status, _, _ = await http_request(
+            base_url, "POST", "/users/register/",
+            {"uid": f"LOADGEN-{fingerprint_id}", "name": f"Load Test {fingerprint_id}",
+             "fingerprint_id": fingerprint_id, "role": "student"},
+            timeout=timeout,
+        )
+        ok += status == 200
+    return ok
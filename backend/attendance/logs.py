@@ -0,0 +1,69 @@
+"""
+Attendance log range reads shared by views, exports and report jobs.
+
+Ranges are half-open ``[start, end)`` ISO timestamp strings; logs older than
+the archive cutoff are read from the archive segments (see ``archive``).
+"""
+from datetime import date, datetime, timedelta, timezone
+
+from attendance.archive import read_archived_logs, reaches_archive
+from backend_project.batch import memoized
+
+
+EXPORT_FIELDS = ["id", "timestamp", "student_id", "status", "device_id", "fingerprint_id"]
+
+
+def parse_bound(value, end=False):
+    """Parse a ``start``/``end`` query param into an ISO timestamp string.
+
+    A bare date means the whole day: ``end=2026-01-10`` includes that day.
+    """
+    if not value:
+        return None
+    try:
+        if len(value) == 10:
+            day = date.fromisoformat(value)
+            if end:
+                day += timedelta(days=1)
+            return datetime(day.year, day.month, day.day, tzinfo=timezone.utc).isoformat()
+        moment = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        raise ValueError(f"Invalid date: {value}")
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone(timezone.utc).isoformat()
+
+
+def range_query(db, start, end, student_id=None, direction="ASCENDING"):
+    query = db.collection("attendance_logs").order_by("timestamp", direction=direction)
+    if student_id:
+        query = query.where("student_id", "==", student_id)
+    if start:
+        query = query.where("timestamp", ">=", start)
+    if end:
+        query = query.where("timestamp", "<", end)
+    return query
+
+
+def iter_logs_in_range(db, start, end, student_id=None):
+    """Yield logs oldest first across the archive and Firestore."""
+    if reaches_archive(start):
+        yield from read_archived_logs(start, end, student_id)
+    for doc in range_query(db, start, end, student_id).stream():
+        log_data = doc.to_dict()
+        log_data["id"] = doc.id
+        yield log_data
+
+
+def logs_since(db, start: str) -> list:
+    """Logs at or after ``start``, newest first; shared within a batch, so treat as read-only."""
+
+    def load():
+        logs = []
+        for doc in range_query(db, start, None, direction="DESCENDING").stream():
+            log_data = doc.to_dict()
+            log_data["id"] = doc.id
+            logs.append(log_data)
+        return logs
+
+    return memoized(("logs_since", start), load)
@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from attendance.archive import archive_dir, archive_logs
+from firebase_config.firebase import FirebaseCredentialsError, get_firestore_db
+
+
+class Command(BaseCommand):
+    help = "Move old attendance_logs out of Firestore into gzip NDJSON day segments."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--older-than-days",
+            type=int,
+            default=settings.ATTENDANCE_ARCHIVE_AFTER_DAYS,
+            help="Archive logs from before midnight UTC this many days ago.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only count the logs that would be archived.",
+        )
+
+    def handle(self, *args, **options):
+        if options["older_than_days"] < 1:
+            raise CommandError("--older-than-days must be at least 1")
+
+        try:
+            db = get_firestore_db()
+        except FirebaseCredentialsError as e:
+            raise CommandError(str(e))
+
+        report = archive_logs(db, options["older_than_days"], dry_run=options["dry_run"])
+
+        if options["dry_run"]:
+            self.stdout.write(f"{report['archived']} logs before {report['cutoff']} would be archived.")
+            return
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {report['archived']} logs before {report['cutoff']} "
+            f"into {len(report['days'])} day segments under {archive_dir()}."
+        ))
@@ -0,0 +1,105 @@
+import asyncio
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from attendance.loadgen import LoadProfile, run_step, seed_students
+
+
+def _parse_range(value: str) -> list:
+    """``"1-200"`` or ``"3,5,8"`` into a list of ints."""
+    values = []
+    for part in value.split(","):
+        if "-" in part:
+            low, high = part.split("-", 1)
+            values.extend(range(int(low), int(high) + 1))
+        elif part:
+            values.append(int(part))
+    return values
+
+
+class Command(BaseCommand):
+    help = (
+        "Simulate a fleet of ESP32 scanners against a running backend and report "
+        "throughput, latency percentiles and error rates as the device count rises."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default="http://127.0.0.1:8000", help="Backend base URL.")
+        parser.add_argument(
+            "--devices", default="10,50,100",
+            help="Comma-separated device counts; each one is a separate step.",
+        )
+        parser.add_argument("--duration", type=float, default=30.0, help="Seconds per step.")
+        parser.add_argument(
+            "--fingerprints", default="1-100",
+            help="Fingerprint ids the devices scan, e.g. 1-200 or 3,5,8.",
+        )
+        parser.add_argument(
+            "--seed-students", action="store_true",
+            help="Register a LOADGEN-<id> student for every fingerprint id first.",
+        )
+        parser.add_argument("--burst-interval", type=float, default=20.0,
+                            help="Seconds between class-start bursts.")
+        parser.add_argument("--burst-size", type=int, default=8, help="Scans per device per burst.")
+        parser.add_argument("--idle-rate", type=float, default=2.0,
+                            help="Scans per device per minute between bursts.")
+        parser.add_argument("--double-scan-ratio", type=float, default=0.1)
+        parser.add_argument("--offline-ratio", type=float, default=0.05,
+                            help="Chance a burst is buffered offline and replayed at once.")
+        parser.add_argument("--verify-ratio", type=float, default=0.2,
+                            help="Share of scans that call verify before check-in.")
+        parser.add_argument("--timeout", type=float, default=10.0, help="Per-request timeout.")
+        parser.add_argument("--no-retry", action="store_true", help="Don't retry after a 429.")
+        parser.add_argument("--seed", type=int, default=0, help="Random seed.")
+        parser.add_argument("--json", action="store_true", help="Print results as JSON.")
+
+    def handle(self, *args, **options):
+        try:
+            steps = _parse_range(options["devices"])
+            fingerprints = _parse_range(options["fingerprints"])
+        except ValueError:
+            raise CommandError("--devices and --fingerprints take numbers, ranges or lists")
+        if not steps or not fingerprints:
+            raise CommandError("--devices and --fingerprints must not be empty")
+
+        profile = LoadProfile(
+            duration=options["duration"],
+            fingerprints=fingerprints,
+            idle_scans_per_minute=options["idle_rate"],
+            burst_interval=options["burst_interval"],
+            burst_size=options["burst_size"],
+            double_scan_ratio=options["double_scan_ratio"],
+            offline_ratio=options["offline_ratio"],
+            verify_ratio=options["verify_ratio"],
+            timeout=options["timeout"],
+            honor_retry_after=not options["no_retry"],
+        )
+
+        if options["seed_students"]:
+            registered = asyncio.run(seed_students(options["url"], fingerprints, options["timeout"]))
+            self.stderr.write(f"Registered {registered}/{len(fingerprints)} load-test students.")
+
+        results = []
+        for devices in steps:
+            self.stderr.write(f"Running {devices} devices for {profile.duration:.0f}s...")
+            results.append(asyncio.run(run_step(options["url"], devices, profile, options["seed"])))
+
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        self.stdout.write(
+            f"{'devices':>7} {'endpoint':<19} {'req':>7} {'req/s':>7} {'ok/s':>7} "
+            f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'429 %':>6} {'err %':>6} {'replay %':>8}"
+        )
+        for result in results:
+            rows = [("all", result["all"])] + sorted(result["endpoints"].items())
+            for name, row in rows:
+                self.stdout.write(
+                    f"{result['devices']:>7} {name:<19} {row['requests']:>7} "
+                    f"{row['throughput_rps']:>7.1f} {row['ok_rps']:>7.1f} "
+                    f"{row['p50_ms']:>8.1f} {row['p95_ms']:>8.1f} {row['p99_ms']:>8.1f} "
+                    f"{row['throttled_rate'] * 100:>6.1f} {row['error_rate'] * 100:>6.1f} "
+                    f"{row['replayed_rate'] * 100:>8.1f}"
+                )
@@ -0,0 +1,130 @@
+"""
+Per-day present-student bitmap.
+
+Bit ``n`` is set when the student with roster ordinal ``n`` (see
+``users.roster``) has checked in today. ``check_in`` sets bits as it records
+logs, and ``sync`` tails ``attendance_logs`` from the last timestamp seen so
+check-ins handled by other workers are picked up with a small query instead
+of a full scan (over ``attendance_days`` when day documents are stored).
+Absent/present sets are then plain bit operations against the roster bitmap.
+
+Timestamps come from the writing worker's clock and a log commits a little
+after it is stamped, so a log can land behind the newest one already seen.
+Each sync therefore re-reads ``SYNC_MARGIN`` before the watermark; setting a
+bit twice is harmless.
+"""
+import threading
+from datetime import datetime, time, timedelta, timezone
+
+from attendance.days import DAYS_COLLECTION, stores_days
+from backend_project.bitsets import iter_bits, popcount
+from users.roster import get_roster
+
+
+# Clock skew between workers plus commit latency.
+SYNC_MARGIN = timedelta(seconds=60)
+
+
+def today_start() -> datetime:
+    return datetime.combine(datetime.now(timezone.utc).date(), time.min, tzinfo=timezone.utc)
+
+
+class PresenceIndex:
+    def __init__(self, roster):
+        self.roster = roster
+        self._lock = threading.Lock()
+        self._day = None
+        self._bits = 0
+        self._watermark = None
+
+    def _roll_over(self):
+        """Start a fresh bitmap when the UTC day changes. Caller holds the lock."""
+        day = today_start()
+        if self._day != day:
+            self._day = day
+            self._bits = 0
+            self._watermark = day.isoformat()
+
+    def mark_present(self, uid: str) -> bool:
+        """Set the student's bit; True if this worker hadn't seen them today."""
+        bit = 1 << self.roster.ordinal(uid)
+        with self._lock:
+            self._roll_over()
+            newly_present = not self._bits & bit
+            self._bits |= bit
+            return newly_present
+
+    def sync(self, db):
+        """Apply logs written since the last sync (by any worker)."""
+        with self._lock:
+            self._roll_over()
+            watermark = self._watermark
+            seen = datetime.fromisoformat(watermark)
+            if seen.tzinfo is None:
+                seen = seen.replace(tzinfo=timezone.utc)
+            since = max(self._day, seen - SYNC_MARGIN).isoformat()
+
+        # Day documents mean one read per student present instead of one per scan.
+        if stores_days():
+            collection, field = DAYS_COLLECTION, "first_seen"
+        else:
+            collection, field = "attendance_logs", "timestamp"
+        query = (
+            db.collection(collection)
+            .where(field, ">=", since)
+            .order_by(field)
+            .select(["student_id", field])
+        )
+        bits, latest = 0, watermark
+        for doc in query.stream():
+            log = doc.to_dict()
+            if log.get("student_id"):
+                bits |= 1 << self.roster.ordinal(log["student_id"])
+            latest = max(latest, log.get(field) or latest)
+
+        with self._lock:
+            if self._watermark == watermark:
+                self._bits |= bits
+                self._watermark = latest
+
+    def present_bits(self) -> int:
+        with self._lock:
+            self._roll_over()
+            return self._bits
+
+    def summary(self, db) -> dict:
+        """Present/absent ordinals for today, restricted to the current roster."""
+        self.roster.ensure_fresh(db)
+        self.sync(db)
+
+        roster_bits = self.roster.bits()
+        present = self.present_bits() & roster_bits
+        absent = roster_bits & ~present
+        total = popcount(roster_bits)
+        present_count = popcount(present)
+
+        return {
+            "date": self._day.date().isoformat(),
+            "total_students": total,
+            "present_count": present_count,
+            "absent_count": total - present_count,
+            "attendance_percentage": round(present_count / total * 100, 1) if total else 0,
+            "present": [self.roster.uid_at(i) for i in iter_bits(present)],
+            "absent": [self.roster.uid_at(i) for i in iter_bits(absent)],
+        }
+
+
+_presence = None
+_presence_lock = threading.Lock()
+
+
+def get_presence() -> PresenceIndex:
+    global _presence
+
+    if _presence is not None:
+        return _presence
+
+    with _presence_lock:
+        if _presence is None:
+            _presence = PresenceIndex(get_roster())
+    return _presence
@@ -0,0 +1,159 @@
+"""
+Per-student, per-term attendance bitsets.
+
+``attendance_calendar/{uid}_{term}`` holds one bit per school day of the term
+(bit ``n`` = the ``n``-th school day), stored little-endian in the ``bits``
+bytes field. ``check_in`` sets the day's bit on a student's first scan of the
+day, so a term calendar is one small document read and attendance
+percentages are popcounts.
+
+Terms come from ``ATTENDANCE_TERMS`` (``name:start:end`` separated by ``;``);
+dates outside every configured term fall into half-year terms named
+``YYYY-H1`` / ``YYYY-H2``. School days are the weekdays listed in
+``ATTENDANCE_SCHOOL_WEEKDAYS`` (Monday is 0).
+"""
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+
+from django.conf import settings
+from firebase_admin import firestore
+
+from backend_project.bitsets import from_bytes, popcount, to_bytes
+
+
+CALENDAR_COLLECTION = "attendance_calendar"
+
+
+@dataclass(frozen=True)
+class Term:
+    name: str
+    start: date
+    end: date
+
+    def school_days(self) -> list:
+        weekdays = settings.ATTENDANCE_SCHOOL_WEEKDAYS
+        days, day = [], self.start
+        while day <= self.end:
+            if day.weekday() in weekdays:
+                days.append(day)
+            day += timedelta(days=1)
+        return days
+
+    def day_index(self, day: date):
+        """Position of ``day`` among the term's school days, or None if it isn't one."""
+        if not (self.start <= day <= self.end) or day.weekday() not in settings.ATTENDANCE_SCHOOL_WEEKDAYS:
+            return None
+        weekdays = settings.ATTENDANCE_SCHOOL_WEEKDAYS
+        elapsed = (day - self.start).days
+        full_weeks, remainder = divmod(elapsed, 7)
+        index = full_weeks * len(weekdays)
+        for offset in range(remainder):
+            if (self.start + timedelta(days=offset)).weekday() in weekdays:
+                index += 1
+        return index
+
+
+def _configured_terms() -> list:
+    terms = []
+    for spec in filter(None, (part.strip() for part in settings.ATTENDANCE_TERMS.split(";"))):
+        name, start, end = spec.split(":")
+        terms.append(Term(name, date.fromisoformat(start), date.fromisoformat(end)))
+    return terms
+
+
+def term_for(day: date) -> Term:
+    for term in _configured_terms():
+        if term.start <= day <= term.end:
+            return term
+    if day.month <= 6:
+        return Term(f"{day.year}-H1", date(day.year, 1, 1), date(day.year, 6, 30))
+    return Term(f"{day.year}-H2", date(day.year, 7, 1), date(day.year, 12, 31))
+
+
+def term_named(name: str):
+    for term in _configured_terms():
+        if term.name == name:
+            return term
+    try:
+        year, half = name.split("-")
+        if half == "H1":
+            return term_for(date(int(year), 1, 1))
+        if half == "H2":
+            return term_for(date(int(year), 7, 1))
+    except ValueError:
+        pass
+    return None
+
+
+def calendar_ref(db, uid: str, term: Term):
+    return db.collection(CALENDAR_COLLECTION).document(f"{uid}_{term.name}")
+
+
+@firestore.transactional
+def _set_bit_in_transaction(transaction, ref, uid: str, term: Term, index: int):
+    snapshot = ref.get(transaction=transaction)
+    bits = from_bytes(snapshot.to_dict().get("bits")) if snapshot.exists else 0
+    if bits >> index & 1:
+        return
+
+    size = (len(term.school_days()) + 7) // 8
+    update = {
+        "bits": to_bytes(bits | 1 << index, size),
+        "updated_at": datetime.now(timezone.utc).isoformat(),
+    }
+    if not snapshot.exists:
+        update.update(uid=uid, term=term.name, start=term.start.isoformat(), end=term.end.isoformat())
+    transaction.set(ref, update, merge=True)
+
+
+def mark_attended(db, uid: str, moment: datetime):
+    """Set the bit for ``moment``'s school day; no-op on non-school days."""
+    day = moment.astimezone(timezone.utc).date()
+    term = term_for(day)
+    index = term.day_index(day)
+    if index is None:
+        return
+    ref = calendar_ref(db, uid, term)
+    _set_bit_in_transaction(db.transaction(), ref, uid, term, index)
+
+
+def calendar_summary(bits: int, term: Term, today: date) -> dict:
+    """Per-day presence plus monthly and term percentages over days elapsed so far."""
+    days = term.school_days()
+    elapsed = [day for day in days if day <= today]
+
+    months = {}
+    for index, day in enumerate(elapsed):
+        month = months.setdefault(day.strftime("%Y-%m"), {"mask": 0, "school_days": 0})
+        month["mask"] |= 1 << index
+        month["school_days"] += 1
+
+    def percentage(present, total):
+        return round(present / total * 100, 1) if total else 0
+
+    monthly = []
+    for month, info in sorted(months.items()):
+        present = popcount(bits & info["mask"])
+        monthly.append({
+            "month": month,
+            "present": present,
+            "school_days": info["school_days"],
+            "attendance_percentage": percentage(present, info["school_days"]),
+        })
+
+    elapsed_mask = (1 << len(elapsed)) - 1
+    present = popcount(bits & elapsed_mask)
+    return {
+        "term": term.name,
+        "start": term.start.isoformat(),
+        "end": term.end.isoformat(),
+        "school_days": len(days),
+        "school_days_elapsed": len(elapsed),
+        "present_days": present,
+        "attendance_percentage": percentage(present, len(elapsed)),
+        "months": monthly,
+        "days": [
+            {"date": day.isoformat(), "present": bool(bits >> index & 1)}
+            for index, day in enumerate(days)
+        ],
+    }
@@ -1,3 +1,351 @@
-from django.test import TestCase
+import asyncio
+import json
+import random
+import tempfile
+from datetime import date, datetime, timedelta, timezone
+from unittest import mock
 
-# Create your tests here.
+from django.core.exceptions import ImproperlyConfigured
+from django.test import RequestFactory, SimpleTestCase
+from google.api_core.exceptions import ServiceUnavailable
+
+from attendance import archive, days, presence
+from attendance.histogram import DAY_SECONDS, bucket_counts, load
+from attendance.loadgen import LoadProfile, Sample, SimulatedDevice, summarize
+from attendance.management.commands.loadtest_devices import _parse_range
+from attendance.presence import PresenceIndex
+from attendance.terms import calendar_ref, mark_attended, term_for
+from attendance.views import attendance_history, attendance_stats, check_in, today_attendance
+from backend_project import breaker, idempotency
+from backend_project.bitsets import from_bytes, iter_bits
+from firebase_config.testing import use_fake_firestore
+from fingerprint.mapping import register_user_fingerprint
+from users.roster import RosterCache
+
+
+class PresenceSyncTests(SimpleTestCase):
+    def setUp(self):
+        self.db = use_fake_firestore()
+        self.roster = RosterCache(ttl=60)
+        self.presence = PresenceIndex(self.roster)
+        self.now = datetime.now(timezone.utc)
+
+    def log(self, student_id: str, seconds_ago: float):
+        timestamp = (self.now - timedelta(seconds=seconds_ago)).isoformat()
+        self.db.data.setdefault("attendance_logs", {})[f"{student_id}-{seconds_ago}"] = {
+            "student_id": student_id,
+            "timestamp": timestamp,
+        }
+
+    def present(self) -> set:
+        return {self.roster.uid_at(ordinal) for ordinal in iter_bits(self.presence.present_bits())}
+
+    def test_picks_up_logs_from_other_workers(self):
+        self.log("S1", 5)
+        self.presence.sync(self.db)
+        self.assertEqual(self.present(), {"S1"})
+
+    def test_late_commit_behind_the_watermark(self):
+        self.log("S1", 0)
+        self.presence.sync(self.db)
+        # Stamped earlier on another worker's clock, committed after the last sync.
+        self.log("S2", 20)
+        self.presence.sync(self.db)
+        self.assertEqual(self.present(), {"S1", "S2"})
+
+
+class TermCalendarTests(SimpleTestCase):
+    def setUp(self):
+        self.db = use_fake_firestore()
+
+    def test_sets_the_school_day_bit_once(self):
+        monday = datetime(2026, 1, 5, 8, 0, tzinfo=timezone.utc)
+        term = term_for(monday.date())
+        mark_attended(self.db, "S1", monday)
+        mark_attended(self.db, "S1", monday + timedelta(hours=2))
+        doc = self.db.document_data("attendance_calendar", calendar_ref(self.db, "S1", term).id)
+        self.assertEqual(list(iter_bits(from_bytes(doc["bits"]))), [term.day_index(date(2026, 1, 5))])
+
+    def test_weekends_are_ignored(self):
+        mark_attended(self.db, "S1", datetime(2026, 1, 3, 8, 0, tzinfo=timezone.utc))
+        self.assertNotIn("attendance_calendar", self.db.data)
+
+
+class CheckInTests(SimpleTestCase):
+    def setUp(self):
+        self.db = use_fake_firestore()
+        presence._presence = None
+        idempotency._store = None
+        register_user_fingerprint(self.db, {"uid": "S1", "name": "Ann", "role": "student", "fingerprint_id": 5})
+
+    def check_in(self, **payload):
+        request = RequestFactory().post("/attendance/check-in/", json.dumps(payload), content_type="application/json")
+        response = check_in(request)
+        return response.status_code, json.loads(response.content)
+
+    def test_calendar_failure_does_not_fail_the_check_in(self):
+        with mock.patch("attendance.views.mark_attended", side_effect=RuntimeError("contention")):
+            with self.assertLogs("attendance.views", "ERROR"):
+                status, body = self.check_in(fingerprint_id=5, device_id="ESP32-001")
+        self.assertEqual(status, 200)
+        self.assertEqual(body["student_id"], "S1")
+        self.assertEqual(len(self.db.data["attendance_logs"]), 1)
+
+    def test_unknown_fingerprint(self):
+        status, _ = self.check_in(fingerprint_id=6, device_id="ESP32-001")
+        self.assertEqual(status, 404)
+
+
+class BucketCountsTests(SimpleTestCase):
+    def test_buckets_per_device(self):
+        seconds, devices, names = load([
+            ("2026-01-05T08:01:00+00:00", "A", "S1"),
+            ("2026-01-05T08:14:00+00:00", "B", "S2"),
+            ("2026-01-05T08:20:00+00:00", "A", "S3"),
+            ("2026-01-05T09:30:00+00:00", None, "S4"),
+            ("not a timestamp", "A", "S5"),
+        ])
+        self.assertEqual(names, ["A", "B", "unknown"])
+        origin = datetime(2026, 1, 5, 8, 0, tzinfo=timezone.utc).timestamp()
+        counts = bucket_counts(seconds, devices, len(names), origin, 900, 4, fold=False)
+        self.assertEqual(counts, [[1, 1, 0, 0], [1, 0, 0, 0], [0, 0, 0, 0]])
+
+    def test_fold_sums_times_of_day(self):
+        seconds, devices, names = load([
+            ("2026-01-05T08:05:00+00:00", "A", "S1"),
+            ("2026-01-06T08:10:00+00:00", "A", "S1"),
+            ("2026-01-06T23:59:59+00:00", "A", "S2"),
+        ])
+        counts = bucket_counts(seconds, devices, len(names), 0.0, 3600, DAY_SECONDS // 3600, fold=True)
+        self.assertEqual((counts[0][8], counts[0][23], sum(counts[0])), (2, 1, 3))
+
+
+class ArchiveTests(SimpleTestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        overrides = self.settings(ATTENDANCE_ARCHIVE_DIR=self.dir.name)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        archive._manifest_cache.update(mtime=None, manifest=None)
+
+        self.db = use_fake_firestore()
+        self.old = datetime.now(timezone.utc).replace(hour=9, minute=0, second=0, microsecond=0) - timedelta(days=100)
+        self.add_log("a", "S1", self.old)
+        self.add_log("b", "S2", self.old + timedelta(minutes=5))
+        self.add_log("c", "S1", self.old + timedelta(days=1))
+        self.add_log("recent", "S1", datetime.now(timezone.utc))
+
+    def add_log(self, log_id: str, student_id: str, moment: datetime):
+        self.db.data.setdefault("attendance_logs", {})[log_id] = {
+            "student_id": student_id,
+            "timestamp": moment.isoformat(),
+            "status": "Present",
+        }
+
+    def test_moves_old_logs_into_day_segments(self):
+        result = archive.archive_logs(self.db, older_than_days=90)
+        self.assertEqual(result["archived"], 3)
+        days_archived = [self.old.date().isoformat(), (self.old + timedelta(days=1)).date().isoformat()]
+        self.assertEqual(result["days"], days_archived)
+        self.assertEqual(set(self.db.data["attendance_logs"]), {"recent"})
+
+        manifest = archive.load_manifest()
+        self.assertEqual(manifest["archived_before"], result["cutoff"])
+        self.assertEqual(manifest["segments"][self.old.date().isoformat()]["count"], 2)
+        self.assertTrue(archive.reaches_archive(None))
+        self.assertFalse(archive.reaches_archive(datetime.now(timezone.utc).isoformat()))
+
+    def test_archived_before_never_moves_back(self):
+        cutoff = archive.archive_logs(self.db, older_than_days=90)["cutoff"]
+        archive.archive_logs(self.db, older_than_days=200)
+        self.assertEqual(archive.load_manifest()["archived_before"], cutoff)
+
+    def test_segments_merge_by_log_id(self):
+        archive.archive_logs(self.db, older_than_days=90)
+        # The same log again (an interrupted run) plus a new one for that day.
+        self.add_log("a", "S1", self.old)
+        self.add_log("d", "S3", self.old + timedelta(hours=1))
+        archive.archive_logs(self.db, older_than_days=90)
+
+        ids = [log["id"] for log in archive.read_archived_logs()]
+        self.assertEqual(ids, ["a", "b", "d", "c"])
+        self.assertEqual(archive.load_manifest()["segments"][self.old.date().isoformat()]["count"], 3)
+
+    def test_deletes_only_after_segments_are_written(self):
+        def commit_fails(batch):
+            # By the time Firestore is asked to delete, the logs are on disk.
+            self.assertEqual(len(list(archive.read_archived_logs())), 3)
+            raise ServiceUnavailable("down")
+
+        with mock.patch("firebase_config.testing.FakeBatch.commit", commit_fails):
+            with self.assertRaises(ServiceUnavailable):
+                archive.archive_logs(self.db, older_than_days=90)
+        self.assertEqual(len(self.db.data["attendance_logs"]), 4)
+
+        archive.archive_logs(self.db, older_than_days=90)
+        self.assertEqual(len(list(archive.read_archived_logs())), 3)
+
+    def test_dry_run_changes_nothing(self):
+        self.assertEqual(archive.archive_logs(self.db, older_than_days=90, dry_run=True)["archived"], 3)
+        self.assertEqual(len(self.db.data["attendance_logs"]), 4)
+        self.assertFalse(archive.reaches_archive(None))
+
+    def test_read_filters_by_range_and_student(self):
+        archive.archive_logs(self.db, older_than_days=90)
+        start = (self.old + timedelta(minutes=1)).isoformat()
+        self.assertEqual([log["id"] for log in archive.read_archived_logs(start=start)], ["b", "c"])
+        end = (self.old + timedelta(hours=1)).isoformat()
+        self.assertEqual([log["id"] for log in archive.read_archived_logs(end=end)], ["a", "b"])
+        self.assertEqual([log["id"] for log in archive.read_archived_logs(student_id="S1")], ["a", "c"])
+        self.assertEqual([log["id"] for log in archive.read_archived_logs(newest_first=True)], ["c", "b", "a"])
+
+    def test_history_reads_through_newest_first(self):
+        archive.archive_logs(self.db, older_than_days=90)
+        request = RequestFactory().get("/attendance/history/", {"limit": 3})
+        body = json.loads(attendance_history(request).content)
+        self.assertEqual([log["id"] for log in body["logs"]], ["recent", "c", "b"])
+        self.assertEqual(body["archived_count"], 2)
+
+        request = RequestFactory().get("/attendance/history/", {"student_id": "S1"})
+        body = json.loads(attendance_history(request).content)
+        self.assertEqual([log["id"] for log in body["logs"]], ["recent", "c", "a"])
+
+
+class DayDocumentTests(SimpleTestCase):
+    def setUp(self):
+        self.db = use_fake_firestore()
+        self.day = date(2026, 1, 5)
+
+    def scan(self, student_id: str, hour: int, device_id: str = "ESP32-001") -> bool:
+        moment = datetime(2026, 1, 5, hour, 0, tzinfo=timezone.utc)
+        log = {"student_id": student_id, "timestamp": moment.isoformat(), "status": "Present",
+               "device_id": device_id, "fingerprint_id": 5}
+        return days.record_scan(self.db, log, moment)
+
+    def test_first_scan_creates_later_scans_increment(self):
+        self.assertTrue(self.scan("S1", 8))
+        self.assertFalse(self.scan("S1", 9, device_id="ESP32-002"))
+        self.assertFalse(self.scan("S1", 10, device_id="ESP32-002"))
+
+        doc = self.db.document_data("attendance_days", "2026-01-05_S1")
+        self.assertEqual(doc["scan_count"], 3)
+        self.assertEqual((doc["first_seen"][11:16], doc["last_seen"][11:16]), ("08:00", "10:00"))
+        self.assertEqual((doc["first_device_id"], doc["last_device_id"]), ("ESP32-001", "ESP32-002"))
+
+    def test_count_and_records_per_day(self):
+        self.scan("S1", 8)
+        self.scan("S2", 9)
+        self.scan("S1", 11)
+        self.assertEqual(days.count_present(self.db, self.day), 2)
+        self.assertEqual(days.count_present(self.db, date(2026, 1, 6)), 0)
+
+        logs = [days.as_log(record) for record in days.day_records(self.db, self.day)]
+        self.assertEqual([log["student_id"] for log in logs], ["S1", "S2"])
+        self.assertEqual((logs[0]["timestamp"][11:16], logs[0]["last_seen"][11:16], logs[0]["scan_count"]),
+                         ("08:00", "11:00", 2))
+
+    def test_unknown_storage_mode(self):
+        with self.settings(ATTENDANCE_STORAGE_MODE="rows"):
+            with self.assertRaises(ImproperlyConfigured):
+                days.stores_days()
+
+
+class DaysStorageModeTests(SimpleTestCase):
+    def setUp(self):
+        overrides = self.settings(ATTENDANCE_STORAGE_MODE="days")
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.db = use_fake_firestore()
+        presence._presence = None
+        idempotency._store = None
+        breaker._breaker = None
+        register_user_fingerprint(self.db, {"uid": "S1", "name": "Ann", "role": "student", "fingerprint_id": 5})
+        register_user_fingerprint(self.db, {"uid": "S2", "name": "Bo", "role": "student", "fingerprint_id": 6})
+
+    def check_in(self, fingerprint_id: int):
+        body = json.dumps({"fingerprint_id": fingerprint_id, "device_id": "ESP32-001"})
+        response = check_in(RequestFactory().post("/attendance/check-in/", body, content_type="application/json"))
+        self.assertEqual(response.status_code, 200)
+
+    def get(self, view, path: str):
+        return json.loads(view(RequestFactory().get(path)).content)
+
+    def test_check_ins_write_day_documents_only(self):
+        self.check_in(5)
+        self.check_in(5)
+        self.assertNotIn("attendance_logs", self.db.data)
+        (doc,) = self.db.data["attendance_days"].values()
+        self.assertEqual((doc["student_id"], doc["scan_count"]), ("S1", 2))
+
+    def test_calendar_bit_follows_the_day_document(self):
+        # Another worker already recorded S1 today; this worker's presence index hasn't seen it.
+        today = datetime.now(timezone.utc)
+        days.day_ref(self.db, today.date(), "S1").set({"date": today.date().isoformat(), "student_id": "S1",
+                                                        "scan_count": 1})
+        with mock.patch("attendance.views.mark_attended") as mark_attended:
+            self.check_in(5)
+            self.check_in(6)
+            self.check_in(6)
+        self.assertEqual([call.args[1] for call in mark_attended.call_args_list], ["S2"])
+
+    def test_today_and_stats_read_day_documents(self):
+        self.check_in(5)
+        self.check_in(6)
+        self.check_in(5)
+
+        today = self.get(today_attendance, "/attendance/today/")
+        self.assertEqual((today["count"], today["unique_students"]), (3, 2))
+        self.assertEqual([log["student_id"] for log in today["logs"]], ["S1", "S2"])
+        self.assertEqual(today["logs"][0]["scan_count"], 2)
+
+        stats = self.get(attendance_stats, "/attendance/stats/")["stats"]
+        self.assertEqual((stats["total_students"], stats["present_today"], stats["total_records"]), (2, 2, 2))
+        self.assertEqual(stats["attendance_percentage"], 100.0)
+
+
+class LoadgenTests(SimpleTestCase):
+    def test_summarize_rates_and_percentiles(self):
+        samples = [Sample("check_in", 200, latency / 1000) for latency in range(1, 97)]
+        samples += [
+            Sample("check_in", 200, 0.5, replayed=True),
+            Sample("check_in", 429, 0.001),
+            Sample("verify_fingerprint", 404, 0.002),
+            Sample("verify_fingerprint", 0, 10.0),
+        ]
+        summary = summarize(samples, devices=4, elapsed=10.0)
+        overall = summary["all"]
+        self.assertEqual((overall["requests"], overall["throughput_rps"], overall["ok_rps"]), (100, 10.0, 9.7))
+        self.assertEqual((overall["p50_ms"], overall["p95_ms"], overall["max_ms"]), (49.0, 94.0, 10000.0))
+        self.assertEqual((overall["not_found_rate"], overall["throttled_rate"], overall["error_rate"]),
+                         (0.01, 0.01, 0.01))
+        self.assertEqual(overall["replayed_rate"], 0.01)
+        self.assertEqual(summary["endpoints"]["verify_fingerprint"]["error_rate"], 0.5)
+        self.assertEqual(summarize([], devices=1, elapsed=0.0)["all"]["p95_ms"], 0.0)
+
+    def test_parse_range(self):
+        self.assertEqual(_parse_range("1-3,7"), [1, 2, 3, 7])
+        self.assertEqual(_parse_range("5,"), [5])
+        self.assertEqual(_parse_range(""), [])
+        with self.assertRaises(ValueError):
+            _parse_range("1-x")
+
+    def call(self, responses, **profile):
+        samples = []
+        device = SimulatedDevice("loadgen-0000", "http://backend", LoadProfile(**profile), samples, random.Random(0))
+        with mock.patch("attendance.loadgen.http_request", mock.AsyncMock(side_effect=responses)) as request:
+            status = asyncio.run(device._call("check_in", "POST", "/attendance/check-in/", {"seq": 1}))
+        return status, samples, request
+
+    def test_timed_out_check_in_is_resent_and_replayed(self):
+        status, samples, request = self.call([asyncio.TimeoutError(), (200, {"idempotent-replayed": "true"}, b"")])
+        self.assertEqual(status, 200)
+        self.assertEqual([(s.status, s.replayed) for s in samples], [(0, False), (200, True)])
+        self.assertEqual(request.call_args_list[0], request.call_args_list[1])
+
+    def test_retry_after_429_only_when_honored(self):
+        throttled = (429, {"retry-after": "0"}, b"")
+        status, samples, _ = self.call([throttled, (200, {}, b"")])
+        self.assertEqual((status, len(samples)), (200, 2))
+        status, samples, _ = self.call([throttled], honor_retry_after=False)
+        self.assertEqual((status, len(samples)), (429, 1))
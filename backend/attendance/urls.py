@@ -6,4 +6,6 @@ urlpatterns = [
     path("history/", views.attendance_history, name="attendance_history"),
     path("stats/", views.attendance_stats, name="attendance_stats"),
     path("today/", views.today_attendance, name="today_attendance"),
+    path("export/", views.export_attendance, name="export_attendance"),
+    path("histogram/", views.attendance_histogram, name="attendance_histogram"),
 ]
@@ -1,53 +1,60 @@
-import json
+import csv
+import logging
 from datetime import datetime, timezone
 
-from django.http import JsonResponse
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 
+from attendance.archive import read_archived_logs, reaches_archive
+from attendance.days import DAYS_COLLECTION, as_log, count_present, day_records, record_scan, stores_days, stores_logs
+from attendance.histogram import HistogramError, build as build_histogram
+from attendance.logs import EXPORT_FIELDS, iter_logs_in_range, logs_since, parse_bound, range_query
+from attendance.presence import get_presence
+from attendance.terms import mark_attended
+from backend_project.admission import admission_controlled
+from backend_project.breaker import stale_on_failure
+from backend_project.idempotency import idempotent
+from backend_project.wire import CHECK_IN, WireFormatError, accepts, message_for, respond
+from devices.fleet import InvalidDeviceIdError, get_fleet
 from firebase_config.firebase import FirebaseCredentialsError, get_firestore_db
+from fingerprint.mapping import find_user_by_fingerprint
+from users.students import student_records
 
 
-def _json_error(message, status=400):
-    return JsonResponse({"status": "error", "message": message}, status=status)
+logger = logging.getLogger(__name__)
 
 
-def _find_user_by_fingerprint(db, fingerprint_id: int):
-    q = db.collection("users").where("fingerprint_id", "==", fingerprint_id).limit(1)
-    docs = list(q.stream())
-    if not docs:
-        return None
-    return docs[0].to_dict()
+def _json_error(message, status=400):
+    return JsonResponse({"status": "error", "message": message}, status=status)
 
 
 @csrf_exempt
+@accepts(CHECK_IN)
+@idempotent
+@admission_controlled
 def check_in(request):
     if request.method != "POST":
         return _json_error("Method not allowed", status=405)
 
     try:
-        payload = json.loads(request.body.decode("utf-8") or "{}")
-    except json.JSONDecodeError:
-        return _json_error("Invalid JSON")
+        message = message_for(request)
+    except WireFormatError as e:
+        return respond(request, CHECK_IN, {"status": "error", "message": str(e)}, status=400)
 
-    fingerprint_id = payload.get("fingerprint_id") or payload.get("fingerprintId")
-    device_id = payload.get("device_id") or payload.get("deviceId") or "unknown"
-
-    if fingerprint_id is None:
-        return _json_error("fingerprint_id is required")
-
-    try:
-        fingerprint_id = int(fingerprint_id)
-    except (TypeError, ValueError):
-        return _json_error("fingerprint_id must be an integer")
+    fingerprint_id = message["fingerprint_id"]
+    device_id = message.get("device_id") or "unknown"
 
     try:
         db = get_firestore_db()
     except FirebaseCredentialsError as e:
-        return JsonResponse({"status": "error", "message": str(e)}, status=500)
+        return respond(request, CHECK_IN, {"status": "error", "message": str(e)}, status=500)
 
-    user = _find_user_by_fingerprint(db, fingerprint_id)
+    user = find_user_by_fingerprint(db, fingerprint_id)
     if not user:
-        return JsonResponse(
+        return respond(
+            request,
+            CHECK_IN,
             {
                 "status": "error",
                 "message": "Fingerprint not recognized",
@@ -55,17 +62,38 @@ def check_in(request):
             status=404,
         )
 
+    now = datetime.now(timezone.utc)
     log = {
         "student_id": user.get("uid"),
-        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "timestamp": now.isoformat(),
         "status": "Present",
         "device_id": device_id,
         "fingerprint_id": fingerprint_id,
     }
 
-    db.collection("attendance_logs").add(log)
-
-    return JsonResponse(
+    if stores_logs():
+        db.collection("attendance_logs").add(log)
+    first_scan_today = get_presence().mark_present(log["student_id"])
+    if stores_days():
+        # The day document knows about every worker's scans, not just ours.
+        first_scan_today = record_scan(db, log, now)
+    if first_scan_today:
+        # Set the term calendar bit once per student per day. The scan is
+        # already recorded, so a failure here must not fail the check-in:
+        # the device would retry and log the scan twice.
+        try:
+            mark_attended(db, log["student_id"], now)
+        except Exception:
+            logger.exception("Could not set the term calendar bit for %s", log["student_id"])
+    if device_id != "unknown":
+        try:
+            get_fleet().touch(device_id)
+        except InvalidDeviceIdError:
+            pass  # The scan is recorded; the device just isn't tracked in the fleet.
+
+    return respond(
+        request,
+        CHECK_IN,
         {
             "status": "success",
             "message": "Attendance recorded",
@@ -89,14 +117,14 @@ def attendance_history(request):
     # Get query parameters
     student_id = request.GET.get("student_id")
     limit = int(request.GET.get("limit", 100))
+    try:
+        start = parse_bound(request.GET.get("start"))
+        end = parse_bound(request.GET.get("end"), end=True)
+    except ValueError as e:
+        return _json_error(str(e))
     
     # Build query
-    query = db.collection("attendance_logs").order_by("timestamp", direction="DESCENDING")
-    
-    if student_id:
-        query = query.where("student_id", "==", student_id)
-    
-    query = query.limit(limit)
+    query = range_query(db, start, end, student_id, direction="DESCENDING").limit(limit)
     
     # Fetch records
     logs = []
@@ -105,13 +133,102 @@ def attendance_history(request):
         log_data['id'] = doc.id
         logs.append(log_data)
 
+    # Archived logs are all older than the hot collection, so when Firestore
+    # runs out before the limit the rest comes from the archive, newest first.
+    archived = 0
+    if len(logs) < limit and reaches_archive(start):
+        for log_data in read_archived_logs(start, end, student_id, newest_first=True):
+            logs.append(log_data)
+            archived += 1
+            if len(logs) >= limit:
+                break
+
     return JsonResponse({
         "status": "success",
         "logs": logs,
-        "count": len(logs)
+        "count": len(logs),
+        "archived_count": archived,
     })
 
 
+class _Echo:
+    """File-like object for csv.writer that hands back each row instead of buffering."""
+
+    def write(self, value):
+        return value
+
+
+@csrf_exempt
+def export_attendance(request):
+    """Stream attendance logs in a date range as CSV, reading through to the archive"""
+    if request.method != "GET":
+        return _json_error("Method not allowed", status=405)
+
+    try:
+        db = get_firestore_db()
+    except FirebaseCredentialsError as e:
+        return JsonResponse({"status": "error", "message": str(e)}, status=500)
+
+    student_id = request.GET.get("student_id")
+    try:
+        start = parse_bound(request.GET.get("start"))
+        end = parse_bound(request.GET.get("end"), end=True)
+    except ValueError as e:
+        return _json_error(str(e))
+
+    writer = csv.writer(_Echo())
+
+    def rows():
+        yield writer.writerow(EXPORT_FIELDS)
+        for log_data in iter_logs_in_range(db, start, end, student_id):
+            yield writer.writerow([log_data.get(field, "") for field in EXPORT_FIELDS])
+
+    response = StreamingHttpResponse(rows(), content_type="text/csv")
+    response["Content-Disposition"] = 'attachment; filename="attendance.csv"'
+    return response
+
+
+@csrf_exempt
+def attendance_histogram(request):
+    """Check-in counts per time bucket and device over a date range"""
+    if request.method != "GET":
+        return _json_error("Method not allowed", status=405)
+
+    try:
+        db = get_firestore_db()
+    except FirebaseCredentialsError as e:
+        return JsonResponse({"status": "error", "message": str(e)}, status=500)
+
+    now = datetime.now(timezone.utc)
+    try:
+        start = parse_bound(request.GET.get("start")) or datetime(
+            now.year, now.month, now.day, tzinfo=timezone.utc
+        ).isoformat()
+        end = parse_bound(request.GET.get("end"), end=True) or now.isoformat()
+    except ValueError as e:
+        return _json_error(str(e))
+    try:
+        bucket_minutes = int(request.GET.get("bucket_minutes", 60))
+    except ValueError:
+        return _json_error("bucket_minutes must be an integer")
+
+    kind = request.GET.get("kind") or ("scans" if stores_logs() else "arrivals")
+    try:
+        histogram = build_histogram(
+            db,
+            start,
+            end,
+            kind=kind,
+            bucket_minutes=bucket_minutes,
+            fold=request.GET.get("fold", "none"),
+            max_buckets=settings.ATTENDANCE_HISTOGRAM_MAX_BUCKETS,
+        )
+    except HistogramError as e:
+        return _json_error(str(e))
+
+    return JsonResponse({"status": "success", **histogram})
+
+
 @csrf_exempt
 def today_attendance(request):
     """Get today's attendance records"""
@@ -126,20 +243,21 @@ def today_attendance(request):
     # Get today's start time (midnight UTC)
     from datetime import datetime, timezone, time
     today_start = datetime.combine(datetime.now(timezone.utc).date(), time.min, tzinfo=timezone.utc)
-    
-    # Query attendance logs from today
-    query = db.collection("attendance_logs").where(
-        "timestamp", ">=", today_start.isoformat()
-    ).order_by("timestamp", direction="DESCENDING")
-    
-    logs = []
-    student_ids = set()
-    
-    for doc in query.stream():
-        log_data = doc.to_dict()
-        log_data['id'] = doc.id
-        logs.append(log_data)
-        student_ids.add(log_data.get("student_id"))
+
+    if not stores_logs():
+        # One document per student present; each stands in for their first scan.
+        logs = [as_log(record) for record in day_records(db, today_start.date())]
+        return JsonResponse({
+            "status": "success",
+            "logs": logs,
+            "count": sum(log["scan_count"] or 0 for log in logs),
+            "unique_students": len(logs),
+            "date": today_start.date().isoformat()
+        })
+
+    # Attendance logs from today, newest first
+    logs = logs_since(db, today_start.isoformat())
+    student_ids = set(log.get("student_id") for log in logs)
 
     return JsonResponse({
         "status": "success",
@@ -151,6 +269,7 @@ def today_attendance(request):
 
 
 @csrf_exempt
+@stale_on_failure
 def attendance_stats(request):
     """Get attendance statistics"""
     if request.method != "GET":
@@ -162,26 +281,24 @@ def attendance_stats(request):
         return JsonResponse({"status": "error", "message": str(e)}, status=500)
 
     # Get total students
-    students_query = db.collection("users").where("role", "==", "student")
-    total_students = len(list(students_query.stream()))
+    total_students = len(student_records(db))
 
     # Get today's attendance
     from datetime import datetime, timezone, time
     today_start = datetime.combine(datetime.now(timezone.utc).date(), time.min, tzinfo=timezone.utc)
     
-    today_query = db.collection("attendance_logs").where(
-        "timestamp", ">=", today_start.isoformat()
-    )
-    
-    today_logs = list(today_query.stream())
-    today_count = len(set(doc.to_dict().get("student_id") for doc in today_logs))
+    if stores_days():
+        today_count = count_present(db, today_start.date())
+    else:
+        today_logs = logs_since(db, today_start.isoformat())
+        today_count = len(set(log.get("student_id") for log in today_logs))
     
     # Calculate attendance percentage
     attendance_percentage = (today_count / total_students * 100) if total_students > 0 else 0
 
     # Get total attendance records
-    all_logs = db.collection("attendance_logs").limit(1000).stream()
-    total_records = len(list(all_logs))
+    records = db.collection("attendance_logs" if stores_logs() else DAYS_COLLECTION)
+    total_records = records.limit(1000).count().get()[0][0].value
 
     return JsonResponse({
         "status": "success",
@@ -0,0 +1,226 @@
+"""
+Admission control for device endpoints.
+
+When a lecture ends every scanner in the building posts at once. Instead of
+letting those bursts occupy every worker while Firestore catches up, each
+request must take a token from its device's bucket and from a global bucket.
+A request that finds no token may wait briefly in a bounded queue; once the
+queue is full (or the wait would be too long) it is rejected immediately with
+``429`` and a ``Retry-After`` hint the ESP32 firmware can honor.
+"""
+import json
+import math
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from django.conf import settings
+
+from backend_project.wire import peek, reply
+
+
+class TokenBucket:
+    """Classic token bucket refilled continuously at ``rate`` tokens/second."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        if now > self.updated:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """Seconds until one token is available (0 when one is available now)."""
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        if self.rate <= 0:
+            return math.inf
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+
+class AdmissionController:
+    """Per-device and global token buckets in front of a bounded wait queue.
+
+    Not shared between worker processes: the configured rates are per worker.
+    """
+
+    def __init__(
+        self,
+        device_rate: float,
+        device_burst: float,
+        global_rate: float,
+        global_burst: float,
+        max_queue: int,
+        max_wait: float,
+        max_devices: int = 4096,
+    ):
+        self.device_rate = device_rate
+        self.device_burst = device_burst
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.max_devices = max_devices
+
+        self._cond = threading.Condition()
+        self._global = TokenBucket(global_rate, global_burst)
+        # Least recently seen devices are evicted first; an evicted device
+        # simply starts again with a full bucket.
+        self._devices = OrderedDict()
+
+        self.waiting = 0
+        self.peak_waiting = 0
+        self.admitted = 0
+        self.admitted_after_wait = 0
+        self.rejected = 0
+        self.rejected_queue_full = 0
+
+    def _bucket_for(self, device_id: str) -> TokenBucket:
+        bucket = self._devices.get(device_id)
+        if bucket is None:
+            bucket = TokenBucket(self.device_rate, self.device_burst)
+            self._devices[device_id] = bucket
+            if len(self._devices) > self.max_devices:
+                self._devices.popitem(last=False)
+        else:
+            self._devices.move_to_end(device_id)
+        return bucket
+
+    def admit(self, device_id: str):
+        """Block for at most ``max_wait`` seconds waiting for tokens.
+
+        Returns ``(True, 0.0)`` when admitted, ``(False, retry_after)`` otherwise.
+        """
+        deadline = time.monotonic() + self.max_wait
+        queued = False
+
+        with self._cond:
+            try:
+                while True:
+                    now = time.monotonic()
+                    bucket = self._bucket_for(device_id)
+                    wait = max(bucket.wait_time(now), self._global.wait_time(now))
+
+                    if wait == 0:
+                        bucket.take()
+                        self._global.take()
+                        self.admitted += 1
+                        if queued:
+                            self.admitted_after_wait += 1
+                        return True, 0.0
+
+                    if now + wait > deadline:
+                        self.rejected += 1
+                        return False, wait
+
+                    if not queued:
+                        if self.waiting >= self.max_queue:
+                            self.rejected += 1
+                            self.rejected_queue_full += 1
+                            return False, wait
+                        queued = True
+                        self.waiting += 1
+                        self.peak_waiting = max(self.peak_waiting, self.waiting)
+
+                    self._cond.wait(wait)
+            finally:
+                if queued:
+                    self.waiting -= 1
+
+    def metrics(self) -> dict:
+        with self._cond:
+            self._global.wait_time(time.monotonic())
+            return {
+                "queue_depth": self.waiting,
+                "queue_capacity": self.max_queue,
+                "peak_queue_depth": self.peak_waiting,
+                "global_tokens_available": round(self._global.tokens, 2),
+                "tracked_devices": len(self._devices),
+                "admitted": self.admitted,
+                "admitted_after_wait": self.admitted_after_wait,
+                "rejected": self.rejected,
+                "rejected_queue_full": self.rejected_queue_full,
+            }
+
+
+_controller = None
+_controller_lock = threading.Lock()
+
+
+def get_admission_controller() -> AdmissionController:
+    """Singleton controller configured from ``settings.ADMISSION_*``."""
+    global _controller
+
+    if _controller is not None:
+        return _controller
+
+    with _controller_lock:
+        if _controller is None:
+            _controller = AdmissionController(
+                device_rate=settings.ADMISSION_DEVICE_RATE,
+                device_burst=settings.ADMISSION_DEVICE_BURST,
+                global_rate=settings.ADMISSION_GLOBAL_RATE,
+                global_burst=settings.ADMISSION_GLOBAL_BURST,
+                max_queue=settings.ADMISSION_MAX_QUEUE,
+                max_wait=settings.ADMISSION_MAX_WAIT,
+            )
+    return _controller
+
+
+def device_id_for(request) -> str:
+    """Identify the calling device: ``X-Device-ID`` header, message body, or client IP."""
+    device_id = request.headers.get("X-Device-ID")
+    if device_id:
+        return device_id
+
+    message = peek(request)
+    if message is not None:
+        return message.get("device_id") or request.META.get("REMOTE_ADDR") or "unknown"
+
+    if request.method == "POST" and request.content_type == "application/json":
+        try:
+            payload = json.loads(request.body.decode("utf-8") or "{}")
+        except (UnicodeDecodeError, json.JSONDecodeError):
+            payload = None
+        if isinstance(payload, dict):
+            device_id = payload.get("device_id") or payload.get("deviceId")
+            if device_id:
+                return str(device_id)
+
+    return request.META.get("REMOTE_ADDR") or "unknown"
+
+
+def admission_controlled(view):
+    """Reject a device request with ``429`` when it can't be admitted in time."""
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not settings.ADMISSION_ENABLED:
+            return view(request, *args, **kwargs)
+
+        admitted, retry_after = get_admission_controller().admit(device_id_for(request))
+        if not admitted:
+            retry_after = max(1, math.ceil(min(retry_after, 3600)))
+            # Scanners using the binary format get a binary reply (result code 4).
+            response = reply(
+                request,
+                {
+                    "status": "error",
+                    "message": "Too many requests, retry later",
+                    "retry_after": retry_after,
+                },
+                status=429,
+            )
+            response["Retry-After"] = str(retry_after)
+            return response
+
+        return view(request, *args, **kwargs)
+
+    return wrapper
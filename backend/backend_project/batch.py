@@ -0,0 +1,126 @@
+"""
+Batched GET sub-requests with shared reads.
+
+``POST /dashboard/batch/`` runs several GET API calls in one round trip. Each
+sub-request is dispatched straight to its view through the URL resolver, so
+it goes through the view's own decorators (the Firestore breaker included)
+but not through the middleware stack a second time.
+
+All sub-requests of a batch run inside ``shared_reads()``. Read helpers that
+several dashboard views share (the student list, today's logs, a day's
+attendance documents) go through ``memoized``, so each of those queries runs
+at most once per batch; outside a batch ``memoized`` just calls through. The
+memo lives in a contextvar: it follows a sub-request into the breaker's
+worker thread and is dropped with the batch. Sub-requests run one after
+another, so the memo needs no lock; memoized results are shared and must be
+treated as read-only.
+"""
+import contextvars
+import json
+import traceback
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+from django.http import HttpRequest, QueryDict
+from django.urls import Resolver404, resolve
+
+
+_reads = contextvars.ContextVar("batch_shared_reads", default=None)
+
+
+@contextmanager
+def shared_reads():
+    token = _reads.set({})
+    try:
+        yield
+    finally:
+        _reads.reset(token)
+
+
+def active() -> bool:
+    """True inside ``shared_reads()``."""
+    return _reads.get() is not None
+
+
+def memoized(key: tuple, load):
+    """``load()``, run at most once per ``key`` within the current batch."""
+    reads = _reads.get()
+    if reads is None:
+        return load()
+    if key not in reads:
+        reads[key] = load()
+    return reads[key]
+
+
+class BatchError(ValueError):
+    """Raised for a batch body that can't be dispatched."""
+
+
+def parse(body: bytes, max_requests: int) -> list:
+    """``[(id, path), ...]`` from ``{"requests": [{"id": ..., "path": ...}, ...]}``."""
+    try:
+        payload = json.loads(body.decode("utf-8") or "{}")
+    except (UnicodeDecodeError, json.JSONDecodeError):
+        raise BatchError("Invalid JSON")
+
+    entries = payload.get("requests") if isinstance(payload, dict) else None
+    if not isinstance(entries, list) or not entries:
+        raise BatchError("requests must be a non-empty list")
+    if len(entries) > max_requests:
+        raise BatchError(f"At most {max_requests} requests per batch")
+
+    parsed, seen = [], set()
+    for entry in entries:
+        if not isinstance(entry, dict) or not entry.get("id") or not entry.get("path"):
+            raise BatchError("Each request needs an id and a path")
+        request_id, path = str(entry["id"]), str(entry["path"])
+        if request_id in seen:
+            raise BatchError(f"Duplicate request id {request_id}")
+        if not path.startswith("/"):
+            raise BatchError(f"{request_id}: path must start with /")
+        seen.add(request_id)
+        parsed.append((request_id, path))
+    return parsed
+
+
+def _sub_request(request, path: str) -> HttpRequest:
+    url = urlsplit(path)
+    sub = HttpRequest()
+    sub.method = "GET"
+    sub.path = sub.path_info = url.path
+    sub.GET = QueryDict(url.query)
+    sub.META = dict(
+        request.META,
+        REQUEST_METHOD="GET",
+        PATH_INFO=url.path,
+        QUERY_STRING=url.query,
+        CONTENT_LENGTH="0",
+    )
+    sub.META.pop("CONTENT_TYPE", None)
+    return sub
+
+
+def dispatch(request, path: str) -> dict:
+    """Run one GET sub-request; ``{"status": http status, "body": JSON body}``."""
+    sub = _sub_request(request, path)
+    try:
+        match = resolve(sub.path_info)
+    except Resolver404:
+        return {"status": 404, "body": {"status": "error", "message": f"No endpoint at {sub.path}"}}
+    sub.resolver_match = match
+
+    try:
+        response = match.func(sub, *match.args, **match.kwargs)
+    except Exception as e:
+        # Same shape as JSONErrorMiddleware, which sub-requests don't pass through.
+        error_message = str(e) if str(e) else type(e).__name__
+        print(f"API Error: {error_message}")
+        traceback.print_exc()
+        return {"status": 500, "body": {"status": "error", "message": error_message}}
+
+    if response.get("Content-Type") != "application/json":
+        return {
+            "status": 400,
+            "body": {"status": "error", "message": f"{sub.path} doesn't return JSON and can't be batched"},
+        }
+    return {"status": response.status_code, "body": json.loads(response.content)}
@@ -0,0 +1,40 @@
+"""
+Helpers for bitsets stored as Python ints.
+
+Python ints are arbitrary precision and their ``&``, ``|`` and ``~`` run in C
+over 30-bit digits, so a bitset over a few thousand ordinals combines in a
+handful of word operations. Only enumerating set bits is done in Python, and
+that skips zero bytes.
+"""
+
+
+def popcount(bits: int) -> int:
+    return bin(bits).count("1")
+
+
+def iter_bits(bits: int):
+    """Yield the index of every set bit, lowest first."""
+    if bits <= 0:
+        return
+    data = bits.to_bytes((bits.bit_length() + 7) // 8, "little")
+    for byte_index, byte in enumerate(data):
+        if not byte:
+            continue
+        base = byte_index * 8
+        for bit in range(8):
+            if byte >> bit & 1:
+                yield base + bit
+
+
+def lowest_clear_bit(bits: int) -> int:
+    """Index of the lowest unset bit (``bits`` must be non-negative)."""
+    return ((bits + 1) & ~bits).bit_length() - 1
+
+
+def from_bytes(data) -> int:
+    return int.from_bytes(data or b"", "little")
+
+
+def to_bytes(bits: int, size: int = 0) -> bytes:
+    """Little-endian bytes, at least ``size`` long (so documents keep a fixed width)."""
+    return bits.to_bytes(max(size, (bits.bit_length() + 7) // 8), "little")
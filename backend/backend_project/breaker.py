@@ -0,0 +1,223 @@
+"""
+Circuit breaker with stale fallback for Firestore-backed read views.
+
+Read views decorated with ``stale_on_failure`` run under a per-call deadline
+on a small bounded pool. A call that raises a Firestore API error
+(``GoogleAPICallError``) or ``TimeoutError``, returns a 5xx or misses its
+deadline counts as a Firestore failure; any other exception is a bug in the
+view, not an outage, and propagates as usual. After
+``FIRESTORE_BREAKER_FAILURES`` consecutive failures the circuit opens and,
+for ``FIRESTORE_BREAKER_RESET_SECONDS``, reads don't touch Firestore at all.
+Then a single probe request is let through (half-open) and its outcome
+closes or re-opens the circuit.
+
+While a call fails or the circuit is open, the view answers with the last
+good response for the same URL, marked ``"stale": true``, or ``503`` when it
+has never succeeded. The breaker and the cache are per worker process.
+"""
+import contextvars
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from functools import wraps
+
+from django.conf import settings
+from django.http import JsonResponse
+from google.api_core.exceptions import GoogleAPICallError
+
+from backend_project.profiling import follow_thread
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self.opened = 0
+        self.short_circuited = 0
+
+    def allow(self) -> bool:
+        """True if a call may go to Firestore now."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            self.short_circuited += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def release_probe(self):
+        """End a call that proved nothing about Firestore either way."""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.opened += 1
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.failures,
+                "times_opened": self.opened,
+                "short_circuited": self.short_circuited,
+            }
+
+
+class StaleCache:
+    """Last good response body per URL, least recently stored evicted first."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.served = 0
+
+    def store(self, key: str, content: bytes):
+        with self._lock:
+            self._entries[key] = (content, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, key: str):
+        with self._lock:
+            return self._entries.get(key)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class _Deadline:
+    """Bounded pool that runs a call with a timeout.
+
+    A call that misses its deadline keeps its thread until Firestore gives
+    up; when every slot is taken new calls fail immediately rather than
+    queueing behind the stuck ones.
+    """
+
+    def __init__(self, workers: int):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="firestore-read")
+        self._slots = threading.BoundedSemaphore(workers)
+
+    def _run(self, fn, args, kwargs):
+        try:
+            with follow_thread():
+                return fn(*args, **kwargs)
+        finally:
+            self._slots.release()
+
+    def call(self, timeout: float, fn, *args, **kwargs):
+        if not self._slots.acquire(blocking=False):
+            raise TimeoutError("No free Firestore read slots")
+        context = contextvars.copy_context()
+        future = self._executor.submit(context.run, self._run, fn, args, kwargs)
+        return future.result(timeout=timeout)
+
+
+_breaker = None
+_cache = None
+_deadline = None
+_lock = threading.Lock()
+
+
+def get_breaker() -> CircuitBreaker:
+    global _breaker, _cache, _deadline
+
+    if _breaker is not None:
+        return _breaker
+
+    with _lock:
+        if _breaker is None:
+            _cache = StaleCache(settings.STALE_CACHE_MAX_ENTRIES)
+            _deadline = _Deadline(settings.FIRESTORE_READ_WORKERS)
+            _breaker = CircuitBreaker(
+                failure_threshold=settings.FIRESTORE_BREAKER_FAILURES,
+                reset_timeout=settings.FIRESTORE_BREAKER_RESET_SECONDS,
+            )
+    return _breaker
+
+
+def metrics() -> dict:
+    breaker = get_breaker()
+    return dict(breaker.metrics(), cached_responses=len(_cache), stale_served=_cache.served)
+
+
+def _stale_response(key: str, reason: str):
+    cached = _cache.get(key)
+    if cached is None:
+        return JsonResponse(
+            {"status": "error", "message": f"Firestore unavailable ({reason}), no cached data"},
+            status=503,
+        )
+    content, stored_at = cached
+    body = json.loads(content)
+    body["stale"] = True
+    body["stale_age_seconds"] = round(time.time() - stored_at, 1)
+    _cache.served += 1
+    response = JsonResponse(body)
+    response["Warning"] = '110 - "Response is stale"'
+    return response
+
+
+def stale_on_failure(view):
+    """Run a GET view under the Firestore breaker, falling back to its last good response."""
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method != "GET":
+            return view(request, *args, **kwargs)
+
+        breaker = get_breaker()
+        key = f"{view.__module__}.{view.__name__}:{request.get_full_path()}"
+        if not breaker.allow():
+            return _stale_response(key, "circuit open")
+
+        try:
+            response = _deadline.call(settings.FIRESTORE_READ_DEADLINE_SECONDS, view, request, *args, **kwargs)
+        except TimeoutError:
+            breaker.record_failure()
+            return _stale_response(key, "deadline exceeded")
+        except GoogleAPICallError as e:
+            breaker.record_failure()
+            return _stale_response(key, str(e) or type(e).__name__)
+        except BaseException:
+            breaker.release_probe()
+            raise
+
+        if response.status_code >= 500:
+            breaker.record_failure()
+            return _stale_response(key, f"HTTP {response.status_code}")
+
+        breaker.record_success()
+        if response.status_code == 200 and response.get("Content-Type") == "application/json":
+            _cache.store(key, response.content)
+        return response
+
+    return wrapper
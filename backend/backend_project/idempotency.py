@@ -0,0 +1,174 @@
+"""
+Idempotency keys for device endpoints.
+
+The ESP32 firmware retries ``check_in`` on HTTP timeouts, so one scan can
+reach the server several times. A device that sends an ``Idempotency-Key``
+header (or a ``seq`` number in the JSON body) gets the stored response back
+for any repeat of that key, without the view or Firestore being touched.
+
+Keys are scoped to the device and to a hash of the request body: a retry
+sends the same bytes, while a device that rebooted and restarted its ``seq``
+counter sends a different scan under an old number, which must not get that
+old scan's response. Keys are kept for ``IDEMPOTENCY_TTL_SECONDS`` and the
+store holds at most ``IDEMPOTENCY_MAX_KEYS`` entries (oldest evicted first).
+
+The store is per worker process. A retry that a load balancer sends to a
+different worker than the first attempt isn't recognized and is processed
+again, so with several workers this narrows duplicates rather than ruling
+them out.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from django.conf import settings
+from django.http import HttpResponse
+
+from backend_project.admission import device_id_for
+from backend_project.wire import peek
+
+
+class _Entry:
+    __slots__ = ("expires", "response", "ready")
+
+    def __init__(self, expires: float):
+        self.expires = expires
+        self.response = None
+        self.ready = threading.Event()
+
+
+class IdempotencyStore:
+    """Bounded, expiring map of (endpoint, device, key) to the stored response."""
+
+    def __init__(self, ttl: float, max_keys: int):
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.replayed = 0
+
+    def _evict(self, now: float):
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if entry.expires > now and len(self._entries) <= self.max_keys:
+                break
+            self._entries.popitem(last=False)
+
+    def claim(self, key):
+        """Return ``(entry, owner)``; the owner runs the view, others wait on the entry."""
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now)
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires > now:
+                return entry, False
+            entry = _Entry(now + self.ttl)
+            self._entries[key] = entry
+            return entry, True
+
+    def note_replay(self):
+        with self._lock:
+            self.replayed += 1
+
+    def release(self, key, entry):
+        """Forget a key whose request failed so a retry runs the view again."""
+        with self._lock:
+            if self._entries.get(key) is entry:
+                del self._entries[key]
+        entry.ready.set()
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {"keys": len(self._entries), "capacity": self.max_keys, "replayed": self.replayed}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_idempotency_store() -> IdempotencyStore:
+    global _store
+
+    if _store is not None:
+        return _store
+
+    with _store_lock:
+        if _store is None:
+            _store = IdempotencyStore(
+                ttl=settings.IDEMPOTENCY_TTL_SECONDS,
+                max_keys=settings.IDEMPOTENCY_MAX_KEYS,
+            )
+    return _store
+
+
+def idempotency_key_for(request):
+    """``Idempotency-Key`` header, else ``seq``/``sequence`` from the body, else None."""
+    key = request.headers.get("Idempotency-Key")
+    if key:
+        return key
+
+    message = peek(request)
+    if message is not None:
+        return f"seq:{message['seq']}" if message.get("seq") is not None else None
+
+    if request.method == "POST" and request.content_type == "application/json":
+        try:
+            payload = json.loads(request.body.decode("utf-8") or "{}")
+        except (UnicodeDecodeError, json.JSONDecodeError):
+            return None
+        if isinstance(payload, dict):
+            seq = payload.get("seq", payload.get("sequence"))
+            if seq is not None:
+                return f"seq:{seq}"
+    return None
+
+
+def _replay(stored):
+    status, content_type, content = stored
+    response = HttpResponse(content, status=status, content_type=content_type)
+    response["Idempotent-Replayed"] = "true"
+    return response
+
+
+def idempotent(view):
+    """Replay the stored response for a repeated (device, idempotency key, body) triple.
+
+    Only successful and 4xx responses are stored; a 5xx or an exception
+    releases the key so the device's next retry is processed normally.
+    """
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = idempotency_key_for(request)
+        if key is None:
+            return view(request, *args, **kwargs)
+
+        store = get_idempotency_store()
+        scoped_key = (request.path, device_id_for(request), key, hashlib.sha256(request.body).digest())
+        entry, owner = store.claim(scoped_key)
+
+        if not owner:
+            # A repeat, possibly still in flight: wait for the first request to finish.
+            if entry.ready.wait(timeout=settings.IDEMPOTENCY_WAIT_SECONDS) and entry.response:
+                store.note_replay()
+                return _replay(entry.response)
+            return view(request, *args, **kwargs)
+
+        try:
+            response = view(request, *args, **kwargs)
+        except BaseException:
+            store.release(scoped_key, entry)
+            raise
+
+        if response.status_code >= 500 or response.status_code == 429 or response.streaming:
+            store.release(scoped_key, entry)
+            return response
+
+        entry.response = (response.status_code, response["Content-Type"], response.content)
+        entry.ready.set()
+        return response
+
+    return wrapper
@@ -24,7 +24,7 @@ class JSONErrorMiddleware:
         Convert exceptions to JSON responses for API endpoints.
         """
         # Only handle API paths (not Django admin, static files, etc.)
-        api_paths = ['/users/', '/fingerprint/', '/attendance/', '/health/']
+        api_paths = ['/users/', '/fingerprint/', '/attendance/', '/health/', '/devices/', '/reports/']
         
         if not any(request.path.startswith(path) for path in api_paths):
             return None  # Let Django handle non-API errors
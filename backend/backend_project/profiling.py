@@ -0,0 +1,248 @@
+"""
+Opt-in per-request profiling.
+
+With ``PROFILE_ENABLED=1``, ``ProfilingMiddleware`` profiles a request when it
+carries an ``X-Profile`` header signed with ``SECRET_KEY`` (``manage.py
+profiles --token``) or is picked by ``PROFILE_SAMPLE_RATE``. Every other
+request only pays for the header check and one random number.
+
+A profiled request runs under a sampling profiler: a sampler thread records
+the request thread's stack every ``PROFILE_INTERVAL_MS``, along with the
+stacks of Firestore read threads working for it (see ``breaker._Deadline``).
+Each profile is saved to ``PROFILE_DIR`` as two files:
+
+- ``{id}.folded``: one ``frame;frame;frame count`` line per distinct stack,
+  the input format of flamegraph.pl and speedscope.
+- ``{id}.json``: the request, status, wall time, sample count and every
+  Firestore query it ran with its duration (see ``query_recorder.collect``).
+
+The response carries ``X-Profile-Id`` so the caller can find its profile.
+Only the newest ``PROFILE_MAX_PROFILES`` profiles are kept.
+"""
+import contextvars
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import MiddlewareNotUsed
+
+from firebase_config import query_recorder
+
+
+HEADER = "X-Profile"
+TOKEN_SALT = "backend_project.profiling"
+
+_sampler = contextvars.ContextVar("profile_sampler", default=None)
+
+
+def make_token(label: str) -> str:
+    """A signed ``X-Profile`` header value; ``label`` ends up in the profile metadata."""
+    return signing.TimestampSigner(salt=TOKEN_SALT).sign(label)
+
+
+def trigger_for(request):
+    """Why ``request`` should be profiled (``"header:<label>"`` or ``"sampled"``), or None."""
+    token = request.headers.get(HEADER)
+    if token:
+        try:
+            label = signing.TimestampSigner(salt=TOKEN_SALT).unsign(
+                token, max_age=settings.PROFILE_TOKEN_MAX_AGE_SECONDS
+            )
+            return f"header:{label}"
+        except signing.BadSignature:
+            pass
+    if settings.PROFILE_SAMPLE_RATE > 0 and random.random() < settings.PROFILE_SAMPLE_RATE:
+        return "sampled"
+    return None
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    module = frame.f_globals.get("__name__", "?")
+    return f"{module}:{getattr(code, 'co_qualname', code.co_name)}".replace(";", ":")
+
+
+def _folded(frame) -> str:
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class Sampler:
+    """Counts the folded stacks of a set of threads at a fixed interval."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.threads = {threading.get_ident()}
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def sample(self):
+        frames = sys._current_frames()
+        for ident in tuple(self.threads):
+            frame = frames.get(ident)
+            if frame is not None:
+                self.stacks[_folded(frame)] += 1
+                self.samples += 1
+
+
+@contextmanager
+def follow_thread():
+    """Sample the current thread too while it works for a profiled request."""
+    sampler = _sampler.get()
+    if sampler is None:
+        yield
+        return
+    ident = threading.get_ident()
+    sampler.threads.add(ident)
+    try:
+        yield
+    finally:
+        sampler.threads.discard(ident)
+
+
+def _write_atomic(path: str, text: str):
+    directory = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def save(metadata: dict, stacks: Counter):
+    directory = settings.PROFILE_DIR
+    os.makedirs(directory, exist_ok=True)
+    base = os.path.join(directory, metadata["id"])
+    _write_atomic(base + ".folded", "".join(f"{stack} {count}\n" for stack, count in stacks.most_common()))
+    _write_atomic(base + ".json", json.dumps(metadata, indent=2))
+    prune(directory, settings.PROFILE_MAX_PROFILES)
+
+
+def prune(directory: str, keep: int):
+    """Delete all but the newest ``keep`` profiles (ids sort by capture time)."""
+    ids = list_ids(directory)
+    for profile_id in ids[:max(0, len(ids) - keep)]:
+        for suffix in (".json", ".folded"):
+            try:
+                os.remove(os.path.join(directory, profile_id + suffix))
+            except FileNotFoundError:
+                pass
+
+
+def list_ids(directory: str) -> list:
+    """Profile ids in ``directory``, oldest first."""
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    return sorted(name[:-len(".json")] for name in names if name.endswith(".json") and not name.startswith("."))
+
+
+def load(directory: str, profile_id: str):
+    """``(metadata, stacks)`` for a saved profile; raises FileNotFoundError."""
+    base = os.path.join(directory, os.path.basename(profile_id))
+    with open(base + ".json", "r", encoding="utf-8") as f:
+        metadata = json.load(f)
+    stacks = Counter()
+    with open(base + ".folded", "r", encoding="utf-8") as f:
+        for line in f:
+            stack, _, count = line.rstrip("\n").rpartition(" ")
+            if stack:
+                stacks[stack] += int(count)
+    return metadata, stacks
+
+
+def top_functions(stacks: Counter, top: int = 20) -> list:
+    """``(function, self samples, total samples)`` rows, most self time first."""
+    self_counts, total_counts = Counter(), Counter()
+    for stack, count in stacks.items():
+        frames = stack.split(";")
+        self_counts[frames[-1]] += count
+        for name in set(frames):
+            total_counts[name] += count
+    rows = [(name, self_counts[name], total) for name, total in total_counts.items()]
+    rows.sort(key=lambda row: (row[1], row[2]), reverse=True)
+    return rows[:top]
+
+
+def profile(request, get_response, trigger: str):
+    """Run ``get_response(request)`` under the sampler and save its profile."""
+    now = datetime.now(timezone.utc)
+    profile_id = f"{now.strftime('%Y%m%dT%H%M%S%f')}-{uuid.uuid4().hex[:8]}"
+    sampler = Sampler(settings.PROFILE_INTERVAL_MS / 1000)
+    token = _sampler.set(sampler)
+    response = None
+    started = time.perf_counter()
+    try:
+        with query_recorder.collect() as queries:
+            sampler.start()
+            try:
+                response = get_response(request)
+            finally:
+                sampler.stop()
+    finally:
+        _sampler.reset(token)
+        wall_ms = (time.perf_counter() - started) * 1000
+        save({
+            "id": profile_id,
+            "at": now.isoformat(),
+            "method": request.method,
+            "path": request.get_full_path(),
+            "status": response.status_code if response is not None else None,
+            "trigger": trigger,
+            "wall_ms": round(wall_ms, 2),
+            "interval_ms": settings.PROFILE_INTERVAL_MS,
+            "samples": sampler.samples,
+            "firestore": {
+                "queries": len(queries),
+                "total_ms": round(sum(query["duration_ms"] for query in queries), 2),
+                "calls": queries,
+            },
+        }, sampler.stacks)
+
+    response["X-Profile-Id"] = profile_id
+    return response
+
+
+class ProfilingMiddleware:
+    """Profiles requests picked by ``trigger_for``; removed from the stack unless ``PROFILE_ENABLED``."""
+
+    def __init__(self, get_response):
+        if not settings.PROFILE_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        trigger = trigger_for(request)
+        if trigger is None:
+            return self.get_response(request)
+        return profile(request, self.get_response, trigger)
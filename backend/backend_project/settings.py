@@ -19,6 +19,11 @@ DEBUG = os.environ.get("DJANGO_DEBUG", "1") == "1"
 
 ALLOWED_HOSTS = ["*"]
 
+# API-only profile: drops admin, sessions, messages, auth and the middleware
+# that serves them. No view uses Django auth/sessions (users and logins live in
+# Firebase), so device and dashboard APIs behave the same, minus the admin site.
+API_ONLY = os.environ.get("DJANGO_API_ONLY", "0") == "1"
+
 INSTALLED_APPS = [
     "django.contrib.admin",
     "django.contrib.auth",
@@ -32,9 +37,12 @@ INSTALLED_APPS = [
     "fingerprint",
     "attendance",
     "dashboard",
+    "devices",
+    "reports",
 ]
 
 MIDDLEWARE = [
+    "backend_project.profiling.ProfilingMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -46,6 +54,28 @@ MIDDLEWARE = [
     "backend_project.middleware.JSONErrorMiddleware",
 ]
 
+if API_ONLY:
+    INSTALLED_APPS = [
+        app for app in INSTALLED_APPS
+        if app not in (
+            "django.contrib.admin",
+            "django.contrib.auth",
+            "django.contrib.contenttypes",
+            "django.contrib.sessions",
+            "django.contrib.messages",
+        )
+    ]
+    MIDDLEWARE = [
+        middleware for middleware in MIDDLEWARE
+        if middleware not in (
+            "django.contrib.sessions.middleware.SessionMiddleware",
+            "django.middleware.csrf.CsrfViewMiddleware",
+            "django.contrib.auth.middleware.AuthenticationMiddleware",
+            "django.contrib.messages.middleware.MessageMiddleware",
+            "django.middleware.clickjacking.XFrameOptionsMiddleware",
+        )
+    ]
+
 ROOT_URLCONF = "backend_project.urls"
 
 TEMPLATES = [
@@ -64,6 +94,12 @@ TEMPLATES = [
     }
 ]
 
+if API_ONLY:
+    TEMPLATES[0]["OPTIONS"]["context_processors"] = [
+        "django.template.context_processors.debug",
+        "django.template.context_processors.request",
+    ]
+
 WSGI_APPLICATION = "backend_project.wsgi.application"
 
 # We keep sqlite ONLY for Django internal apps if you ever enable admin/session.
@@ -74,6 +110,8 @@ DATABASES = {
         "NAME": BASE_DIR / "db.sqlite3",
     }
 }
+if API_ONLY:
+    DATABASES = {}
 
 AUTH_PASSWORD_VALIDATORS = [
     {"NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator"},
@@ -96,3 +134,85 @@ CORS_ALLOWED_ORIGINS = [
 ]
 CORS_ALLOW_CREDENTIALS = True
 
+
+# Admission control for device endpoints (see backend_project/admission.py).
+# Rates are tokens per second, per worker process.
+ADMISSION_ENABLED = os.environ.get("ADMISSION_ENABLED", "1") == "1"
+ADMISSION_DEVICE_RATE = float(os.environ.get("ADMISSION_DEVICE_RATE", "2"))
+ADMISSION_DEVICE_BURST = float(os.environ.get("ADMISSION_DEVICE_BURST", "5"))
+ADMISSION_GLOBAL_RATE = float(os.environ.get("ADMISSION_GLOBAL_RATE", "50"))
+ADMISSION_GLOBAL_BURST = float(os.environ.get("ADMISSION_GLOBAL_BURST", "100"))
+ADMISSION_MAX_QUEUE = int(os.environ.get("ADMISSION_MAX_QUEUE", "32"))
+ADMISSION_MAX_WAIT = float(os.environ.get("ADMISSION_MAX_WAIT", "0.5"))
+
+# Where check-ins are stored (see attendance/days.py): "logs", "days" or "both".
+ATTENDANCE_STORAGE_MODE = os.environ.get("ATTENDANCE_STORAGE_MODE", "logs")
+
+# Check-in histograms (see attendance/histogram.py).
+ATTENDANCE_HISTOGRAM_MAX_BUCKETS = int(os.environ.get("ATTENDANCE_HISTOGRAM_MAX_BUCKETS", "5000"))
+
+# Cold storage for old attendance logs (see attendance/archive.py).
+ATTENDANCE_ARCHIVE_DIR = os.environ.get("ATTENDANCE_ARCHIVE_DIR", str(BASE_DIR / "archive" / "attendance"))
+ATTENDANCE_ARCHIVE_AFTER_DAYS = int(os.environ.get("ATTENDANCE_ARCHIVE_AFTER_DAYS", "90"))
+
+# Term calendars (see attendance/terms.py): "name:YYYY-MM-DD:YYYY-MM-DD;..."
+ATTENDANCE_TERMS = os.environ.get("ATTENDANCE_TERMS", "")
+ATTENDANCE_SCHOOL_WEEKDAYS = tuple(
+    int(day) for day in os.environ.get("ATTENDANCE_SCHOOL_WEEKDAYS", "0,1,2,3,4").split(",")
+)
+
+# In-memory student roster mirror (see users/roster.py).
+ROSTER_TTL_SECONDS = float(os.environ.get("ROSTER_TTL_SECONDS", "300"))
+# Catch-ups only see writes that set updated_at; re-read everything this often.
+ROSTER_FULL_RELOAD_SECONDS = float(os.environ.get("ROSTER_FULL_RELOAD_SECONDS", "3600"))
+# Snapshot loaded at startup; refresh it with `manage.py roster_snapshot`.
+ROSTER_SNAPSHOT_PATH = os.environ.get("ROSTER_SNAPSHOT_PATH", str(BASE_DIR / "var" / "roster.snapshot"))
+# Shared-memory roster published by `manage.py roster_shm_writer`; empty = per-worker mirror.
+ROSTER_SHM_NAME = os.environ.get("ROSTER_SHM_NAME", "")
+ROSTER_SHM_REFRESH_SECONDS = float(os.environ.get("ROSTER_SHM_REFRESH_SECONDS", "5"))
+ROSTER_SHM_STALE_SECONDS = float(os.environ.get("ROSTER_SHM_STALE_SECONDS", "30"))
+
+# Fingerprint slot pools (see fingerprint/slots.py). Capacity and first id
+# apply when a pool is created; the cache is per worker.
+FINGERPRINT_SLOT_POOL = os.environ.get("FINGERPRINT_SLOT_POOL", "default")
+FINGERPRINT_SLOT_CAPACITY = int(os.environ.get("FINGERPRINT_SLOT_CAPACITY", "1000"))
+FINGERPRINT_SLOT_FIRST = int(os.environ.get("FINGERPRINT_SLOT_FIRST", "1"))
+FINGERPRINT_SLOT_CACHE_SECONDS = float(os.environ.get("FINGERPRINT_SLOT_CACHE_SECONDS", "30"))
+
+# Idempotency keys for device retries (see backend_project/idempotency.py).
+# Each worker has its own store: a retry that lands on another worker runs again.
+IDEMPOTENCY_TTL_SECONDS = float(os.environ.get("IDEMPOTENCY_TTL_SECONDS", "600"))
+IDEMPOTENCY_MAX_KEYS = int(os.environ.get("IDEMPOTENCY_MAX_KEYS", "50000"))
+IDEMPOTENCY_WAIT_SECONDS = float(os.environ.get("IDEMPOTENCY_WAIT_SECONDS", "10"))
+
+# Firestore circuit breaker for read views (see backend_project/breaker.py).
+FIRESTORE_READ_DEADLINE_SECONDS = float(os.environ.get("FIRESTORE_READ_DEADLINE_SECONDS", "3"))
+FIRESTORE_READ_WORKERS = int(os.environ.get("FIRESTORE_READ_WORKERS", "8"))
+FIRESTORE_BREAKER_FAILURES = int(os.environ.get("FIRESTORE_BREAKER_FAILURES", "5"))
+FIRESTORE_BREAKER_RESET_SECONDS = float(os.environ.get("FIRESTORE_BREAKER_RESET_SECONDS", "30"))
+STALE_CACHE_MAX_ENTRIES = int(os.environ.get("STALE_CACHE_MAX_ENTRIES", "256"))
+
+# Batched dashboard calls (see backend_project/batch.py).
+BATCH_MAX_REQUESTS = int(os.environ.get("BATCH_MAX_REQUESTS", "10"))
+
+# Device heartbeats (see devices/fleet.py).
+DEVICE_HEARTBEAT_SECONDS = int(os.environ.get("DEVICE_HEARTBEAT_SECONDS", "30"))
+DEVICE_FLUSH_SECONDS = float(os.environ.get("DEVICE_FLUSH_SECONDS", "15"))
+DEVICE_OFFLINE_AFTER_SECONDS = float(os.environ.get("DEVICE_OFFLINE_AFTER_SECONDS", "90"))
+
+# Background report jobs (see reports/jobs.py).
+REPORT_DIR = os.environ.get("REPORT_DIR", str(BASE_DIR / "var" / "reports"))
+REPORT_WORKERS = int(os.environ.get("REPORT_WORKERS", "2"))
+REPORT_MAX_PENDING = int(os.environ.get("REPORT_MAX_PENDING", "20"))
+REPORT_RESULT_MAX_AGE_DAYS = float(os.environ.get("REPORT_RESULT_MAX_AGE_DAYS", "7"))
+REPORT_HEARTBEAT_SECONDS = float(os.environ.get("REPORT_HEARTBEAT_SECONDS", "10"))
+REPORT_STALE_AFTER_SECONDS = float(os.environ.get("REPORT_STALE_AFTER_SECONDS", "60"))
+
+# Per-request profiling (see backend_project/profiling.py); profiles with a
+# signed X-Profile header or a sampled fraction of requests.
+PROFILE_ENABLED = os.environ.get("PROFILE_ENABLED", "0") == "1"
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL_MS = float(os.environ.get("PROFILE_INTERVAL_MS", "2"))
+PROFILE_TOKEN_MAX_AGE_SECONDS = int(os.environ.get("PROFILE_TOKEN_MAX_AGE_SECONDS", "86400"))
+PROFILE_DIR = os.environ.get("PROFILE_DIR", str(BASE_DIR / "var" / "profiles"))
+PROFILE_MAX_PROFILES = int(os.environ.get("PROFILE_MAX_PROFILES", "500"))
@@ -0,0 +1,373 @@
+import json
+import math
+import os
+import tempfile
+import time
+from collections import Counter
+from unittest import mock
+
+from django.http import JsonResponse
+from django.test import RequestFactory, SimpleTestCase
+from google.api_core.exceptions import ServiceUnavailable
+
+from attendance.views import check_in
+from backend_project import batch, breaker, idempotency, profiling
+from backend_project.admission import AdmissionController, TokenBucket, admission_controlled
+from backend_project.bitsets import from_bytes, iter_bits, lowest_clear_bit, popcount, to_bytes
+from backend_project.wire import (
+    CHECK_IN,
+    CHECK_IN_LAYOUT,
+    CHECK_IN_REPLY,
+    CONTENT_TYPE,
+    HEARTBEAT,
+    HEARTBEAT_LAYOUT,
+    RESULT_CODES,
+    WireFormatError,
+    accepts,
+    respond,
+)
+from firebase_config.firebase import FirebaseCredentialsError
+from firebase_config.testing import use_fake_firestore
+from users.students import student_names
+
+
+class IdempotencyTests(SimpleTestCase):
+    def setUp(self):
+        idempotency._store = None
+        self.calls = []
+
+        @idempotency.idempotent
+        def view(request):
+            payload = json.loads(request.body)
+            self.calls.append(payload)
+            return JsonResponse({"status": "success", "fingerprint_id": payload["fingerprint_id"]})
+
+        self.view = view
+
+    def check_in(self, **payload):
+        request = RequestFactory().post(
+            "/attendance/check-in/", json.dumps(payload), content_type="application/json", HTTP_X_DEVICE_ID="ESP32-001"
+        )
+        response = self.view(request)
+        return response.get("Idempotent-Replayed"), json.loads(response.content)
+
+    def test_retry_replays_the_stored_response(self):
+        self.assertEqual(self.check_in(fingerprint_id=1, seq=7), (None, {"status": "success", "fingerprint_id": 1}))
+        self.assertEqual(self.check_in(fingerprint_id=1, seq=7), ("true", {"status": "success", "fingerprint_id": 1}))
+        self.assertEqual(len(self.calls), 1)
+
+    def test_reused_seq_with_a_different_body_runs_again(self):
+        self.check_in(fingerprint_id=1, seq=7)
+        replayed, body = self.check_in(fingerprint_id=2, seq=7)
+        self.assertIsNone(replayed)
+        self.assertEqual(body["fingerprint_id"], 2)
+        self.assertEqual(len(self.calls), 2)
+
+    def test_requests_without_a_key_always_run(self):
+        self.check_in(fingerprint_id=1)
+        self.check_in(fingerprint_id=1)
+        self.assertEqual(len(self.calls), 2)
+
+
+class StaleOnFailureTests(SimpleTestCase):
+    def setUp(self):
+        breaker._breaker = None
+        self.outcomes = []
+
+        @breaker.stale_on_failure
+        def view(request):
+            outcome = self.outcomes.pop(0)
+            if isinstance(outcome, BaseException):
+                raise outcome
+            return JsonResponse({"status": "success", "value": outcome})
+
+        self.view = view
+
+    def get(self):
+        response = self.view(RequestFactory().get("/dashboard/stats/"))
+        return response.status_code, json.loads(response.content)
+
+    def test_firestore_errors_serve_the_last_good_response(self):
+        self.outcomes = [1, ServiceUnavailable("down"), TimeoutError()]
+        self.assertEqual(self.get(), (200, {"status": "success", "value": 1}))
+        for _ in range(2):
+            status, body = self.get()
+            self.assertEqual((status, body["value"], body["stale"]), (200, 1, True))
+        self.assertEqual(breaker.get_breaker().failures, 2)
+
+    def test_other_exceptions_propagate_without_counting(self):
+        self.outcomes = [KeyError("bug")]
+        with self.assertRaises(KeyError):
+            self.get()
+        self.assertEqual(breaker.get_breaker().failures, 0)
+
+    def test_half_open_probe_is_released_after_a_bug(self):
+        circuit = breaker.get_breaker()
+        circuit.state, circuit.opened_at = circuit.OPEN, 0.0
+        self.outcomes = [KeyError("bug"), 2]
+        with self.assertRaises(KeyError):
+            self.get()
+        self.assertEqual(self.get(), (200, {"status": "success", "value": 2}))
+        self.assertEqual(circuit.state, circuit.CLOSED)
+
+
+class TokenBucketTests(SimpleTestCase):
+    def test_burst_then_refill(self):
+        bucket = TokenBucket(rate=2, burst=3)
+        now = bucket.updated
+        for _ in range(3):
+            self.assertEqual(bucket.wait_time(now), 0)
+            bucket.take()
+        self.assertAlmostEqual(bucket.wait_time(now), 0.5)
+        self.assertEqual(bucket.wait_time(now + 0.5), 0)
+
+    def test_refill_is_capped_at_burst(self):
+        bucket = TokenBucket(rate=10, burst=2)
+        bucket.wait_time(bucket.updated + 60)
+        self.assertEqual(bucket.tokens, 2)
+
+    def test_zero_rate_never_refills(self):
+        bucket = TokenBucket(rate=0, burst=1)
+        bucket.take()
+        self.assertEqual(bucket.wait_time(bucket.updated + 60), math.inf)
+
+
+class AdmissionControllerTests(SimpleTestCase):
+    def controller(self, **overrides):
+        options = dict(device_rate=0.001, device_burst=2, global_rate=1000, global_burst=1000,
+                       max_queue=0, max_wait=0)
+        options.update(overrides)
+        return AdmissionController(**options)
+
+    def test_device_burst_then_rejects_with_retry_after(self):
+        controller = self.controller()
+        self.assertEqual(controller.admit("ESP32-001"), (True, 0.0))
+        self.assertEqual(controller.admit("ESP32-001"), (True, 0.0))
+        admitted, retry_after = controller.admit("ESP32-001")
+        self.assertFalse(admitted)
+        self.assertGreater(retry_after, 0)
+        # Other devices have their own buckets.
+        self.assertEqual(controller.admit("ESP32-002"), (True, 0.0))
+
+    def test_global_bucket_limits_every_device(self):
+        controller = self.controller(device_burst=10, global_rate=0.001, global_burst=1)
+        self.assertTrue(controller.admit("ESP32-001")[0])
+        self.assertFalse(controller.admit("ESP32-002")[0])
+        self.assertEqual(controller.metrics()["rejected"], 1)
+
+    def test_least_recently_seen_devices_are_evicted(self):
+        controller = self.controller(max_devices=2)
+        for device_id in ("a", "b", "c"):
+            controller.admit(device_id)
+        self.assertEqual(controller.metrics()["tracked_devices"], 2)
+
+
+class BitsetTests(SimpleTestCase):
+    def test_iter_bits_and_popcount(self):
+        bits = 1 << 0 | 1 << 9 | 1 << 700
+        self.assertEqual(list(iter_bits(bits)), [0, 9, 700])
+        self.assertEqual(popcount(bits), 3)
+        self.assertEqual(list(iter_bits(0)), [])
+
+    def test_lowest_clear_bit(self):
+        self.assertEqual(lowest_clear_bit(0), 0)
+        self.assertEqual(lowest_clear_bit(0b1011), 2)
+        self.assertEqual(lowest_clear_bit((1 << 100) - 1), 100)
+
+    def test_bytes_round_trip_keeps_a_fixed_width(self):
+        data = to_bytes(0b101, 4)
+        self.assertEqual(data, b"\x05\x00\x00\x00")
+        self.assertEqual(from_bytes(data), 5)
+        self.assertEqual(from_bytes(None), 0)
+        self.assertEqual(len(to_bytes(1 << 40, 2)), 6)
+
+
+class WireSchemaTests(SimpleTestCase):
+    def test_json_aliases_and_coercion(self):
+        message = CHECK_IN.decode_json(b'{"fingerprintId": "12", "deviceId": "ESP32-001", "sequence": 4}')
+        self.assertEqual(message, {"fingerprint_id": 12, "device_id": "ESP32-001", "seq": 4})
+
+    def test_json_errors(self):
+        for body in (b"not json", b"[1]", b"{}", b'{"fingerprint_id": "x"}'):
+            with self.subTest(body=body), self.assertRaises(WireFormatError):
+                CHECK_IN.decode_json(body)
+
+    def test_binary_check_in(self):
+        body = CHECK_IN_LAYOUT.pack(1, 1, 1234, 0, b"ESP32-001")
+        self.assertEqual(CHECK_IN.decode_binary(body), {"fingerprint_id": 1234, "device_id": "ESP32-001"})
+
+    def test_binary_heartbeat_with_error_text(self):
+        body = HEARTBEAT_LAYOUT.pack(1, 2, b"ESP32-001", 1, -61, 20480, 3600, b"1.4.2") + b"sensor timeout"
+        message = HEARTBEAT.decode_binary(body)
+        self.assertEqual(message["rssi"], -61)
+        self.assertTrue(message["sensor_ok"])
+        self.assertEqual((message["firmware"], message["error"]), ("1.4.2", "sensor timeout"))
+
+    def test_binary_errors(self):
+        bodies = [
+            b"\x01\x01",
+            CHECK_IN_LAYOUT.pack(2, 1, 1, 0, b""),
+            CHECK_IN_LAYOUT.pack(1, 2, 1, 0, b""),
+            CHECK_IN_LAYOUT.pack(1, 1, 1, 0, b"\xff\xfe"),
+        ]
+        for body in bodies:
+            with self.subTest(body=body), self.assertRaises(WireFormatError):
+                CHECK_IN.decode_binary(body)
+
+    def test_check_in_reply(self):
+        reply = CHECK_IN.encode_reply({"student_id": "S1", "user_name": "Zoë " * 20}, 200)
+        version, result, student_id, user_name = CHECK_IN_REPLY.unpack(reply)
+        self.assertEqual((version, result, student_id.rstrip(b"\0")), (1, 0, b"S1"))
+        # Truncated to 32 bytes without splitting a character.
+        self.assertTrue(user_name.rstrip(b"\0").decode("utf-8").startswith("Zoë"))
+        self.assertEqual(CHECK_IN_REPLY.unpack(CHECK_IN.encode_reply({}, 404))[1], 2)
+
+
+class BatchTests(SimpleTestCase):
+    def test_parse(self):
+        body = json.dumps({"requests": [{"id": "stats", "path": "/dashboard/stats/"}, {"id": 2, "path": "/x/?a=1"}]})
+        self.assertEqual(batch.parse(body.encode(), 10), [("stats", "/dashboard/stats/"), ("2", "/x/?a=1")])
+
+    def test_parse_errors(self):
+        bodies = [
+            b"{",
+            b"[]",
+            b'{"requests": []}',
+            b'{"requests": [{"id": "a"}]}',
+            b'{"requests": [{"id": "a", "path": "x/"}]}',
+            b'{"requests": [{"id": "a", "path": "/x/"}, {"id": "a", "path": "/y/"}]}',
+            json.dumps({"requests": [{"id": str(i), "path": "/x/"} for i in range(3)]}).encode(),
+        ]
+        for body in bodies:
+            with self.subTest(body=body), self.assertRaises(batch.BatchError):
+                batch.parse(body, 2)
+
+    def test_memoized_only_inside_shared_reads(self):
+        loads = []
+
+        def load():
+            loads.append(1)
+            return len(loads)
+
+        self.assertEqual((batch.memoized(("k",), load), batch.memoized(("k",), load)), (1, 2))
+        with batch.shared_reads():
+            self.assertTrue(batch.active())
+            self.assertEqual((batch.memoized(("k",), load), batch.memoized(("k",), load)), (3, 3))
+        self.assertFalse(batch.active())
+
+    def test_student_names_share_one_query_in_a_batch(self):
+        db = use_fake_firestore()
+        db.data["users"] = {
+            "S1": {"uid": "S1", "name": "Ann", "role": "student"},
+            "T1": {"uid": "T1", "name": "Tess", "role": "teacher"},
+        }
+        with batch.shared_reads():
+            names = student_names(db, ["S1", "S1", "T1", "nobody"])
+            student_names(db, ["S1"])
+        self.assertEqual(names, {"S1": "Ann", "T1": "Tess", "nobody": "Unknown"})
+        self.assertEqual(db.queries, 1)
+
+    def test_dispatch_unknown_path(self):
+        result = batch.dispatch(RequestFactory().post("/dashboard/batch/"), "/no/such/endpoint/")
+        self.assertEqual(result["status"], 404)
+
+
+class BinaryErrorReplyTests(SimpleTestCase):
+    def binary_check_in(self):
+        return RequestFactory().post(
+            "/attendance/check-in/", CHECK_IN_LAYOUT.pack(1, 1, 5, 0, b"ESP32-001"), content_type=CONTENT_TYPE
+        )
+
+    def test_admission_429_is_binary_for_binary_requests(self):
+        @accepts(CHECK_IN)
+        @admission_controlled
+        def view(request):
+            return respond(request, CHECK_IN, {"status": "success"})
+
+        controller = AdmissionController(device_rate=0.001, device_burst=1, global_rate=1000, global_burst=1000,
+                                         max_queue=0, max_wait=0)
+        with self.settings(ADMISSION_ENABLED=True), \
+                mock.patch("backend_project.admission.get_admission_controller", return_value=controller):
+            self.assertEqual(view(self.binary_check_in()).status_code, 200)
+            response = view(self.binary_check_in())
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Content-Type"], CONTENT_TYPE)
+        self.assertEqual(CHECK_IN_REPLY.unpack(response.content)[1], RESULT_CODES[429])
+        self.assertGreaterEqual(int(response["Retry-After"]), 1)
+
+    def test_check_in_credentials_error_is_binary(self):
+        with self.settings(ADMISSION_ENABLED=False), \
+                mock.patch("attendance.views.get_firestore_db", side_effect=FirebaseCredentialsError("no key")):
+            response = check_in(self.binary_check_in())
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(CHECK_IN_REPLY.unpack(response.content)[1], RESULT_CODES[500])
+
+
+class ProfilingTests(SimpleTestCase):
+    def request(self, token=None):
+        headers = {"HTTP_X_PROFILE": token} if token else {}
+        return RequestFactory().get("/attendance/stats/", **headers)
+
+    def test_signed_header_triggers(self):
+        with self.settings(PROFILE_SAMPLE_RATE=0):
+            self.assertEqual(profiling.trigger_for(self.request(profiling.make_token("ana"))), "header:ana")
+            self.assertIsNone(profiling.trigger_for(self.request(profiling.make_token("ana") + "x")))
+            self.assertIsNone(profiling.trigger_for(self.request("ana")))
+
+    def test_expired_header_is_ignored(self):
+        with mock.patch("django.core.signing.time.time", return_value=time.time() - 120):
+            token = profiling.make_token("ana")
+        with self.settings(PROFILE_SAMPLE_RATE=0, PROFILE_TOKEN_MAX_AGE_SECONDS=60):
+            self.assertIsNone(profiling.trigger_for(self.request(token)))
+        with self.settings(PROFILE_SAMPLE_RATE=0, PROFILE_TOKEN_MAX_AGE_SECONDS=600):
+            self.assertEqual(profiling.trigger_for(self.request(token)), "header:ana")
+
+    def test_sampling_rate(self):
+        with self.settings(PROFILE_SAMPLE_RATE=0.25):
+            with mock.patch("backend_project.profiling.random.random", return_value=0.1):
+                self.assertEqual(profiling.trigger_for(self.request()), "sampled")
+            with mock.patch("backend_project.profiling.random.random", return_value=0.3):
+                self.assertIsNone(profiling.trigger_for(self.request()))
+        with self.settings(PROFILE_SAMPLE_RATE=0), \
+                mock.patch("backend_project.profiling.random.random") as draw:
+            self.assertIsNone(profiling.trigger_for(self.request()))
+        draw.assert_not_called()
+
+    def test_prune_keeps_the_newest(self):
+        with tempfile.TemporaryDirectory() as directory:
+            ids = [f"20260105T08000{second}000000-abcd1234" for second in range(5)]
+            for profile_id in ids:
+                for suffix in (".json", ".folded"):
+                    open(os.path.join(directory, profile_id + suffix), "w").close()
+            open(os.path.join(directory, ".tmp-partial"), "w").close()
+
+            profiling.prune(directory, keep=2)
+            self.assertEqual(profiling.list_ids(directory), ids[-2:])
+            self.assertEqual(sorted(os.listdir(directory)), sorted(
+                [".tmp-partial"] + [profile_id + suffix for profile_id in ids[-2:] for suffix in (".folded", ".json")]
+            ))
+
+    def test_top_functions(self):
+        stacks = Counter({"app:main;app:view;db:query": 3, "app:main;app:view": 2, "app:main;db:query": 1,
+                          "app:main;app:walk;app:main": 1})
+        self.assertEqual(profiling.top_functions(stacks), [
+            ("db:query", 4, 4),
+            ("app:view", 2, 5),
+            ("app:main", 1, 7),
+            ("app:walk", 0, 1),
+        ])
+        self.assertEqual(len(profiling.top_functions(stacks, top=2)), 2)
+
+    def test_profiled_request_is_saved(self):
+        with tempfile.TemporaryDirectory() as directory, \
+                self.settings(PROFILE_DIR=directory, PROFILE_INTERVAL_MS=1, PROFILE_MAX_PROFILES=5):
+            def view(request):
+                time.sleep(0.02)
+                return JsonResponse({"status": "success"})
+
+            response = profiling.profile(self.request(), view, "sampled")
+            metadata, stacks = profiling.load(directory, response["X-Profile-Id"])
+        self.assertEqual((metadata["status"], metadata["trigger"]), (200, "sampled"))
+        self.assertEqual(metadata["path"], "/attendance/stats/")
+        self.assertEqual(sum(stacks.values()), metadata["samples"])
+        self.assertGreater(metadata["samples"], 0)
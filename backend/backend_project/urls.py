@@ -1,12 +1,19 @@
-from django.contrib import admin
+from django.conf import settings
 from django.urls import path, include
 
 urlpatterns = [
     path("", include("health_urls")),
-    path("admin/", admin.site.urls),
     path("auth/", include("authentication.urls")),
     path("users/", include("users.urls")),
     path("fingerprint/", include("fingerprint.urls")),
     path("attendance/", include("attendance.urls")),
     path("dashboard/", include("dashboard.urls")),
+    path("devices/", include("devices.urls")),
+    path("reports/", include("reports.urls")),
 ]
+
+# The admin site isn't installed in the API-only profile.
+if not settings.API_ONLY:
+    from django.contrib import admin
+
+    urlpatterns.append(path("admin/", admin.site.urls))
@@ -0,0 +1,273 @@
+"""
+Compact wire format for device endpoints.
+
+Scanners may send ``Content-Type: application/x-attendance`` with a
+fixed-layout little-endian body instead of JSON, and get a fixed-layout reply
+back. Both encodings go through the same ``Schema``: JSON keys (including the
+``fingerprintId``/``deviceId`` spellings) and binary records are normalized
+into one dict of validated fields, so views never look at the raw body.
+
+Every message starts with a version byte and a message-type byte.
+
+Check-in request (26 bytes)::
+
+    B version | B type=1 | I fingerprint_id | I seq (0 = none) | 16s device_id
+
+Check-in reply (50 bytes)::
+
+    B version | B result | 16s student_id | 32s user_name
+
+Heartbeat request (40 bytes, optionally followed by UTF-8 error text)::
+
+    B version | B type=2 | 16s device_id | B flags (bit 0 = sensor_ok)
+    | b rssi | I free_heap | I uptime | 12s firmware
+
+Heartbeat reply (8 bytes)::
+
+    B version | B result | I server_time (unix seconds) | H heartbeat_interval
+
+Strings are UTF-8, NUL padded. ``result`` is 0 on success and otherwise one
+of ``RESULT_CODES``; the HTTP status is the same as for JSON.
+"""
+import json
+import struct
+from datetime import datetime
+from functools import wraps
+
+from django.http import HttpResponse, JsonResponse
+
+
+CONTENT_TYPE = "application/x-attendance"
+VERSION = 1
+
+# HTTP status -> reply ``result`` byte; anything else is reported as 255.
+RESULT_CODES = {200: 0, 201: 0, 400: 1, 404: 2, 409: 3, 429: 4, 500: 5}
+
+
+class WireFormatError(ValueError):
+    """Raised for a body that doesn't match the message schema."""
+
+
+class Field:
+    def __init__(self, name: str, kind=str, aliases=(), required=False):
+        self.name = name
+        self.kind = kind
+        self.aliases = aliases
+        self.required = required
+
+    def coerce(self, value):
+        if self.kind is int and not isinstance(value, bool):
+            try:
+                return int(value)
+            except (TypeError, ValueError):
+                raise WireFormatError(f"{self.name} must be an integer")
+        if self.kind is bool:
+            return bool(value)
+        if self.kind is str:
+            return str(value)
+        return value
+
+
+def _pack_text(value, size: int) -> bytes:
+    """UTF-8 encode and truncate to ``size`` bytes without splitting a character."""
+    return str(value or "").encode("utf-8")[:size].decode("utf-8", "ignore").encode("utf-8")
+
+
+def _unpack_text(raw: bytes):
+    try:
+        return raw.rstrip(b"\0").decode("utf-8") or None
+    except UnicodeDecodeError:
+        raise WireFormatError("Strings must be UTF-8")
+
+
+class Schema:
+    """One device message: its fields plus the binary request/reply layouts.
+
+    ``unpack`` turns the fixed-layout record (and any trailing bytes) into a
+    raw dict; ``pack_reply`` turns a response body into the reply record.
+    """
+
+    def __init__(self, message_type: int, fields, layout: struct.Struct, unpack, pack_reply):
+        self.message_type = message_type
+        self.fields = fields
+        self.layout = layout
+        self._unpack = unpack
+        self._pack_reply = pack_reply
+
+    def validate(self, raw: dict) -> dict:
+        message = {}
+        for field in self.fields:
+            value = raw.get(field.name)
+            for alias in field.aliases:
+                if value is None:
+                    value = raw.get(alias)
+            if value is None:
+                if field.required:
+                    raise WireFormatError(f"{field.name} is required")
+                continue
+            message[field.name] = field.coerce(value)
+        return message
+
+    def decode_json(self, body: bytes) -> dict:
+        try:
+            raw = json.loads(body.decode("utf-8") or "{}")
+        except (UnicodeDecodeError, json.JSONDecodeError):
+            raise WireFormatError("Invalid JSON")
+        if not isinstance(raw, dict):
+            raise WireFormatError("Invalid JSON")
+        return self.validate(raw)
+
+    def decode_binary(self, body: bytes) -> dict:
+        if len(body) < self.layout.size:
+            raise WireFormatError(f"Message must be at least {self.layout.size} bytes")
+        record = self.layout.unpack_from(body)
+        if record[0] != VERSION:
+            raise WireFormatError(f"Unsupported message version {record[0]}")
+        if record[1] != self.message_type:
+            raise WireFormatError(f"Expected message type {self.message_type}, got {record[1]}")
+        return self.validate(self._unpack(record, body[self.layout.size:]))
+
+    def decode(self, request) -> dict:
+        if is_binary(request):
+            return self.decode_binary(request.body)
+        return self.decode_json(request.body)
+
+    def encode_reply(self, body: dict, status: int) -> bytes:
+        result = RESULT_CODES.get(status, 255)
+        return self._pack_reply(result, body if result == 0 else {})
+
+
+CHECK_IN_LAYOUT = struct.Struct("<BBII16s")
+CHECK_IN_REPLY = struct.Struct("<BB16s32s")
+
+
+def _unpack_check_in(record, trailer: bytes) -> dict:
+    _, _, fingerprint_id, seq, device_id = record
+    return {
+        "fingerprint_id": fingerprint_id,
+        "seq": seq or None,
+        "device_id": _unpack_text(device_id),
+    }
+
+
+def _pack_check_in_reply(result: int, body: dict) -> bytes:
+    return CHECK_IN_REPLY.pack(
+        VERSION, result, _pack_text(body.get("student_id"), 16), _pack_text(body.get("user_name"), 32)
+    )
+
+
+CHECK_IN = Schema(
+    message_type=1,
+    fields=(
+        Field("fingerprint_id", int, aliases=("fingerprintId",), required=True),
+        Field("device_id", str, aliases=("deviceId",)),
+        Field("seq", None, aliases=("sequence",)),
+    ),
+    layout=CHECK_IN_LAYOUT,
+    unpack=_unpack_check_in,
+    pack_reply=_pack_check_in_reply,
+)
+
+
+HEARTBEAT_LAYOUT = struct.Struct("<BB16sBbII12s")
+HEARTBEAT_REPLY = struct.Struct("<BBIH")
+
+
+def _unpack_heartbeat(record, trailer: bytes) -> dict:
+    _, _, device_id, flags, rssi, free_heap, uptime, firmware = record
+    return {
+        "device_id": _unpack_text(device_id),
+        "sensor_ok": bool(flags & 1),
+        "rssi": rssi,
+        "free_heap": free_heap,
+        "uptime": uptime,
+        "firmware": _unpack_text(firmware),
+        "error": _unpack_text(trailer),
+    }
+
+
+def _pack_heartbeat_reply(result: int, body: dict) -> bytes:
+    server_time = int(datetime.fromisoformat(body["server_time"]).timestamp()) if body.get("server_time") else 0
+    return HEARTBEAT_REPLY.pack(VERSION, result, server_time, body.get("heartbeat_interval", 0))
+
+
+HEARTBEAT = Schema(
+    message_type=2,
+    fields=(
+        Field("device_id", str, aliases=("deviceId",)),
+        Field("firmware", str),
+        Field("ip", str),
+        Field("rssi", int),
+        Field("free_heap", int),
+        Field("uptime", int),
+        Field("sensor_ok", bool),
+        Field("error", str),
+    ),
+    layout=HEARTBEAT_LAYOUT,
+    unpack=_unpack_heartbeat,
+    pack_reply=_pack_heartbeat_reply,
+)
+
+
+def is_binary(request) -> bool:
+    return request.content_type == CONTENT_TYPE
+
+
+def accepts(schema: Schema):
+    """Decode a POST body with ``schema`` once, before any other decorator reads it.
+
+    The result is left on ``request.device_message`` (the decoded dict or the
+    ``WireFormatError``) so admission control and idempotency can read the
+    device id and sequence number without parsing the body again, and the
+    schema on ``request.device_schema`` so they can reply in the device's
+    format (see ``reply``).
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            request.device_schema = schema
+            if request.method == "POST":
+                try:
+                    request.device_message = schema.decode(request)
+                except WireFormatError as e:
+                    request.device_message = e
+            return view(request, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def peek(request):
+    """The decoded message if ``accepts`` ran and decoding succeeded, else None."""
+    message = getattr(request, "device_message", None)
+    return message if isinstance(message, dict) else None
+
+
+def message_for(request) -> dict:
+    """The decoded message; re-raises the ``WireFormatError`` from decoding."""
+    message = getattr(request, "device_message", None)
+    if isinstance(message, WireFormatError):
+        raise message
+    if message is None:
+        raise WireFormatError("No message")
+    return message
+
+
+def respond(request, schema: Schema, body: dict, status: int = 200):
+    """Reply in the format the device used: fixed-layout bytes or JSON."""
+    if is_binary(request):
+        return HttpResponse(schema.encode_reply(body, status), status=status, content_type=CONTENT_TYPE)
+    return JsonResponse(body, status=status)
+
+
+def reply(request, body: dict, status: int = 200):
+    """Like ``respond``, for code that runs under ``accepts`` but doesn't know the schema.
+
+    Falls back to JSON for views that don't take device messages.
+    """
+    schema = getattr(request, "device_schema", None)
+    if schema is None:
+        return JsonResponse(body, status=status)
+    return respond(request, schema, body, status=status)
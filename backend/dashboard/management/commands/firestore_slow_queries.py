@@ -0,0 +1,58 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from firebase_config import query_recorder
+
+
+class Command(BaseCommand):
+    help = "Summarize the slow Firestore query log into a top-N report by query shape."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--log",
+            default=query_recorder.log_path(),
+            help="Recorder log file (defaults to FIRESTORE_QUERY_LOG).",
+        )
+        parser.add_argument("--top", type=int, default=20, help="Number of shapes to show.")
+        parser.add_argument(
+            "--sort",
+            choices=["total", "count", "max", "p95"],
+            default="total",
+            help="Rank shapes by total time (default), occurrences, max or p95 duration.",
+        )
+        parser.add_argument(
+            "--clear",
+            action="store_true",
+            help="Truncate the log after reporting.",
+        )
+
+    def handle(self, *args, **options):
+        path = options["log"]
+        if not path:
+            raise CommandError("No log file: pass --log or set FIRESTORE_QUERY_LOG.")
+
+        lines = []
+        for candidate in (path + ".1", path):
+            if os.path.exists(candidate):
+                with open(candidate, "r", encoding="utf-8") as f:
+                    lines.extend(f)
+        if not lines:
+            self.stdout.write(f"No slow queries recorded in {path}.")
+            return
+
+        report = query_recorder.summarize(lines, top=options["top"], sort=options["sort"])
+
+        self.stdout.write(
+            f"{'count':>7} {'total ms':>10} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} {'docs':>7}  shape"
+        )
+        for row in report:
+            self.stdout.write(
+                f"{row['count']:>7} {row['total_ms']:>10.1f} {row['p50_ms']:>8.1f} "
+                f"{row['p95_ms']:>8.1f} {row['max_ms']:>8.1f} {row['avg_documents']:>7.1f}  {row['shape']}"
+            )
+
+        if options["clear"]:
+            for candidate in (path + ".1", path):
+                if os.path.exists(candidate):
+                    os.remove(candidate)
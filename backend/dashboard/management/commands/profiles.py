@@ -0,0 +1,80 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from backend_project import profiling
+
+
+class Command(BaseCommand):
+    help = "List captured request profiles, summarize one, or mint a signed X-Profile header."
+
+    def add_arguments(self, parser):
+        parser.add_argument("profile_id", nargs="?", help="Profile to summarize (default: list profiles).")
+        parser.add_argument(
+            "--dir",
+            default=settings.PROFILE_DIR,
+            help="Profile directory (defaults to PROFILE_DIR).",
+        )
+        parser.add_argument("--limit", type=int, default=20, help="Profiles to list, newest first.")
+        parser.add_argument("--top", type=int, default=20, help="Functions to show in a summary.")
+        parser.add_argument(
+            "--token",
+            metavar="LABEL",
+            help="Print a signed X-Profile header value labelled LABEL and exit.",
+        )
+
+    def handle(self, *args, **options):
+        if options["token"]:
+            self.stdout.write(profiling.make_token(options["token"]))
+            return
+
+        if options["profile_id"]:
+            self._summarize(options["dir"], options["profile_id"], options["top"])
+        else:
+            self._list(options["dir"], options["limit"])
+
+    def _list(self, directory: str, limit: int):
+        ids = profiling.list_ids(directory)
+        if not ids:
+            self.stdout.write(f"No profiles in {directory}.")
+            return
+
+        self.stdout.write(f"{'id':<36} {'status':>6} {'wall ms':>9} {'fs ms':>8} {'fs q':>5}  request")
+        for profile_id in reversed(ids[-limit:]):
+            try:
+                metadata, _ = profiling.load(directory, profile_id)
+            except (FileNotFoundError, ValueError):
+                continue
+            firestore = metadata["firestore"]
+            self.stdout.write(
+                f"{profile_id:<36} {metadata['status'] or '-':>6} {metadata['wall_ms']:>9.1f} "
+                f"{firestore['total_ms']:>8.1f} {firestore['queries']:>5}  "
+                f"{metadata['method']} {metadata['path']} ({metadata['trigger']})"
+            )
+
+    def _summarize(self, directory: str, profile_id: str, top: int):
+        try:
+            metadata, stacks = profiling.load(directory, profile_id)
+        except FileNotFoundError:
+            raise CommandError(f"No profile {profile_id} in {directory}.")
+
+        firestore = metadata["firestore"]
+        self.stdout.write(f"{metadata['method']} {metadata['path']} -> {metadata['status']} ({metadata['trigger']})")
+        self.stdout.write(
+            f"wall {metadata['wall_ms']:.1f} ms, {metadata['samples']} samples every {metadata['interval_ms']} ms, "
+            f"Firestore {firestore['total_ms']:.1f} ms over {firestore['queries']} queries"
+        )
+
+        samples = max(1, sum(stacks.values()))
+        self.stdout.write("")
+        self.stdout.write(f"{'self %':>7} {'total %':>8}  function")
+        for name, self_count, total_count in profiling.top_functions(stacks, top):
+            self.stdout.write(f"{100 * self_count / samples:>7.1f} {100 * total_count / samples:>8.1f}  {name}")
+
+        if firestore["calls"]:
+            self.stdout.write("")
+            self.stdout.write(f"{'ms':>8} {'docs':>6}  query")
+            for call in sorted(firestore["calls"], key=lambda call: call["duration_ms"], reverse=True):
+                self.stdout.write(f"{call['duration_ms']:>8.1f} {call['documents']:>6}  {call['shape']}")
+
+        self.stdout.write("")
+        self.stdout.write(f"Flame graph input: {directory}/{profile_id}.folded")
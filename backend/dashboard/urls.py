@@ -4,4 +4,6 @@ from . import views
 urlpatterns = [
     path("stats/", views.dashboard_stats, name="dashboard_stats"),
     path("recent-activity/", views.recent_activity, name="recent_activity"),
+    path("absentees/", views.absentees, name="absentees"),
+    path("batch/", views.batch_requests, name="batch_requests"),
 ]
@@ -2,7 +2,14 @@ import json
 from datetime import datetime, timezone, time, timedelta
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
+from django.conf import settings
+from attendance.days import DAYS_COLLECTION, as_log, count_present, stores_days, stores_logs
+from attendance.logs import logs_since
+from attendance.presence import get_presence
+from backend_project import batch
+from backend_project.breaker import stale_on_failure
 from firebase_config.firebase import FirebaseCredentialsError, get_firestore_db
+from users.students import student_names, student_records
 
 
 def _json_error(message, status=400):
@@ -10,6 +17,7 @@ def _json_error(message, status=400):
 
 
 @csrf_exempt
+@stale_on_failure
 def dashboard_stats(request):
     """
     Get comprehensive dashboard statistics including:
@@ -27,19 +35,18 @@ def dashboard_stats(request):
         return JsonResponse({"status": "error", "message": str(e)}, status=500)
 
     # Get total students
-    students_query = db.collection("users").where("role", "==", "student")
-    total_students = len(list(students_query.stream()))
+    students = student_records(db)
+    total_students = len(students)
 
     # Get today's attendance
     today_start = datetime.combine(datetime.now(timezone.utc).date(), time.min, tzinfo=timezone.utc)
     
-    today_query = db.collection("attendance_logs").where(
-        "timestamp", ">=", today_start.isoformat()
-    )
-    
-    today_logs = list(today_query.stream())
-    today_unique_students = set(doc.to_dict().get("student_id") for doc in today_logs)
-    today_count = len(today_unique_students)
+    if stores_days():
+        today_count = count_present(db, today_start.date())
+    else:
+        today_logs = logs_since(db, today_start.isoformat())
+        today_unique_students = set(log.get("student_id") for log in today_logs)
+        today_count = len(today_unique_students)
     
     # Calculate attendance percentage
     attendance_percentage = (today_count / total_students * 100) if total_students > 0 else 0
@@ -48,14 +55,17 @@ def dashboard_stats(request):
     yesterday_start = today_start - timedelta(days=1)
     yesterday_end = today_start
     
-    yesterday_query = db.collection("attendance_logs").where(
-        "timestamp", ">=", yesterday_start.isoformat()
-    ).where(
-        "timestamp", "<", yesterday_end.isoformat()
-    )
-    
-    yesterday_logs = list(yesterday_query.stream())
-    yesterday_count = len(set(doc.to_dict().get("student_id") for doc in yesterday_logs))
+    if stores_days():
+        yesterday_count = count_present(db, yesterday_start.date())
+    else:
+        yesterday_query = db.collection("attendance_logs").where(
+            "timestamp", ">=", yesterday_start.isoformat()
+        ).where(
+            "timestamp", "<", yesterday_end.isoformat()
+        )
+
+        yesterday_logs = list(yesterday_query.stream())
+        yesterday_count = len(set(doc.to_dict().get("student_id") for doc in yesterday_logs))
 
     # Calculate trend
     if yesterday_count > 0:
@@ -64,17 +74,15 @@ def dashboard_stats(request):
         trend = 0 if today_count == 0 else 100
 
     # Get total attendance records
-    all_logs_query = db.collection("attendance_logs").limit(5000)
-    total_records = len(list(all_logs_query.stream()))
-
-    # Get new enrollments this week
-    week_ago = datetime.now(timezone.utc) - timedelta(days=7)
-    new_students_query = db.collection("users").where(
-        "role", "==", "student"
-    ).where(
-        "created_at", ">=", week_ago.isoformat()
+    records = db.collection("attendance_logs" if stores_logs() else DAYS_COLLECTION)
+    total_records = records.limit(5000).count().get()[0][0].value
+
+    # Get new enrollments this week (from the student list already read above)
+    week_ago = (datetime.now(timezone.utc) - timedelta(days=7)).isoformat()
+    new_students_count = sum(
+        1 for student in students
+        if isinstance(student.get("created_at"), str) and student["created_at"] >= week_ago
     )
-    new_students_count = len(list(new_students_query.stream()))
 
     return JsonResponse({
         "status": "success",
@@ -108,28 +116,32 @@ def recent_activity(request):
     limit = int(request.GET.get("limit", 10))
 
     # Get recent attendance logs
-    logs_query = db.collection("attendance_logs").order_by(
-        "timestamp", direction="DESCENDING"
-    ).limit(limit)
+    if stores_logs():
+        logs_query = db.collection("attendance_logs").order_by(
+            "timestamp", direction="DESCENDING"
+        ).limit(limit)
+    else:
+        logs_query = db.collection(DAYS_COLLECTION).order_by(
+            "last_seen", direction="DESCENDING"
+        ).limit(limit)
 
-    activities = []
-    
+    recent = []
     for doc in logs_query.stream():
         log_data = doc.to_dict()
+        if not stores_logs():
+            log_data = dict(as_log(log_data), timestamp=log_data.get("last_seen"))
+        recent.append((doc.id, log_data))
+
+    # Get student details
+    names = student_names(db, [log_data.get("student_id") for _, log_data in recent])
+
+    activities = []
+    for doc_id, log_data in recent:
         student_id = log_data.get("student_id")
-        
-        # Get student details
-        student_doc = db.collection("users").document(student_id).get()
-        student_name = "Unknown"
-        
-        if student_doc.exists:
-            student_data = student_doc.to_dict()
-            student_name = student_data.get("name", "Unknown")
-        
         activities.append({
-            "id": doc.id,
+            "id": doc_id,
             "student_id": student_id,
-            "student_name": student_name,
+            "student_name": names[student_id],
             "timestamp": log_data.get("timestamp"),
             "status": log_data.get("status"),
             "device_id": log_data.get("device_id"),
@@ -141,3 +153,69 @@ def recent_activity(request):
         "activities": activities,
         "count": len(activities)
     })
+
+
+@csrf_exempt
+def absentees(request):
+    """
+    List today's absent (and optionally present) students.
+
+    Backed by the in-memory present-student bitmap, so only logs written since
+    the previous call are read from Firestore.
+    """
+    if request.method != "GET":
+        return _json_error("Method not allowed", status=405)
+
+    try:
+        db = get_firestore_db()
+    except FirebaseCredentialsError as e:
+        return JsonResponse({"status": "error", "message": str(e)}, status=500)
+
+    presence = get_presence()
+    summary = presence.summary(db)
+    roster = presence.roster
+
+    def describe(uid):
+        student = roster.get(uid) or {}
+        return {
+            "uid": uid,
+            "name": student.get("name"),
+            "fingerprint_id": student.get("fingerprint_id"),
+        }
+
+    result = {
+        "total_students": summary["total_students"],
+        "present_today": summary["present_count"],
+        "absent_today": summary["absent_count"],
+        "attendance_percentage": summary["attendance_percentage"],
+        "absent": [describe(uid) for uid in summary["absent"]],
+        "date": summary["date"],
+    }
+    if request.GET.get("include_present") in ("1", "true"):
+        result["present"] = [describe(uid) for uid in summary["present"]]
+
+    return JsonResponse({"status": "success", **result})
+
+
+@csrf_exempt
+def batch_requests(request):
+    """
+    Run several GET API calls in one round trip, e.g. a whole dashboard page load.
+
+    Body: {"requests": [{"id": "stats", "path": "/dashboard/stats/"}, ...]}.
+    Reads the sub-requests share (students, today's logs) run once per batch.
+    """
+    if request.method != "POST":
+        return _json_error("Method not allowed", status=405)
+
+    try:
+        entries = batch.parse(request.body, settings.BATCH_MAX_REQUESTS)
+    except batch.BatchError as e:
+        return _json_error(str(e))
+
+    responses = {}
+    with batch.shared_reads():
+        for request_id, path in entries:
+            responses[request_id] = batch.dispatch(request, path)
+
+    return JsonResponse({"status": "success", "responses": responses})
@@ -0,0 +1,209 @@
+"""
+In-memory device table with coalesced Firestore writes.
+
+Heartbeats (and check-ins) only update this worker's table. A background
+thread persists the devices that changed to ``devices/{device_id}`` every
+``DEVICE_FLUSH_SECONDS`` in one batch, so a fleet phoning home every 30
+seconds costs a handful of writes per minute instead of one per heartbeat.
+"""
+import atexit
+import logging
+import threading
+from datetime import datetime, timezone
+
+from django.conf import settings
+from firebase_admin import firestore
+from google.api_core.exceptions import InvalidArgument
+
+from firebase_config.firebase import FirebaseCredentialsError, get_firestore_db
+
+
+logger = logging.getLogger(__name__)
+
+DEVICES_COLLECTION = "devices"
+
+# Fields a heartbeat may report, copied as-is into the device state.
+REPORTED_FIELDS = ("firmware", "ip", "rssi", "free_heap", "uptime", "sensor_ok")
+MAX_DEVICE_ID_LENGTH = 128
+
+# Errors that mean Firestore will never accept a document, so retrying is pointless.
+REJECTED = (ValueError, TypeError, InvalidArgument)
+
+
+class InvalidDeviceIdError(ValueError):
+    """Raised for a device id that can't be a ``devices`` document id."""
+
+
+def check_device_id(device_id) -> str:
+    """``device_id`` as a string; raises InvalidDeviceIdError if Firestore would reject it."""
+    device_id = str(device_id)
+    if not device_id or len(device_id) > MAX_DEVICE_ID_LENGTH:
+        raise InvalidDeviceIdError(f"device_id must be 1-{MAX_DEVICE_ID_LENGTH} characters")
+    if "/" in device_id or device_id in (".", "..") or (device_id.startswith("__") and device_id.endswith("__")):
+        raise InvalidDeviceIdError(f"device_id {device_id!r} can't be used as a document id")
+    return device_id
+
+
+class FleetTable:
+    def __init__(self, flush_interval: float):
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._devices = {}
+        self._pending = {}
+        self._flusher = None
+        self._stopped = threading.Event()
+        self.flushes = 0
+        self.writes = 0
+
+    def _pending_for(self, device_id: str) -> dict:
+        return self._pending.setdefault(device_id, {"heartbeats": 0, "scans": 0, "errors": 0})
+
+    def heartbeat(self, device_id: str, report: dict):
+        device_id = check_device_id(device_id)
+        now = datetime.now(timezone.utc).isoformat()
+        with self._lock:
+            state = self._devices.setdefault(device_id, {"device_id": device_id})
+            state["last_seen"] = now
+            state["last_heartbeat"] = now
+            for field in REPORTED_FIELDS:
+                if report.get(field) is not None:
+                    state[field] = report[field]
+            pending = self._pending_for(device_id)
+            pending["heartbeats"] += 1
+            if report.get("error"):
+                state["last_error"] = str(report["error"])[:500]
+                state["last_error_at"] = now
+                pending["errors"] += 1
+        self._ensure_flusher()
+
+    def touch(self, device_id: str):
+        """Record activity other than a heartbeat (e.g. a check-in)."""
+        device_id = check_device_id(device_id)
+        now = datetime.now(timezone.utc).isoformat()
+        with self._lock:
+            state = self._devices.setdefault(device_id, {"device_id": device_id})
+            state["last_seen"] = now
+            state["last_scan"] = now
+            self._pending_for(device_id)["scans"] += 1
+        self._ensure_flusher()
+
+    def local_state(self) -> dict:
+        with self._lock:
+            return {device_id: dict(state) for device_id, state in self._devices.items()}
+
+    def _requeue(self, pending: dict):
+        with self._lock:
+            for device_id, counts in pending.items():
+                merged = self._pending_for(device_id)
+                for key, value in counts.items():
+                    merged[key] += value
+
+    def _set(self, batch, db, device_id: str, state: dict, counts: dict):
+        doc = dict(state)
+        doc["heartbeat_count"] = firestore.Increment(counts["heartbeats"])
+        doc["scan_count"] = firestore.Increment(counts["scans"])
+        doc["error_count"] = firestore.Increment(counts["errors"])
+        batch.set(db.collection(DEVICES_COLLECTION).document(device_id), doc, merge=True)
+
+    def flush(self, db=None):
+        """Write every device that changed since the last flush in one batch."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            states = {device_id: dict(self._devices[device_id]) for device_id in pending}
+        if not pending:
+            return 0
+
+        try:
+            db = db or get_firestore_db()
+        except Exception:
+            # Put the counts back so the next flush retries them.
+            self._requeue(pending)
+            raise
+
+        try:
+            batch = db.batch()
+            for device_id, counts in pending.items():
+                self._set(batch, db, device_id, states[device_id], counts)
+            batch.commit()
+        except Exception:
+            written = self._flush_each(db, states, pending)
+        else:
+            written = len(pending)
+
+        self.flushes += 1
+        self.writes += written
+        return written
+
+    def _flush_each(self, db, states: dict, pending: dict) -> int:
+        """Write devices one at a time after a failed batch.
+
+        A batch fails as a whole, so one document Firestore rejects would
+        otherwise be retried, with everything else, forever. Rejected devices
+        are dropped; on any other error the rest are put back for the next
+        flush and the error is raised.
+        """
+        written = 0
+        remaining = dict(pending)
+        for device_id, counts in pending.items():
+            try:
+                batch = db.batch()
+                self._set(batch, db, device_id, states[device_id], counts)
+                batch.commit()
+            except REJECTED as e:
+                logger.error("Dropping state for device %r: %s", device_id, e)
+            except Exception:
+                self._requeue(remaining)
+                raise
+            else:
+                written += 1
+            del remaining[device_id]
+        return written
+
+    def _run(self):
+        while not self._stopped.wait(self.flush_interval):
+            try:
+                self.flush()
+            except FirebaseCredentialsError:
+                pass
+            except Exception:
+                logger.exception("Device state flush failed")
+
+    def _ensure_flusher(self):
+        if self._flusher is not None:
+            return
+        with self._lock:
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._run, name="device-flusher", daemon=True)
+                self._flusher.start()
+                atexit.register(self.shutdown)
+
+    def shutdown(self):
+        self._stopped.set()
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Final device state flush failed")
+
+
+def device_status(state: dict, offline_after: float, now: datetime) -> str:
+    last_seen = state.get("last_seen")
+    if not last_seen:
+        return "unknown"
+    age = (now - datetime.fromisoformat(last_seen)).total_seconds()
+    return "online" if age <= offline_after else "offline"
+
+
+_fleet = None
+_fleet_lock = threading.Lock()
+
+
+def get_fleet() -> FleetTable:
+    global _fleet
+
+    if _fleet is not None:
+        return _fleet
+
+    with _fleet_lock:
+        if _fleet is None:
+            _fleet = FleetTable(flush_interval=settings.DEVICE_FLUSH_SECONDS)
+    return _fleet
@@ -0,0 +1,55 @@
+from unittest import mock
+
+from django.test import SimpleTestCase
+from google.api_core.exceptions import ServiceUnavailable
+
+from devices.fleet import FleetTable, InvalidDeviceIdError
+from firebase_config.testing import use_fake_firestore
+
+
+class FleetTableTests(SimpleTestCase):
+    def setUp(self):
+        self.db = use_fake_firestore()
+        self.fleet = FleetTable(flush_interval=3600)
+        # Keep the background flusher out of the tests.
+        self.fleet._flusher = object()
+
+    def test_coalesces_heartbeats(self):
+        for _ in range(3):
+            self.fleet.heartbeat("ESP32-001", {"rssi": -60})
+        self.fleet.touch("ESP32-001")
+        self.assertEqual(self.fleet.flush(self.db), 1)
+        doc = self.db.document_data("devices", "ESP32-001")
+        self.assertEqual((doc["heartbeat_count"], doc["scan_count"], doc["rssi"]), (3, 1, -60))
+        self.assertEqual(self.fleet.flush(self.db), 0)
+
+    def test_rejects_device_ids_that_cant_be_documents(self):
+        for device_id in ("", "a/b", "..", "__x__", "x" * 129):
+            with self.assertRaises(InvalidDeviceIdError):
+                self.fleet.heartbeat(device_id, {})
+            with self.assertRaises(InvalidDeviceIdError):
+                self.fleet.touch(device_id)
+        self.assertEqual(self.fleet.local_state(), {})
+
+    def test_rejected_document_is_dropped(self):
+        self.fleet.heartbeat("ESP32-001", {})
+        # Slipped past validation, e.g. recorded by an older version.
+        self.fleet._devices["bad/id"] = {"device_id": "bad/id"}
+        self.fleet._pending_for("bad/id")["heartbeats"] += 1
+
+        with self.assertLogs("devices.fleet", "ERROR"):
+            self.assertEqual(self.fleet.flush(self.db), 1)
+        self.assertEqual(self.db.document_data("devices", "ESP32-001")["heartbeat_count"], 1)
+        self.assertEqual(self.fleet.flush(self.db), 0)
+
+    def test_transient_failure_requeues_everything(self):
+        self.fleet.heartbeat("ESP32-001", {})
+        self.fleet.heartbeat("ESP32-002", {})
+        with mock.patch("firebase_config.testing.FakeBatch.commit", side_effect=ServiceUnavailable("down")):
+            with self.assertRaises(ServiceUnavailable):
+                self.fleet.flush(self.db)
+        self.fleet.heartbeat("ESP32-001", {})
+
+        self.assertEqual(self.fleet.flush(self.db), 2)
+        self.assertEqual(self.db.document_data("devices", "ESP32-001")["heartbeat_count"], 2)
+        self.assertEqual(self.db.document_data("devices", "ESP32-002")["heartbeat_count"], 1)
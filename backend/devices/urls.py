@@ -0,0 +1,7 @@
+from django.urls import path
+from . import views
+
+urlpatterns = [
+    path("heartbeat/", views.heartbeat, name="device_heartbeat"),
+    path("status/", views.fleet_status, name="fleet_status"),
+]
@@ -0,0 +1,80 @@
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+
+from backend_project.wire import HEARTBEAT, WireFormatError, accepts, message_for, respond
+from devices.fleet import DEVICES_COLLECTION, InvalidDeviceIdError, device_status, get_fleet
+from firebase_config.firebase import FirebaseCredentialsError, get_firestore_db
+
+
+def _json_error(message, status=400):
+    return JsonResponse({"status": "error", "message": message}, status=status)
+
+
+@csrf_exempt
+@accepts(HEARTBEAT)
+def heartbeat(request):
+    """Record a device heartbeat in memory; persisted by the background flusher"""
+    if request.method != "POST":
+        return _json_error("Method not allowed", status=405)
+
+    try:
+        message = message_for(request)
+    except WireFormatError as e:
+        return respond(request, HEARTBEAT, {"status": "error", "message": str(e)}, status=400)
+
+    device_id = message.get("device_id") or request.headers.get("X-Device-ID")
+    if not device_id:
+        return respond(request, HEARTBEAT, {"status": "error", "message": "device_id is required"}, status=400)
+
+    message.setdefault("ip", request.META.get("REMOTE_ADDR"))
+    try:
+        get_fleet().heartbeat(device_id, message)
+    except InvalidDeviceIdError as e:
+        return respond(request, HEARTBEAT, {"status": "error", "message": str(e)}, status=400)
+
+    return respond(request, HEARTBEAT, {
+        "status": "success",
+        "server_time": datetime.now(timezone.utc).isoformat(),
+        "heartbeat_interval": settings.DEVICE_HEARTBEAT_SECONDS,
+    })
+
+
+@csrf_exempt
+def fleet_status(request):
+    """List every known device with its last-seen time and online/offline status"""
+    if request.method != "GET":
+        return _json_error("Method not allowed", status=405)
+
+    try:
+        db = get_firestore_db()
+    except FirebaseCredentialsError as e:
+        return JsonResponse({"status": "error", "message": str(e)}, status=500)
+
+    # Persisted state covers every worker; this worker's table may be newer.
+    devices = {}
+    for doc in db.collection(DEVICES_COLLECTION).stream():
+        devices[doc.id] = dict(doc.to_dict(), device_id=doc.id)
+
+    for device_id, state in get_fleet().local_state().items():
+        persisted = devices.get(device_id, {})
+        if (state.get("last_seen") or "") >= (persisted.get("last_seen") or ""):
+            devices[device_id] = dict(persisted, **state)
+
+    now = datetime.now(timezone.utc)
+    result = []
+    for device_id in sorted(devices):
+        state = devices[device_id]
+        state["status"] = device_status(state, settings.DEVICE_OFFLINE_AFTER_SECONDS, now)
+        result.append(state)
+
+    online = sum(1 for state in result if state["status"] == "online")
+    return JsonResponse({
+        "status": "success",
+        "devices": result,
+        "count": len(result),
+        "online": online,
+        "offline": len(result) - online,
+    })
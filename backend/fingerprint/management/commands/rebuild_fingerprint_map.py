@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from firebase_config.firebase import FirebaseCredentialsError, get_firestore_db
+from fingerprint.mapping import rebuild_fingerprint_map
+
+
+class Command(BaseCommand):
+    help = "Backfill or repair the fingerprint_map collection from users."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report what would change without writing to Firestore.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            db = get_firestore_db()
+        except FirebaseCredentialsError as e:
+            raise CommandError(str(e))
+
+        report = rebuild_fingerprint_map(db, dry_run=options["dry_run"])
+
+        if options["dry_run"]:
+            summary = "Would write {written} map entries and delete {deleted} orphaned ones."
+        else:
+            summary = "Wrote {written} map entries, deleted {deleted} orphaned ones."
+        self.stdout.write(summary.format(**report))
+        for conflict in report["conflicts"]:
+            self.stdout.write(self.style.WARNING(
+                f"fingerprint_id {conflict['fingerprint_id']} kept for {conflict['owner']}; "
+                f"re-enroll: {', '.join(conflict['others'])}"
+            ))
+        if not report["conflicts"]:
+            self.stdout.write(self.style.SUCCESS("No duplicate fingerprint ids."))
@@ -0,0 +1,395 @@
+"""
+Denormalized ``fingerprint_map/{fingerprint_id}`` index.
+
+Each document maps one sensor fingerprint id to the user that owns it, so a
+scan resolves with a single document get instead of a ``where`` query on
+``users``. Every write that binds or releases an id runs in a transaction
+that checks the current owner first, which is what guarantees two users can
+never share a fingerprint id. The same transactions keep the free-slot
+bitmaps in ``fingerprint_slots`` in step (see ``slots``).
+"""
+import logging
+from datetime import datetime, timezone
+
+from django.conf import settings
+from firebase_admin import firestore
+from google.api_core.exceptions import AlreadyExists
+
+from fingerprint import slots
+
+
+logger = logging.getLogger(__name__)
+
+FINGERPRINT_MAP_COLLECTION = "fingerprint_map"
+
+
+class FingerprintConflictError(Exception):
+    """Raised when a fingerprint id is already bound to another user."""
+
+    def __init__(self, fingerprint_id: int, owner_uid: str):
+        self.fingerprint_id = fingerprint_id
+        self.owner_uid = owner_uid
+        super().__init__(
+            f"fingerprint_id {fingerprint_id} is already registered to {owner_uid}"
+        )
+
+
+class UnknownUserError(LookupError):
+    """Raised when binding a fingerprint to a user that doesn't exist."""
+
+
+def map_ref(db, fingerprint_id):
+    return db.collection(FINGERPRINT_MAP_COLLECTION).document(str(fingerprint_id))
+
+
+def map_entry(user: dict) -> dict:
+    """The subset of a user document a scan needs, keyed by fingerprint id."""
+    return {
+        "fingerprint_id": user.get("fingerprint_id"),
+        "uid": user.get("uid"),
+        "name": user.get("name"),
+        "role": user.get("role"),
+        "updated_at": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+def _pool_of(user: dict) -> str:
+    return user.get("fingerprint_pool") or settings.FINGERPRINT_SLOT_POOL
+
+
+def _remember(changes):
+    cache = slots.get_slot_cache()
+    for pool in changes.changed():
+        cache.store(pool)
+
+
+def find_user_by_fingerprint(db, fingerprint_id: int):
+    """Resolve a fingerprint id to ``{"uid", "name", "role", ...}`` or None.
+
+    ``fingerprint_map`` is the only authority: it is what the binding
+    transactions keep unique, so no cached roster is consulted here. On a
+    map miss the user is looked up with a ``users`` query, as before the map
+    existed, and the entry is written for next time, so ids registered before
+    ``rebuild_fingerprint_map`` ran still resolve. An id claimed by several
+    users stays unresolved until the map is rebuilt.
+    """
+    snapshot = map_ref(db, fingerprint_id).get()
+    if snapshot.exists:
+        return snapshot.to_dict()
+
+    claimants = list(db.collection("users").where("fingerprint_id", "==", fingerprint_id).limit(2).stream())
+    if len(claimants) != 1:
+        if claimants:
+            logger.warning(
+                "fingerprint_id %s is claimed by several users; run rebuild_fingerprint_map", fingerprint_id
+            )
+        return None
+
+    user = claimants[0].to_dict()
+    user.setdefault("uid", claimants[0].id)
+    entry = map_entry(user)
+    try:
+        # create() never overwrites a binding made since the map was read.
+        map_ref(db, fingerprint_id).create(entry)
+    except AlreadyExists:
+        snapshot = map_ref(db, fingerprint_id).get()
+        return snapshot.to_dict() if snapshot.exists else None
+    return entry
+
+
+def _claim(transaction, db, uid: str, fingerprint_id: int, previous_fingerprint_id):
+    """Read phase shared by every bind: check ownership, find the entry to release.
+
+    Firestore transactions require all reads before any write, so this only
+    reads and returns the stale map reference (if any) for the caller to delete.
+    """
+    owner = map_ref(db, fingerprint_id).get(transaction=transaction)
+    owner_uid = owner.to_dict().get("uid") if owner.exists else None
+    if owner_uid is not None and owner_uid != uid:
+        raise FingerprintConflictError(fingerprint_id, owner_uid)
+
+    if previous_fingerprint_id is None or previous_fingerprint_id == fingerprint_id:
+        return None
+
+    stale_ref = map_ref(db, previous_fingerprint_id)
+    stale = stale_ref.get(transaction=transaction)
+    if stale.exists and stale.to_dict().get("uid") == uid:
+        return stale_ref
+    return None
+
+
+@firestore.transactional
+def _register_in_transaction(transaction, db, user_doc: dict):
+    user_ref = db.collection("users").document(user_doc["uid"])
+    existing = user_ref.get(transaction=transaction)
+    existing_data = existing.to_dict() if existing.exists else {}
+    previous = existing_data.get("fingerprint_id")
+
+    stale_ref = _claim(transaction, db, user_doc["uid"], user_doc["fingerprint_id"], previous)
+
+    pools = slots.PoolChanges(transaction, db)
+    pools.mark(_pool_of(user_doc), user_doc["fingerprint_id"])
+    if stale_ref is not None:
+        pools.clear(_pool_of(existing_data), previous)
+
+    if stale_ref is not None:
+        transaction.delete(stale_ref)
+    transaction.set(user_ref, user_doc, merge=True)
+    transaction.set(map_ref(db, user_doc["fingerprint_id"]), map_entry(user_doc))
+    pools.write()
+    return pools
+
+
+def register_user_fingerprint(db, user_doc: dict):
+    """Write ``users/{uid}`` and its fingerprint map entry atomically.
+
+    Re-registering a user with a new fingerprint id releases the old one.
+    Raises FingerprintConflictError if the id belongs to someone else.
+    """
+    _remember(_register_in_transaction(db.transaction(), db, user_doc))
+
+
+@firestore.transactional
+def _enroll_in_transaction(transaction, db, fingerprint_doc: dict, uid, pool: str):
+    fingerprint_id = fingerprint_doc["fingerprint_id"]
+    fingerprint_ref = db.collection("fingerprints").document(str(fingerprint_id))
+    pools = slots.PoolChanges(transaction, db)
+
+    if uid is None:
+        # Template-only enrollment: keep whatever owner the id already has.
+        owner = map_ref(db, fingerprint_id).get(transaction=transaction)
+        if owner.exists:
+            fingerprint_doc["uid"] = owner.to_dict().get("uid")
+        pools.mark(pool, fingerprint_id)
+        transaction.set(fingerprint_ref, fingerprint_doc, merge=True)
+        pools.write()
+        return pools
+
+    user_ref = db.collection("users").document(uid)
+    user = user_ref.get(transaction=transaction)
+    if not user.exists:
+        raise UnknownUserError(uid)
+    user_data = user.to_dict()
+    previous = user_data.get("fingerprint_id")
+
+    stale_ref = _claim(transaction, db, uid, fingerprint_id, previous)
+
+    pools.mark(pool, fingerprint_id)
+    if stale_ref is not None:
+        pools.clear(_pool_of(user_data), previous)
+
+    user_data["fingerprint_id"] = fingerprint_id
+    user_data["fingerprint_pool"] = pool
+    fingerprint_doc["uid"] = uid
+
+    if stale_ref is not None:
+        transaction.delete(stale_ref)
+    transaction.set(fingerprint_ref, fingerprint_doc, merge=True)
+    transaction.update(user_ref, {
+        "fingerprint_id": fingerprint_id,
+        "fingerprint_pool": pool,
+        "updated_at": datetime.now(timezone.utc).isoformat(),
+    })
+    transaction.set(map_ref(db, fingerprint_id), map_entry(user_data))
+    pools.write()
+    return pools
+
+
+def enroll_fingerprint_template(db, fingerprint_doc: dict, uid=None, pool=None):
+    """Store ``fingerprints/{id}`` and, when ``uid`` is given, bind the id to that user."""
+    pool = pool or settings.FINGERPRINT_SLOT_POOL
+    _remember(_enroll_in_transaction(db.transaction(), db, fingerprint_doc, uid, pool))
+
+
+@firestore.transactional
+def _delete_in_transaction(transaction, db, uid: str) -> bool:
+    user_ref = db.collection("users").document(uid)
+    user = user_ref.get(transaction=transaction)
+    if not user.exists:
+        return False
+
+    user_data = user.to_dict()
+    fingerprint_id = user_data.get("fingerprint_id")
+    owned_ref = None
+    pools = slots.PoolChanges(transaction, db)
+    if fingerprint_id is not None:
+        entry_ref = map_ref(db, fingerprint_id)
+        entry = entry_ref.get(transaction=transaction)
+        if entry.exists and entry.to_dict().get("uid") == uid:
+            owned_ref = entry_ref
+            pools.clear(_pool_of(user_data), fingerprint_id)
+
+    if owned_ref is not None:
+        transaction.delete(owned_ref)
+    transaction.delete(user_ref)
+    # Tombstone so roster mirrors catching up incrementally see the deletion.
+    transaction.set(db.collection("deleted_users").document(uid), {
+        "uid": uid,
+        "deleted_at": datetime.now(timezone.utc).isoformat(),
+    })
+    pools.write()
+    return pools
+
+
+def delete_user(db, uid: str) -> bool:
+    """Delete ``users/{uid}`` and release its fingerprint id. False if no such user."""
+    pools = _delete_in_transaction(db.transaction(), db, uid)
+    if pools is False:
+        return False
+    _remember(pools)
+    return True
+
+
+def create_slot_pool(db, name: str, capacity: int, first: int) -> slots.SlotPool:
+    """Create ``fingerprint_slots/{name}`` with the ids already in ``fingerprint_map`` taken.
+
+    If another worker creates the pool first, its document wins.
+    """
+    pool = slots.SlotPool(name, first, capacity)
+    for doc in db.collection(FINGERPRINT_MAP_COLLECTION).stream():
+        if doc.id.isdigit():
+            pool.mark(int(doc.id))
+    try:
+        slots.pool_ref(db, name).create(pool.to_doc())
+    except AlreadyExists:
+        pool = slots.SlotPool.from_doc(name, slots.pool_ref(db, name).get().to_dict())
+    slots.get_slot_cache().store(pool)
+    return pool
+
+
+@firestore.transactional
+def _allocate_in_transaction(transaction, db, name: str):
+    snapshot = slots.pool_ref(db, name).get(transaction=transaction)
+    if not snapshot.exists:
+        raise slots.UnknownPoolError(name)
+    pool = slots.SlotPool.from_doc(name, snapshot.to_dict())
+
+    while True:
+        fingerprint_id = pool.lowest_free()
+        if fingerprint_id is None:
+            raise slots.SlotPoolFullError(name)
+        pool.mark(fingerprint_id)
+        # An id bound without going through the pool stays marked and is skipped.
+        if not map_ref(db, fingerprint_id).get(transaction=transaction).exists:
+            break
+
+    transaction.set(slots.pool_ref(db, name), pool.to_doc())
+    return pool, fingerprint_id
+
+
+def allocate_slot(db, name: str, capacity=None, first=None) -> int:
+    """Take the lowest free fingerprint id in pool ``name``, creating the pool on first use.
+
+    ``capacity`` and ``first`` only apply when the pool is created. Raises
+    SlotPoolFullError when every slot is taken.
+    """
+    cache = slots.get_slot_cache()
+    cached = cache.get(name)
+    if cached is not None and cached.lowest_free() is None:
+        raise slots.SlotPoolFullError(name)
+    if cached is None:
+        try:
+            slots.load_pool(db, name)
+        except slots.UnknownPoolError:
+            create_slot_pool(
+                db,
+                name,
+                capacity or settings.FINGERPRINT_SLOT_CAPACITY,
+                settings.FINGERPRINT_SLOT_FIRST if first is None else first,
+            )
+
+    pool, fingerprint_id = _allocate_in_transaction(db.transaction(), db, name)
+    cache.store(pool)
+    return fingerprint_id
+
+
+@firestore.transactional
+def _release_in_transaction(transaction, db, name: str, fingerprint_id: int):
+    snapshot = slots.pool_ref(db, name).get(transaction=transaction)
+    if not snapshot.exists:
+        raise slots.UnknownPoolError(name)
+    owner = map_ref(db, fingerprint_id).get(transaction=transaction)
+    if owner.exists:
+        raise FingerprintConflictError(fingerprint_id, owner.to_dict().get("uid"))
+
+    pool = slots.SlotPool.from_doc(name, snapshot.to_dict())
+    if pool.clear(fingerprint_id):
+        transaction.set(slots.pool_ref(db, name), pool.to_doc())
+    return pool
+
+
+def release_slot(db, name: str, fingerprint_id: int) -> slots.SlotPool:
+    """Free an allocated id nobody was registered with (e.g. an abandoned enrollment).
+
+    Raises FingerprintConflictError while a user still owns the id.
+    """
+    pool = _release_in_transaction(db.transaction(), db, name, fingerprint_id)
+    slots.get_slot_cache().store(pool)
+    return pool
+
+
+def rebuild_fingerprint_map(db, dry_run: bool = False) -> dict:
+    """Backfill/repair ``fingerprint_map`` from ``users``.
+
+    When several users claim the same id, the current map owner wins if it is
+    one of them, otherwise the earliest registered user. The losers are
+    reported so they can be re-enrolled with a free id.
+    """
+    claimants = {}
+    for doc in db.collection("users").stream():
+        user = doc.to_dict()
+        user.setdefault("uid", doc.id)
+        fingerprint_id = user.get("fingerprint_id")
+        if fingerprint_id is None:
+            continue
+        claimants.setdefault(int(fingerprint_id), []).append(user)
+
+    existing = {}
+    for doc in db.collection(FINGERPRINT_MAP_COLLECTION).stream():
+        existing[doc.id] = doc.to_dict()
+
+    writes, deletes, conflicts = [], [], []
+    for fingerprint_id, users in claimants.items():
+        current = existing.pop(str(fingerprint_id), None)
+        current_uid = current.get("uid") if current else None
+
+        owner = next((u for u in users if u.get("uid") == current_uid), None)
+        if owner is None:
+            owner = min(users, key=lambda u: u.get("created_at") or "")
+
+        if len(users) > 1:
+            conflicts.append({
+                "fingerprint_id": fingerprint_id,
+                "owner": owner.get("uid"),
+                "others": sorted(u.get("uid") for u in users if u is not owner),
+            })
+
+        entry = map_entry(owner)
+        if current is None or any(current.get(k) != entry[k] for k in ("uid", "name", "role", "fingerprint_id")):
+            writes.append((fingerprint_id, entry))
+
+    # Whatever is left in the map no longer belongs to any user.
+    deletes.extend(existing.keys())
+
+    if not dry_run:
+        batch, pending = db.batch(), 0
+        for fingerprint_id, entry in writes:
+            batch.set(map_ref(db, fingerprint_id), entry)
+            pending += 1
+            if pending == 500:
+                batch.commit()
+                batch, pending = db.batch(), 0
+        for doc_id in deletes:
+            batch.delete(db.collection(FINGERPRINT_MAP_COLLECTION).document(doc_id))
+            pending += 1
+            if pending == 500:
+                batch.commit()
+                batch, pending = db.batch(), 0
+        if pending:
+            batch.commit()
+
+    return {
+        "written": len(writes),
+        "deleted": len(deletes),
+        "conflicts": conflicts,
+    }
@@ -0,0 +1,221 @@
+"""
+Fingerprint slot pools backed by a free-slot bitmap.
+
+``fingerprint_slots/{pool}`` has one bit per sensor slot::
+
+    {pool, first, capacity, bits (bytes, little-endian), used, updated_at}
+
+Bit ``i`` set means fingerprint id ``first + i`` is taken. Finding a free
+slot is ``bitsets.lowest_clear_bit`` over the bitmap as a Python int, a few
+word operations, instead of a scan of ``users``. The transactions that
+allocate, bind and release ids live in ``mapping`` next to the rest of the
+``fingerprint_map`` writes; this module holds the bitmap itself and a
+per-worker cache of it.
+
+A user's pool is stored on the user as ``fingerprint_pool`` (default
+``FINGERPRINT_SLOT_POOL``), so deleting them frees the right slot.
+"""
+import re
+import threading
+import time
+from datetime import datetime, timezone
+
+from django.conf import settings
+
+from backend_project.bitsets import from_bytes, lowest_clear_bit, popcount, to_bytes
+
+
+SLOTS_COLLECTION = "fingerprint_slots"
+POOL_NAME = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+class SlotPoolFullError(Exception):
+    """Raised when every slot in a pool is taken."""
+
+    def __init__(self, pool: str):
+        self.pool = pool
+        super().__init__(f"No free fingerprint slots in pool {pool}")
+
+
+class UnknownPoolError(LookupError):
+    """Raised for a pool that hasn't been created yet."""
+
+
+def pool_ref(db, name: str):
+    return db.collection(SLOTS_COLLECTION).document(name)
+
+
+def pool_name(name) -> str:
+    """``name`` or the default pool; raises ValueError for names that can't be document ids."""
+    name = name or settings.FINGERPRINT_SLOT_POOL
+    if not POOL_NAME.match(str(name)):
+        raise ValueError("pool must be 1-64 letters, digits, '-' or '_'")
+    return str(name)
+
+
+class SlotPool:
+    def __init__(self, name: str, first: int, capacity: int, bits: int = 0):
+        self.name = name
+        self.first = first
+        self.capacity = capacity
+        self.bits = bits
+
+    @classmethod
+    def from_doc(cls, name: str, data: dict):
+        return cls(name, int(data.get("first", 0)), int(data["capacity"]), from_bytes(data.get("bits")))
+
+    def to_doc(self) -> dict:
+        return {
+            "pool": self.name,
+            "first": self.first,
+            "capacity": self.capacity,
+            "bits": to_bytes(self.bits, (self.capacity + 7) // 8),
+            "used": self.used,
+            "updated_at": datetime.now(timezone.utc).isoformat(),
+        }
+
+    def copy(self):
+        return SlotPool(self.name, self.first, self.capacity, self.bits)
+
+    def _index(self, fingerprint_id: int):
+        index = int(fingerprint_id) - self.first
+        return index if 0 <= index < self.capacity else None
+
+    def contains(self, fingerprint_id: int) -> bool:
+        return self._index(fingerprint_id) is not None
+
+    def is_taken(self, fingerprint_id: int) -> bool:
+        index = self._index(fingerprint_id)
+        return index is not None and bool(self.bits >> index & 1)
+
+    def mark(self, fingerprint_id: int) -> bool:
+        """Take ``fingerprint_id``; False if it was already taken or is outside the pool."""
+        index = self._index(fingerprint_id)
+        if index is None or self.bits >> index & 1:
+            return False
+        self.bits |= 1 << index
+        return True
+
+    def clear(self, fingerprint_id: int) -> bool:
+        """Free ``fingerprint_id``; False if it was already free or is outside the pool."""
+        index = self._index(fingerprint_id)
+        if index is None or not self.bits >> index & 1:
+            return False
+        self.bits &= ~(1 << index)
+        return True
+
+    def lowest_free(self):
+        """The lowest free fingerprint id, or None when the pool is full."""
+        index = lowest_clear_bit(self.bits)
+        return self.first + index if index < self.capacity else None
+
+    @property
+    def used(self) -> int:
+        return popcount(self.bits)
+
+    def summary(self) -> dict:
+        return {
+            "pool": self.name,
+            "first": self.first,
+            "capacity": self.capacity,
+            "used": self.used,
+            "free": self.capacity - self.used,
+            "next_free": self.lowest_free(),
+        }
+
+
+class PoolChanges:
+    """Bitmap updates made inside a user transaction.
+
+    ``mark``/``clear`` read a pool on first touch, so call them in the
+    transaction's read phase; ``write`` queues the changed bitmaps. A pool
+    that doesn't exist yet is left alone: it is seeded from
+    ``fingerprint_map`` when it is created.
+    """
+
+    def __init__(self, transaction, db):
+        self._transaction = transaction
+        self._db = db
+        self._pools = {}
+        self._changed = set()
+
+    def _pool(self, name: str):
+        if name not in self._pools:
+            snapshot = pool_ref(self._db, name).get(transaction=self._transaction)
+            self._pools[name] = SlotPool.from_doc(name, snapshot.to_dict()) if snapshot.exists else None
+        return self._pools[name]
+
+    def mark(self, name: str, fingerprint_id: int):
+        pool = self._pool(name)
+        if pool is not None and pool.mark(fingerprint_id):
+            self._changed.add(name)
+
+    def clear(self, name: str, fingerprint_id: int):
+        pool = self._pool(name)
+        if pool is not None and pool.clear(fingerprint_id):
+            self._changed.add(name)
+
+    def write(self):
+        for name in self._changed:
+            self._transaction.set(pool_ref(self._db, name), self._pools[name].to_doc())
+
+    def changed(self) -> list:
+        return [self._pools[name] for name in self._changed]
+
+
+class SlotCache:
+    """Per-worker copies of pool bitmaps, trusted for ``ttl`` seconds.
+
+    Serves status reads and turns away allocations from a pool already known
+    to be full; allocations themselves always re-read the pool in their
+    transaction.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._pools = {}
+
+    def get(self, name: str):
+        with self._lock:
+            entry = self._pools.get(name)
+            if entry is None or time.monotonic() - entry[1] > self.ttl:
+                return None
+            return entry[0].copy()
+
+    def store(self, pool: SlotPool):
+        with self._lock:
+            self._pools[pool.name] = (pool.copy(), time.monotonic())
+
+    def forget(self, name: str):
+        with self._lock:
+            self._pools.pop(name, None)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_slot_cache() -> SlotCache:
+    global _cache
+
+    if _cache is not None:
+        return _cache
+
+    with _cache_lock:
+        if _cache is None:
+            _cache = SlotCache(settings.FINGERPRINT_SLOT_CACHE_SECONDS)
+    return _cache
+
+
+def load_pool(db, name: str) -> SlotPool:
+    """The pool from the cache or Firestore; raises UnknownPoolError."""
+    cache = get_slot_cache()
+    pool = cache.get(name)
+    if pool is None:
+        snapshot = pool_ref(db, name).get()
+        if not snapshot.exists:
+            raise UnknownPoolError(name)
+        pool = SlotPool.from_doc(name, snapshot.to_dict())
+        cache.store(pool)
+    return pool
@@ -1,3 +1,78 @@
-from django.test import TestCase
+from django.test import SimpleTestCase
 
-# Create your tests here.
+from firebase_config.testing import use_fake_firestore
+from fingerprint.mapping import find_user_by_fingerprint, register_user_fingerprint
+from fingerprint.slots import SlotPool
+
+
+def student(uid: str, fingerprint_id: int, **fields) -> dict:
+    return dict({"uid": uid, "name": uid.title(), "role": "student", "fingerprint_id": fingerprint_id}, **fields)
+
+
+class FindUserByFingerprintTests(SimpleTestCase):
+    def setUp(self):
+        self.db = use_fake_firestore()
+
+    def test_map_owner_wins_over_duplicate_claims(self):
+        users = self.db.data.setdefault("users", {})
+        users["ann"] = student("ann", 5, created_at="2024-01-01")
+        # ann's document claims the id too, but only bob's binding went through the map.
+        register_user_fingerprint(self.db, student("bob", 5))
+        self.assertEqual(find_user_by_fingerprint(self.db, 5)["uid"], "bob")
+
+    def test_rebinding_moves_ownership(self):
+        register_user_fingerprint(self.db, student("ann", 5))
+        register_user_fingerprint(self.db, student("ann", 6))
+        self.assertIsNone(find_user_by_fingerprint(self.db, 5))
+        self.assertEqual(find_user_by_fingerprint(self.db, 6)["uid"], "ann")
+
+    def test_map_miss_falls_back_to_users_and_backfills(self):
+        self.db.data["users"] = {"ann": student("ann", 9)}
+        self.assertEqual(find_user_by_fingerprint(self.db, 9)["uid"], "ann")
+        self.assertEqual(self.db.document_data("fingerprint_map", "9")["uid"], "ann")
+
+        queries = self.db.queries
+        self.assertEqual(find_user_by_fingerprint(self.db, 9)["name"], "Ann")
+        self.assertEqual(self.db.queries, queries)
+
+    def test_map_miss_with_duplicate_claims_stays_unresolved(self):
+        self.db.data["users"] = {"ann": student("ann", 9), "bob": student("bob", 9)}
+        with self.assertLogs("fingerprint.mapping", "WARNING"):
+            self.assertIsNone(find_user_by_fingerprint(self.db, 9))
+        self.assertIsNone(self.db.document_data("fingerprint_map", "9"))
+
+    def test_unknown_fingerprint(self):
+        self.assertIsNone(find_user_by_fingerprint(self.db, 404))
+
+
+class SlotPoolTests(SimpleTestCase):
+    def test_lowest_free_skips_taken_ids(self):
+        pool = SlotPool("default", first=10, capacity=4)
+        self.assertEqual(pool.lowest_free(), 10)
+        self.assertTrue(pool.mark(10))
+        self.assertTrue(pool.mark(12))
+        self.assertEqual(pool.lowest_free(), 11)
+        self.assertEqual(pool.used, 2)
+
+    def test_mark_and_clear_report_changes(self):
+        pool = SlotPool("default", first=1, capacity=2)
+        self.assertTrue(pool.mark(1))
+        self.assertFalse(pool.mark(1))
+        self.assertFalse(pool.mark(3))
+        self.assertFalse(pool.clear(2))
+        self.assertTrue(pool.clear(1))
+        self.assertFalse(pool.is_taken(1))
+
+    def test_full_pool(self):
+        pool = SlotPool("default", first=1, capacity=2)
+        pool.mark(1)
+        pool.mark(2)
+        self.assertIsNone(pool.lowest_free())
+        self.assertEqual(pool.summary()["free"], 0)
+
+    def test_document_round_trip(self):
+        pool = SlotPool("default", first=1, capacity=20)
+        for fingerprint_id in (1, 9, 20):
+            pool.mark(fingerprint_id)
+        copy = SlotPool.from_doc("default", pool.to_doc())
+        self.assertEqual((copy.first, copy.capacity, copy.bits), (1, 20, pool.bits))
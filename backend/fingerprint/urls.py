@@ -4,4 +4,7 @@ from . import views
 urlpatterns = [
     path("verify/<int:fingerprint_id>/", views.verify_fingerprint, name="verify_fingerprint"),
     path("enroll/", views.enroll_fingerprint, name="enroll_fingerprint"),
+    path("slots/", views.slot_pool, name="slot_pool"),
+    path("slots/allocate/", views.allocate_fingerprint_slot, name="allocate_fingerprint_slot"),
+    path("slots/release/", views.release_fingerprint_slot, name="release_fingerprint_slot"),
 ]
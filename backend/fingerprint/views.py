@@ -4,21 +4,27 @@ from datetime import datetime, timezone
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 
+from backend_project.admission import admission_controlled
+from backend_project.breaker import stale_on_failure
+from backend_project.idempotency import idempotent
 from firebase_config.firebase import FirebaseCredentialsError, get_firestore_db
+from fingerprint.mapping import (
+    FingerprintConflictError,
+    UnknownUserError,
+    allocate_slot,
+    enroll_fingerprint_template,
+    find_user_by_fingerprint,
+    release_slot,
+)
+from fingerprint.slots import SlotPoolFullError, UnknownPoolError, load_pool, pool_name
 
 
 def _json_error(message, status=400):
     return JsonResponse({"status": "error", "message": message}, status=status)
 
 
-def _find_user_by_fingerprint(db, fingerprint_id: int):
-    q = db.collection("users").where("fingerprint_id", "==", fingerprint_id).limit(1)
-    docs = list(q.stream())
-    if not docs:
-        return None
-    return docs[0].to_dict()
-
-
+@admission_controlled
+@stale_on_failure
 def verify_fingerprint(request, fingerprint_id: int):
     if request.method != "GET":
         return _json_error("Method not allowed", status=405)
@@ -27,7 +33,7 @@ def verify_fingerprint(request, fingerprint_id: int):
         db = get_firestore_db()
     except FirebaseCredentialsError as e:
         return JsonResponse({"status": "error", "message": str(e)}, status=500)
-    user = _find_user_by_fingerprint(db, int(fingerprint_id))
+    user = find_user_by_fingerprint(db, int(fingerprint_id))
 
     if not user:
         return JsonResponse({"status": "error", "message": "Fingerprint not found"}, status=404)
@@ -43,6 +49,8 @@ def verify_fingerprint(request, fingerprint_id: int):
 
 
 @csrf_exempt
+@idempotent
+@admission_controlled
 def enroll_fingerprint(request):
     if request.method != "POST":
         return _json_error("Method not allowed", status=405)
@@ -55,10 +63,16 @@ def enroll_fingerprint(request):
     fingerprint_id = payload.get("fingerprint_id") or payload.get("fingerprintId")
     template = payload.get("template") or payload.get("fingerprint_template")
     device_id = payload.get("device_id") or payload.get("deviceId")
+    uid = payload.get("uid") or payload.get("student_id")
 
     if fingerprint_id is None:
         return _json_error("fingerprint_id is required")
 
+    try:
+        pool = pool_name(payload.get("pool"))
+    except ValueError as e:
+        return _json_error(str(e))
+
     try:
         fingerprint_id = int(fingerprint_id)
     except (TypeError, ValueError):
@@ -76,13 +90,123 @@ def enroll_fingerprint(request):
         "created_at": datetime.now(timezone.utc).isoformat(),
     }
 
-    # Store by fingerprint id
-    db.collection("fingerprints").document(str(fingerprint_id)).set(doc, merge=True)
+    # Store by fingerprint id; binding to a user also updates fingerprint_map.
+    try:
+        enroll_fingerprint_template(db, doc, uid=str(uid) if uid else None, pool=pool)
+    except UnknownUserError:
+        return _json_error("User not found", status=404)
+    except FingerprintConflictError as e:
+        return _json_error(str(e), status=409)
 
     return JsonResponse(
         {
             "status": "success",
             "message": "Fingerprint enrolled",
             "fingerprint_id": fingerprint_id,
+            "uid": doc.get("uid"),
         }
     )
+
+
+def _slot_payload(request):
+    try:
+        payload = json.loads(request.body.decode("utf-8") or "{}")
+    except json.JSONDecodeError:
+        raise ValueError("Invalid JSON")
+    if not isinstance(payload, dict):
+        raise ValueError("Invalid JSON")
+    return payload
+
+
+@csrf_exempt
+def slot_pool(request):
+    """Free/used counts and the next free id of a fingerprint slot pool."""
+    if request.method != "GET":
+        return _json_error("Method not allowed", status=405)
+
+    try:
+        pool = pool_name(request.GET.get("pool"))
+    except ValueError as e:
+        return _json_error(str(e))
+
+    try:
+        db = get_firestore_db()
+    except FirebaseCredentialsError as e:
+        return JsonResponse({"status": "error", "message": str(e)}, status=500)
+
+    try:
+        summary = load_pool(db, pool).summary()
+    except UnknownPoolError:
+        return _json_error("Pool not found", status=404)
+
+    return JsonResponse({"status": "success", **summary})
+
+
+@csrf_exempt
+def allocate_fingerprint_slot(request):
+    """Reserve the lowest free fingerprint id in a pool, creating the pool on first use."""
+    if request.method != "POST":
+        return _json_error("Method not allowed", status=405)
+
+    try:
+        payload = _slot_payload(request)
+        pool = pool_name(payload.get("pool"))
+    except ValueError as e:
+        return _json_error(str(e))
+
+    # Only used when this call creates the pool.
+    capacity, first = payload.get("capacity"), payload.get("first")
+    try:
+        capacity = int(capacity) if capacity is not None else None
+        first = int(first) if first is not None else None
+    except (TypeError, ValueError):
+        return _json_error("capacity and first must be integers")
+    if capacity is not None and capacity <= 0:
+        return _json_error("capacity must be positive")
+
+    try:
+        db = get_firestore_db()
+    except FirebaseCredentialsError as e:
+        return JsonResponse({"status": "error", "message": str(e)}, status=500)
+
+    try:
+        fingerprint_id = allocate_slot(db, pool, capacity=capacity, first=first)
+    except SlotPoolFullError as e:
+        return _json_error(str(e), status=409)
+
+    return JsonResponse({"status": "success", "pool": pool, "fingerprint_id": fingerprint_id}, status=201)
+
+
+@csrf_exempt
+def release_fingerprint_slot(request):
+    """Give back an allocated fingerprint id that was never registered to a user."""
+    if request.method != "POST":
+        return _json_error("Method not allowed", status=405)
+
+    try:
+        payload = _slot_payload(request)
+        pool = pool_name(payload.get("pool"))
+    except ValueError as e:
+        return _json_error(str(e))
+
+    fingerprint_id = payload.get("fingerprint_id") or payload.get("fingerprintId")
+    if fingerprint_id is None:
+        return _json_error("fingerprint_id is required")
+    try:
+        fingerprint_id = int(fingerprint_id)
+    except (TypeError, ValueError):
+        return _json_error("fingerprint_id must be an integer")
+
+    try:
+        db = get_firestore_db()
+    except FirebaseCredentialsError as e:
+        return JsonResponse({"status": "error", "message": str(e)}, status=500)
+
+    try:
+        summary = release_slot(db, pool, fingerprint_id).summary()
+    except UnknownPoolError:
+        return _json_error("Pool not found", status=404)
+    except FingerprintConflictError as e:
+        return _json_error(str(e), status=409)
+
+    return JsonResponse({"status": "success", **summary})
@@ -5,6 +5,8 @@ import firebase_admin
 from firebase_admin import credentials
 from firebase_admin import firestore
 
+from firebase_config import query_recorder
+
 
 _db = None
 
@@ -19,6 +21,8 @@ def get_firestore_db():
     Rules:
     - No Django ORM.
     - Credentials loaded from backend/firebase-credentials.json (by default).
+    - With FIRESTORE_EMULATOR_HOST set and no credentials file, talks to the emulator.
+    - Queries are timed when FIRESTORE_QUERY_LOG or PROFILE_ENABLED is set (see query_recorder).
     """
     global _db
 
@@ -33,17 +37,25 @@ def get_firestore_db():
         str(base_dir / "firebase-credentials.json"),
     )
 
-    if not firebase_admin._apps:
-        if not os.path.exists(cred_path):
-            raise FirebaseCredentialsError(
-                f"Firebase credentials not found at '{cred_path}'. "
-                "Place firebase-credentials.json in backend/ or set FIREBASE_CREDENTIALS_PATH."
-            )
-
-        cred = credentials.Certificate(cred_path)
-        firebase_admin.initialize_app(cred)
-
-    _db = firestore.client()
+    if os.environ.get("FIRESTORE_EMULATOR_HOST") and not os.path.exists(cred_path):
+        # The emulator accepts anonymous credentials; no service account needed.
+        client = firestore.Client(project=os.environ.get("GCLOUD_PROJECT", "demo-attendance"))
+    else:
+        if not firebase_admin._apps:
+            if not os.path.exists(cred_path):
+                raise FirebaseCredentialsError(
+                    f"Firebase credentials not found at '{cred_path}'. "
+                    "Place firebase-credentials.json in backend/ or set FIREBASE_CREDENTIALS_PATH."
+                )
+
+            cred = credentials.Certificate(cred_path)
+            firebase_admin.initialize_app(cred)
+
+        client = firestore.client()
+
+    _db = client
+    if query_recorder.enabled():
+        _db = query_recorder.RecordingClient(_db)
     return _db
 
 
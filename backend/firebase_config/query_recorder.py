@@ -0,0 +1,229 @@
+"""
+Opt-in recorder for slow Firestore queries.
+
+Set ``FIRESTORE_QUERY_LOG`` to a file path and ``get_firestore_db()`` returns a
+thin wrapper around the client that times every query it runs. Queries slower
+than ``FIRESTORE_SLOW_QUERY_MS`` (default 100) are appended to the log as one
+JSON line each: the query shape (collection, filter fields/operators,
+ordering, limit), duration and documents returned. Filter values are left
+out so identical shapes aggregate together; ``manage.py firestore_slow_queries``
+turns the log into a top-N report.
+
+With ``PROFILE_ENABLED`` set the client is wrapped too, and every query a
+profiled request runs is collected for its profile (see
+``backend_project/profiling.py``), whatever its duration.
+
+Document references are never wrapped, so transactions and batches receive
+the real objects.
+"""
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+
+_write_lock = threading.Lock()
+_collected = contextvars.ContextVar("firestore_collected_queries", default=None)
+
+
+def log_path():
+    return os.environ.get("FIRESTORE_QUERY_LOG") or None
+
+
+def threshold_ms() -> float:
+    return float(os.environ.get("FIRESTORE_SLOW_QUERY_MS", "100"))
+
+
+def max_log_bytes() -> int:
+    return int(os.environ.get("FIRESTORE_QUERY_LOG_MAX_BYTES", str(50 * 1024 * 1024)))
+
+
+def enabled() -> bool:
+    return log_path() is not None or os.environ.get("PROFILE_ENABLED", "0") == "1"
+
+
+@contextmanager
+def collect():
+    """Collect every query run in this context (and contexts copied from it) into a list."""
+    queries = []
+    token = _collected.set(queries)
+    try:
+        yield queries
+    finally:
+        _collected.reset(token)
+
+
+def shape_key(shape: dict) -> str:
+    """Stable one-line description of a query shape, used to group records."""
+    parts = [shape["collection"]]
+    parts.extend(f"where {field} {op}" for field, op in shape["filters"])
+    parts.extend(f"order_by {field} {direction}" for field, direction in shape["order_by"])
+    if shape["limit"] is not None:
+        parts.append(f"limit {shape['limit']}")
+    if shape.get("aggregate"):
+        parts.append(shape["aggregate"])
+    return " | ".join(parts)
+
+
+def record(shape: dict, duration_ms: float, documents: int):
+    collected = _collected.get()
+    if collected is not None:
+        collected.append({
+            "shape": shape_key(shape),
+            "duration_ms": round(duration_ms, 2),
+            "documents": documents,
+        })
+
+    path = log_path()
+    if path is None or duration_ms < threshold_ms():
+        return
+
+    line = json.dumps({
+        "at": datetime.now(timezone.utc).isoformat(),
+        "shape": shape_key(shape),
+        "collection": shape["collection"],
+        "duration_ms": round(duration_ms, 2),
+        "documents": documents,
+    })
+    with _write_lock:
+        try:
+            if os.path.getsize(path) > max_log_bytes():
+                os.replace(path, path + ".1")
+        except FileNotFoundError:
+            pass
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+def _direction_name(direction) -> str:
+    return direction if isinstance(direction, str) else getattr(direction, "name", str(direction))
+
+
+class RecordingQuery:
+    """Wraps a Query/CollectionReference, tracking its shape as it is built."""
+
+    def __init__(self, target, shape: dict):
+        self._target = target
+        self._shape = shape
+
+    def _derive(self, target, **changes):
+        shape = dict(self._shape)
+        shape.update(changes)
+        return RecordingQuery(target, shape)
+
+    def where(self, *args, **kwargs):
+        field_filter = kwargs.get("filter")
+        if field_filter is not None and hasattr(field_filter, "field_path"):
+            described = (field_filter.field_path, field_filter.op_string)
+        elif len(args) >= 2:
+            described = (args[0], args[1])
+        else:
+            described = (kwargs.get("field_path", "?"), kwargs.get("op_string", "?"))
+        return self._derive(
+            self._target.where(*args, **kwargs),
+            filters=self._shape["filters"] + [described],
+        )
+
+    def order_by(self, field_path, *args, **kwargs):
+        direction = kwargs.get("direction", args[0] if args else "ASCENDING")
+        return self._derive(
+            self._target.order_by(field_path, *args, **kwargs),
+            order_by=self._shape["order_by"] + [(field_path, _direction_name(direction))],
+        )
+
+    def limit(self, count):
+        return self._derive(self._target.limit(count), limit=count)
+
+    def offset(self, *args, **kwargs):
+        return self._derive(self._target.offset(*args, **kwargs))
+
+    def select(self, *args, **kwargs):
+        return self._derive(self._target.select(*args, **kwargs))
+
+    def start_after(self, *args, **kwargs):
+        return self._derive(self._target.start_after(*args, **kwargs))
+
+    def stream(self, *args, **kwargs):
+        started = time.perf_counter()
+        documents = 0
+        try:
+            for snapshot in self._target.stream(*args, **kwargs):
+                documents += 1
+                yield snapshot
+        finally:
+            record(self._shape, (time.perf_counter() - started) * 1000, documents)
+
+    def get(self, *args, **kwargs):
+        started = time.perf_counter()
+        result = self._target.get(*args, **kwargs)
+        record(self._shape, (time.perf_counter() - started) * 1000, len(result))
+        return result
+
+    def count(self, *args, **kwargs):
+        return RecordingAggregation(self._target.count(*args, **kwargs), dict(self._shape, aggregate="count"))
+
+    def __getattr__(self, name):
+        return getattr(self._target, name)
+
+
+class RecordingAggregation:
+    def __init__(self, target, shape: dict):
+        self._target = target
+        self._shape = shape
+
+    def get(self, *args, **kwargs):
+        started = time.perf_counter()
+        result = self._target.get(*args, **kwargs)
+        record(self._shape, (time.perf_counter() - started) * 1000, 0)
+        return result
+
+    def __getattr__(self, name):
+        return getattr(self._target, name)
+
+
+class RecordingClient:
+    """Firestore client whose collection queries are timed by the recorder."""
+
+    def __init__(self, client):
+        self._client = client
+
+    def collection(self, name, *args, **kwargs):
+        shape = {"collection": name, "filters": [], "order_by": [], "limit": None}
+        return RecordingQuery(self._client.collection(name, *args, **kwargs), shape)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+def summarize(lines, top: int = 20, sort: str = "total") -> list:
+    """Aggregate recorder log lines into per-shape stats, slowest first."""
+    groups = {}
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            entry = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        groups.setdefault(entry["shape"], []).append(entry)
+
+    report = []
+    for shape, entries in groups.items():
+        durations = sorted(e["duration_ms"] for e in entries)
+        report.append({
+            "shape": shape,
+            "count": len(entries),
+            "total_ms": round(sum(durations), 1),
+            "p50_ms": durations[len(durations) // 2],
+            "p95_ms": durations[min(len(durations) - 1, int(len(durations) * 0.95))],
+            "max_ms": durations[-1],
+            "avg_documents": round(sum(e["documents"] for e in entries) / len(entries), 1),
+        })
+
+    sort_key = {"total": "total_ms", "count": "count", "max": "max_ms", "p95": "p95_ms"}[sort]
+    report.sort(key=lambda row: row[sort_key], reverse=True)
+    return report[:top]
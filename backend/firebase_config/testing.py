@@ -0,0 +1,239 @@
+"""
+In-memory stand-in for the Firestore client, for the test suite.
+
+Covers what the backend uses: documents (get/set/create/update/delete, ``add``),
+``where``/``order_by``/``limit``/``select`` queries, ``count()`` aggregations,
+batches and ``Increment``. ``FakeTransaction`` implements the hooks
+``firestore.transactional`` drives, so transactional functions run
+unmodified; their writes are buffered and applied on commit, and dropped
+when the function raises.
+
+Tests install it with ``use_fake_firestore()``, which ``get_firestore_db``
+then returns.
+"""
+import copy
+import uuid
+
+from google.api_core.exceptions import AlreadyExists, NotFound
+from google.cloud.firestore_v1.transforms import Increment
+
+from firebase_config import firebase
+
+
+_OPERATORS = {
+    "==": lambda value, target: value == target,
+    "!=": lambda value, target: value != target,
+    "<": lambda value, target: value is not None and value < target,
+    "<=": lambda value, target: value is not None and value <= target,
+    ">": lambda value, target: value is not None and value > target,
+    ">=": lambda value, target: value is not None and value >= target,
+    "in": lambda value, target: value in target,
+}
+
+
+def _resolve(current, value):
+    if isinstance(value, Increment):
+        return (current or 0) + value.value
+    return copy.deepcopy(value)
+
+
+class FakeSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+        self.exists = data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data)
+
+    def get(self, field):
+        return self._data[field]
+
+
+class FakeDocument:
+    def __init__(self, db, collection: str, doc_id: str):
+        self._db = db
+        self._collection = collection
+        self.id = doc_id
+
+    @property
+    def _store(self) -> dict:
+        return self._db.data.setdefault(self._collection, {})
+
+    def get(self, transaction=None, **kwargs):
+        self._db.reads += 1
+        return FakeSnapshot(self, copy.deepcopy(self._store.get(self.id)))
+
+    def set(self, data, merge=False):
+        current = self._store.get(self.id) if merge else None
+        document = dict(current or {})
+        for key, value in data.items():
+            document[key] = _resolve(document.get(key), value)
+        self._store[self.id] = document
+
+    def create(self, data):
+        if self.id in self._store:
+            raise AlreadyExists(f"{self._collection}/{self.id} already exists")
+        self.set(data)
+
+    def update(self, data):
+        if self.id not in self._store:
+            raise NotFound(f"{self._collection}/{self.id} not found")
+        document = self._store[self.id]
+        for key, value in data.items():
+            document[key] = _resolve(document.get(key), value)
+
+    def delete(self):
+        self._store.pop(self.id, None)
+
+
+class _Count:
+    def __init__(self, value):
+        self.value = value
+
+
+class FakeAggregation:
+    def __init__(self, query):
+        self._query = query
+
+    def get(self, **kwargs):
+        return [[_Count(len(self._query._rows()))]]
+
+
+class FakeQuery:
+    def __init__(self, db, collection: str, filters=(), order=(), limit=None):
+        self._db = db
+        self._collection = collection
+        self._filters = tuple(filters)
+        self._order = tuple(order)
+        self._limit = limit
+
+    def _derive(self, **changes):
+        fields = {"filters": self._filters, "order": self._order, "limit": self._limit}
+        fields.update(changes)
+        return FakeQuery(self._db, self._collection, **fields)
+
+    def where(self, field_path=None, op_string=None, value=None, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._derive(filters=self._filters + ((field_path, op_string, value),))
+
+    def order_by(self, field_path, direction="ASCENDING"):
+        return self._derive(order=self._order + ((field_path, direction),))
+
+    def limit(self, count):
+        return self._derive(limit=count)
+
+    def select(self, field_paths):
+        return self
+
+    def _rows(self):
+        rows = [
+            (doc_id, data) for doc_id, data in self._db.data.get(self._collection, {}).items()
+            if all(_OPERATORS[op](data.get(field), value) for field, op, value in self._filters)
+        ]
+        for field, direction in reversed(self._order):
+            rows = [row for row in rows if field in row[1]]
+            rows.sort(key=lambda row: row[1][field], reverse=direction == "DESCENDING")
+        return rows[:self._limit] if self._limit is not None else rows
+
+    def stream(self, transaction=None, **kwargs):
+        self._db.queries += 1
+        for doc_id, data in self._rows():
+            yield FakeSnapshot(FakeDocument(self._db, self._collection, doc_id), copy.deepcopy(data))
+
+    def get(self, **kwargs):
+        return list(self.stream())
+
+    def count(self, alias=None):
+        return FakeAggregation(self)
+
+
+class FakeCollection(FakeQuery):
+    def __init__(self, db, name: str):
+        super().__init__(db, name)
+        self.id = name
+
+    def document(self, doc_id=None):
+        if doc_id is not None and (not doc_id or "/" in doc_id):
+            # The real client builds a path from the id and rejects an odd-length one.
+            raise ValueError(f"A document must have an even number of path elements: {doc_id!r}")
+        return FakeDocument(self._db, self._collection, doc_id or uuid.uuid4().hex[:20])
+
+    def add(self, data, document_id=None):
+        reference = self.document(document_id)
+        reference.create(data)
+        return None, reference
+
+
+class FakeTransaction:
+    """Buffers writes until ``firestore.transactional`` commits them."""
+
+    _read_only = False
+    _max_attempts = 1
+
+    def __init__(self, db):
+        self._db = db
+        self._id = None
+        self._writes = []
+
+    def _clean_up(self):
+        self._writes = []
+        self._id = None
+
+    def _begin(self, retry_id=None):
+        self._id = uuid.uuid4().bytes
+
+    def _commit(self):
+        writes, self._writes = self._writes, []
+        for write in writes:
+            write()
+        self._db.commits += 1
+
+    def _rollback(self):
+        self._clean_up()
+
+    def set(self, reference, data, merge=False):
+        self._writes.append(lambda: reference.set(data, merge=merge))
+
+    def create(self, reference, data):
+        self._writes.append(lambda: reference.create(data))
+
+    def update(self, reference, data):
+        self._writes.append(lambda: reference.update(data))
+
+    def delete(self, reference):
+        self._writes.append(reference.delete)
+
+
+class FakeBatch(FakeTransaction):
+    def commit(self):
+        self._commit()
+
+
+class FakeFirestore:
+    def __init__(self):
+        self.data = {}
+        self.reads = 0
+        self.queries = 0
+        self.commits = 0
+
+    def collection(self, name: str):
+        return FakeCollection(self, name)
+
+    def transaction(self, **kwargs):
+        return FakeTransaction(self)
+
+    def batch(self):
+        return FakeBatch(self)
+
+    def document_data(self, collection: str, doc_id: str):
+        return copy.deepcopy(self.data.get(collection, {}).get(doc_id))
+
+
+def use_fake_firestore() -> FakeFirestore:
+    """Make ``get_firestore_db()`` return a fresh fake; returns it."""
+    db = FakeFirestore()
+    firebase._db = db
+    return db
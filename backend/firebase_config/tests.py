@@ -0,0 +1,94 @@
+import json
+import os
+import tempfile
+from unittest import mock
+
+from django.test import SimpleTestCase
+from google.cloud.firestore_v1.base_query import FieldFilter
+
+from firebase_config import query_recorder
+from firebase_config.query_recorder import RecordingClient, collect, summarize
+from firebase_config.testing import FakeFirestore
+
+
+class RecorderTests(SimpleTestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.path = os.path.join(self.dir.name, "queries.log")
+
+        fake = FakeFirestore()
+        fake.data["users"] = {
+            uid: {"uid": uid, "role": "student", "name": uid} for uid in ("a", "b", "c")
+        }
+        self.db = RecordingClient(fake)
+
+    def environ(self, **values):
+        patch = mock.patch.dict(os.environ, {"FIRESTORE_QUERY_LOG": self.path, **values})
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def logged(self, path=None):
+        with open(path or self.path, encoding="utf-8") as f:
+            return [json.loads(line) for line in f]
+
+    def test_shapes_leave_out_filter_values(self):
+        users = self.db.collection("users")
+        with collect() as queries:
+            list(users.where("role", "==", "student").order_by("name", direction="DESCENDING").limit(2).stream())
+            users.where(filter=FieldFilter("uid", "in", ["a", "b"])).get()
+            users.where("role", "==", "teacher").count().get()
+
+        self.assertEqual([(query["shape"], query["documents"]) for query in queries], [
+            ("users | where role == | order_by name DESCENDING | limit 2", 2),
+            ("users | where uid in", 2),
+            ("users | where role == | count", 0),
+        ])
+
+    def test_only_slow_queries_are_logged(self):
+        self.environ(FIRESTORE_SLOW_QUERY_MS="60000")
+        list(self.db.collection("users").stream())
+        self.assertFalse(os.path.exists(self.path))
+
+        self.environ(FIRESTORE_SLOW_QUERY_MS="0")
+        list(self.db.collection("users").stream())
+        (entry,) = self.logged()
+        self.assertEqual((entry["shape"], entry["collection"], entry["documents"]), ("users", "users", 3))
+
+    def test_log_rotates_past_the_size_limit(self):
+        self.environ(FIRESTORE_SLOW_QUERY_MS="0", FIRESTORE_QUERY_LOG_MAX_BYTES="10")
+        users = self.db.collection("users")
+        users.limit(1).get()
+        users.limit(2).get()
+        users.limit(3).get()
+
+        self.assertEqual([entry["shape"] for entry in self.logged(self.path + ".1")], ["users | limit 2"])
+        self.assertEqual([entry["shape"] for entry in self.logged()], ["users | limit 3"])
+
+    def test_disabled_without_a_log_or_profiling(self):
+        with mock.patch.dict(os.environ, {"FIRESTORE_QUERY_LOG": "", "PROFILE_ENABLED": "0"}):
+            self.assertFalse(query_recorder.enabled())
+        with mock.patch.dict(os.environ, {"FIRESTORE_QUERY_LOG": "", "PROFILE_ENABLED": "1"}):
+            self.assertTrue(query_recorder.enabled())
+
+
+class SummarizeTests(SimpleTestCase):
+    @staticmethod
+    def line(shape: str, duration_ms: float, documents: int = 1) -> str:
+        return json.dumps({"shape": shape, "duration_ms": duration_ms, "documents": documents})
+
+    def test_groups_by_shape(self):
+        lines = [self.line("users", ms, documents=ms // 10) for ms in range(10, 210, 10)]
+        lines += [self.line("attendance_logs | limit 1", 900), "", "not json\n"]
+
+        report = summarize(lines)
+        self.assertEqual([row["shape"] for row in report], ["users", "attendance_logs | limit 1"])
+        self.assertEqual(report[0], {
+            "shape": "users", "count": 20, "total_ms": 2100.0,
+            "p50_ms": 110, "p95_ms": 200, "max_ms": 200, "avg_documents": 10.5,
+        })
+
+    def test_sort_and_top(self):
+        lines = [self.line("users", 10)] * 3 + [self.line("devices", 500)]
+        self.assertEqual([row["shape"] for row in summarize(lines, sort="count")], ["users", "devices"])
+        self.assertEqual([row["shape"] for row in summarize(lines, sort="max", top=1)], ["devices"])
@@ -1,7 +1,10 @@
 from django.urls import path
-from health_views import health
+from health_views import admission_metrics, firestore_breaker_metrics, health, idempotency_metrics
 
 
 urlpatterns = [
     path("health/", health, name="health"),
+    path("health/admission/", admission_metrics, name="admission_metrics"),
+    path("health/idempotency/", idempotency_metrics, name="idempotency_metrics"),
+    path("health/firestore/", firestore_breaker_metrics, name="firestore_breaker_metrics"),
 ]
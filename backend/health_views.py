@@ -1,5 +1,24 @@
 from django.http import JsonResponse
 
+from backend_project import breaker
+from backend_project.admission import get_admission_controller
+from backend_project.idempotency import get_idempotency_store
+
 
 def health(request):
     return JsonResponse({"status": "success", "message": "ok"})
+
+
+def admission_metrics(request):
+    """Queue depth and admit/reject counters for this worker's device admission control."""
+    return JsonResponse({"status": "success", "admission": get_admission_controller().metrics()})
+
+
+def idempotency_metrics(request):
+    """Size of this worker's idempotency key store and how many responses it replayed."""
+    return JsonResponse({"status": "success", "idempotency": get_idempotency_store().metrics()})
+
+
+def firestore_breaker_metrics(request):
+    """Firestore circuit breaker state and how many stale responses this worker served."""
+    return JsonResponse({"status": "success", "firestore": breaker.metrics()})
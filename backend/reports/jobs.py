@@ -0,0 +1,347 @@
+"""
+Background report jobs.
+
+Heavy reports (multi-month exports, term summaries) run on a small bounded
+thread pool instead of inside the request. A job's state lives in
+``REPORT_DIR/jobs/{job_id}.json`` so any worker can answer a poll, and
+finished results are kept in ``REPORT_DIR/results/`` under a key derived
+from the report kind, its parameters and the data watermark (newest log
+timestamp, newest roster change and the archive manifest). Submitting the
+same report again while the data hasn't changed returns the cached result
+immediately.
+
+Each job records the worker that owns it, which rewrites ``heartbeat_at``
+every ``REPORT_HEARTBEAT_SECONDS`` while the job is queued or running. A
+poll that finds the heartbeat older than ``REPORT_STALE_AFTER_SECONDS``
+(the worker died or was restarted) marks the job failed.
+"""
+import csv
+import hashlib
+import json
+import logging
+import os
+import socket
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+
+from django.conf import settings
+
+from attendance.archive import load_manifest
+from attendance.logs import EXPORT_FIELDS, iter_logs_in_range, parse_bound
+from attendance.terms import Term
+from firebase_config.firebase import get_firestore_db
+from users.roster import DELETED_USERS_COLLECTION
+
+
+logger = logging.getLogger(__name__)
+
+class ReportError(ValueError):
+    """Raised for an unknown report kind or invalid parameters."""
+
+
+class QueueFullError(RuntimeError):
+    """Raised when too many jobs are already waiting."""
+
+
+def report_dir() -> Path:
+    return Path(settings.REPORT_DIR)
+
+
+def _atomic_write_text(path: Path, text: str):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def _newest(db, collection: str, field: str):
+    latest = db.collection(collection).order_by(field, direction="DESCENDING").limit(1)
+    return next((doc.to_dict().get(field) for doc in latest.stream()), None)
+
+
+def data_watermark(db) -> str:
+    """Changes whenever a log is added, logs move to the archive or a user is written or deleted."""
+    newest = _newest(db, "attendance_logs", "timestamp")
+    # Summaries list every student, so a roster change must miss the cache too.
+    users = _newest(db, "users", "updated_at")
+    deleted = _newest(db, DELETED_USERS_COLLECTION, "deleted_at")
+    manifest = load_manifest()
+    return f"{newest}|{users}|{deleted}|{manifest['archived_before']}|{len(manifest['segments'])}"
+
+
+class _Progress:
+    """Estimates progress from how far through the time range the logs are."""
+
+    def __init__(self, job, start, end):
+        self.job = job
+        self.start = datetime.fromisoformat(start).timestamp() if start else None
+        self.end = datetime.fromisoformat(end).timestamp() if end else time.time()
+        self.last_saved = 0.0
+
+    def update(self, timestamp: str):
+        now = time.monotonic()
+        if now - self.last_saved < 0.5 or self.start is None or not timestamp:
+            return
+        position = datetime.fromisoformat(timestamp).timestamp()
+        fraction = (position - self.start) / max(1.0, self.end - self.start)
+        self.job.save(progress=round(min(0.99, max(0.0, fraction)), 2))
+        self.last_saved = now
+
+
+def _export_report(db, params: dict, job, out):
+    writer = csv.writer(out)
+    writer.writerow(EXPORT_FIELDS)
+    progress = _Progress(job, params["start"], params["end"])
+    rows = 0
+    for log in iter_logs_in_range(db, params["start"], params["end"], params.get("student_id")):
+        writer.writerow([log.get(field, "") for field in EXPORT_FIELDS])
+        rows += 1
+        progress.update(log.get("timestamp"))
+    return rows
+
+
+def _summary_report(db, params: dict, job, out):
+    """Per-student days present, scans and first/last scan over the range."""
+    students = {}
+    for doc in db.collection("users").where("role", "==", "student").stream():
+        data = doc.to_dict()
+        students[data.get("uid") or doc.id] = {"name": data.get("name"), "days": set(), "scans": 0,
+                                               "first": None, "last": None}
+
+    progress = _Progress(job, params["start"], params["end"])
+    for log in iter_logs_in_range(db, params["start"], params["end"]):
+        timestamp = log.get("timestamp") or ""
+        row = students.get(log.get("student_id"))
+        if row is not None:
+            row["days"].add(timestamp[:10])
+            row["scans"] += 1
+            row["first"] = row["first"] or timestamp
+            row["last"] = timestamp
+        progress.update(timestamp)
+
+    first_day = date.fromisoformat(params["start"][:10])
+    if params["end"]:
+        last_day = (datetime.fromisoformat(params["end"]) - timedelta(microseconds=1)).date()
+    else:
+        last_day = datetime.now(timezone.utc).date()
+    school_days = len(Term("range", first_day, last_day).school_days())
+
+    writer = csv.writer(out)
+    writer.writerow(["student_id", "name", "days_present", "school_days", "attendance_percentage",
+                     "scans", "first_scan", "last_scan"])
+    for uid in sorted(students):
+        row = students[uid]
+        present = len(row["days"])
+        writer.writerow([uid, row["name"], present, school_days,
+                         round(present / school_days * 100, 1) if school_days else 0,
+                         row["scans"], row["first"] or "", row["last"] or ""])
+    return len(students)
+
+
+REPORT_KINDS = {
+    "attendance_export": _export_report,
+    "attendance_summary": _summary_report,
+}
+
+
+def normalize_params(kind: str, raw: dict) -> dict:
+    if kind not in REPORT_KINDS:
+        raise ReportError(f"Unknown report kind: {kind}")
+    if not isinstance(raw, dict):
+        raise ReportError("params must be an object")
+    for bound in ("start", "end"):
+        if raw.get(bound) is not None and not isinstance(raw[bound], str):
+            raise ReportError(f"{bound} must be a date string")
+    try:
+        params = {
+            "start": parse_bound(raw.get("start")),
+            "end": parse_bound(raw.get("end"), end=True),
+        }
+    except ValueError as e:
+        raise ReportError(str(e))
+    if kind == "attendance_summary" and not params["start"]:
+        raise ReportError("start is required for attendance_summary")
+    if kind == "attendance_export" and raw.get("student_id"):
+        params["student_id"] = str(raw["student_id"])
+    return params
+
+
+class Job:
+    def __init__(self, state: dict):
+        self.state = state
+        self._lock = threading.Lock()
+
+    @property
+    def id(self) -> str:
+        return self.state["id"]
+
+    @staticmethod
+    def path_for(job_id: str) -> Path:
+        return report_dir() / "jobs" / f"{job_id}.json"
+
+    def save(self, **changes):
+        # The heartbeat thread saves too; keep each write a consistent, ordered snapshot.
+        with self._lock:
+            self.state.update(changes)
+            _atomic_write_text(self.path_for(self.id), json.dumps(self.state))
+
+    @classmethod
+    def load(cls, job_id: str):
+        try:
+            with open(cls.path_for(job_id), "r", encoding="utf-8") as f:
+                return cls(json.load(f))
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def expire_if_stale(self, stale_after: float) -> bool:
+        """Mark a queued or running job failed if its owner stopped heartbeating."""
+        if self.state["status"] not in ("queued", "running"):
+            return False
+        heartbeat_at = self.state.get("heartbeat_at") or self.state["created_at"]
+        now = datetime.now(timezone.utc)
+        if (now - datetime.fromisoformat(heartbeat_at)).total_seconds() <= stale_after:
+            return False
+        self.save(status="failed", error=f"Report worker {self.state.get('owner')} stopped responding",
+                  finished_at=now.isoformat())
+        return True
+
+    def result_path(self) -> Path:
+        return report_dir() / "results" / f"{self.state['cache_key']}.csv"
+
+
+class JobRunner:
+    def __init__(self, workers: int, max_pending: int, heartbeat_interval: float):
+        self.max_pending = max_pending
+        self.heartbeat_interval = heartbeat_interval
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="report")
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._active = {}
+        self._heartbeat = None
+        self._stopped = threading.Event()
+
+    def submit(self, kind: str, raw_params: dict) -> Job:
+        params = normalize_params(kind, raw_params)
+        prune_results(settings.REPORT_RESULT_MAX_AGE_DAYS)
+        db = get_firestore_db()
+        watermark = data_watermark(db)
+        cache_key = hashlib.sha256(
+            json.dumps([kind, params, watermark], sort_keys=True).encode("utf-8")
+        ).hexdigest()[:32]
+
+        now = datetime.now(timezone.utc).isoformat()
+        job = Job({
+            "id": uuid.uuid4().hex,
+            "kind": kind,
+            "params": params,
+            "watermark": watermark,
+            "cache_key": cache_key,
+            "status": "queued",
+            "progress": 0.0,
+            "created_at": now,
+            "owner": self.owner,
+            "heartbeat_at": now,
+            "finished_at": None,
+            "rows": None,
+            "cached": False,
+            "error": None,
+        })
+
+        if job.result_path().exists():
+            job.save(status="done", progress=1.0, cached=True, finished_at=now)
+            return job
+
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise QueueFullError("Too many report jobs queued, retry later")
+            self._pending += 1
+            self._active[job.id] = job
+        job.save()
+        self._ensure_heartbeat()
+        self._executor.submit(self._run, job, db)
+        return job
+
+    def _run(self, job: Job, db):
+        try:
+            job.save(status="running", started_at=datetime.now(timezone.utc).isoformat())
+            result_path = job.result_path()
+            result_path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=result_path.parent, prefix=f".{result_path.name}.")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8", newline="") as out:
+                    rows = REPORT_KINDS[job.state["kind"]](db, job.state["params"], job, out)
+                os.replace(tmp, result_path)
+            except BaseException:
+                os.unlink(tmp)
+                raise
+            job.save(status="done", progress=1.0, rows=rows,
+                     finished_at=datetime.now(timezone.utc).isoformat())
+        except Exception as e:
+            job.save(status="failed", error=str(e) or type(e).__name__,
+                     finished_at=datetime.now(timezone.utc).isoformat())
+        finally:
+            with self._lock:
+                self._pending -= 1
+                self._active.pop(job.id, None)
+
+    def _beat(self):
+        while not self._stopped.wait(self.heartbeat_interval):
+            with self._lock:
+                jobs = list(self._active.values())
+            now = datetime.now(timezone.utc).isoformat()
+            for job in jobs:
+                try:
+                    job.save(heartbeat_at=now)
+                except Exception:
+                    logger.exception("Could not record a heartbeat for report job %s", job.id)
+
+    def _ensure_heartbeat(self):
+        if self._heartbeat is not None:
+            return
+        with self._lock:
+            if self._heartbeat is None:
+                self._heartbeat = threading.Thread(target=self._beat, name="report-heartbeat", daemon=True)
+                self._heartbeat.start()
+
+
+def prune_results(max_age_days: float):
+    """Delete cached results and job files older than ``max_age_days``."""
+    cutoff = time.time() - max_age_days * 86400
+    for folder in ("results", "jobs"):
+        for path in (report_dir() / folder).glob("*"):
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+            except FileNotFoundError:
+                pass
+
+
+_runner = None
+_runner_lock = threading.Lock()
+
+
+def get_job_runner() -> JobRunner:
+    global _runner
+
+    if _runner is not None:
+        return _runner
+
+    with _runner_lock:
+        if _runner is None:
+            _runner = JobRunner(
+                workers=settings.REPORT_WORKERS,
+                max_pending=settings.REPORT_MAX_PENDING,
+                heartbeat_interval=settings.REPORT_HEARTBEAT_SECONDS,
+            )
+    return _runner
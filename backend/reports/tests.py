@@ -0,0 +1,141 @@
+import json
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+from django.test import RequestFactory, SimpleTestCase
+
+from attendance import archive
+from firebase_config.testing import use_fake_firestore
+from reports.jobs import REPORT_KINDS, Job, JobRunner, ReportError, data_watermark, normalize_params
+from reports.views import download_job, job_status
+
+
+class NormalizeParamsTests(SimpleTestCase):
+    def test_bounds_are_normalized(self):
+        params = normalize_params("attendance_summary", {"start": "2026-01-05", "end": "2026-01-09"})
+        self.assertEqual(params, {"start": "2026-01-05T00:00:00+00:00", "end": "2026-01-10T00:00:00+00:00"})
+
+    def test_export_keeps_the_student_filter(self):
+        params = normalize_params("attendance_export", {"student_id": 42})
+        self.assertEqual(params, {"start": None, "end": None, "student_id": "42"})
+
+    def test_invalid_params_raise_report_error(self):
+        cases = [
+            ("nope", {}),
+            ("attendance_summary", {}),
+            ("attendance_summary", {"start": "yesterday"}),
+            ("attendance_export", {"end": "2026-13-01"}),
+            ("attendance_export", {"start": 20260101}),
+            ("attendance_export", ["2026-01-01"]),
+        ]
+        for kind, raw in cases:
+            with self.subTest(kind=kind, raw=raw), self.assertRaises(ReportError):
+                normalize_params(kind, raw)
+
+
+class ReportDirTestCase(SimpleTestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        overrides = self.settings(
+            REPORT_DIR=f"{self.dir.name}/reports",
+            ATTENDANCE_ARCHIVE_DIR=f"{self.dir.name}/archive",
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        archive._manifest_cache.update(mtime=None, manifest=None)
+
+        self.db = use_fake_firestore()
+        self.db.data["users"] = {"S1": {"uid": "S1", "name": "Ann", "role": "student",
+                                        "updated_at": "2026-01-01T00:00:00+00:00"}}
+        self.db.data["attendance_logs"] = {"a": {"student_id": "S1", "timestamp": "2026-01-05T08:00:00+00:00"}}
+
+
+class WatermarkTests(ReportDirTestCase):
+    def test_roster_changes_move_the_watermark(self):
+        before = data_watermark(self.db)
+        self.db.data["users"]["S2"] = {"uid": "S2", "name": "Bo", "role": "student",
+                                       "updated_at": "2026-01-02T00:00:00+00:00"}
+        added = data_watermark(self.db)
+        self.assertNotEqual(added, before)
+
+        del self.db.data["users"]["S2"]
+        self.db.data["deleted_users"] = {"S2": {"deleted_at": "2026-01-03T00:00:00+00:00"}}
+        self.assertNotIn(data_watermark(self.db), (before, added))
+
+
+class JobRunnerTests(ReportDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.runner = JobRunner(workers=1, max_pending=5, heartbeat_interval=0.01)
+        self.addCleanup(self.runner._executor.shutdown)
+        self.addCleanup(self.runner._stopped.set)
+
+    def wait_for(self, job_id: str, condition):
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            job = Job.load(job_id)
+            if job is not None and condition(job.state):
+                return job.state
+            time.sleep(0.01)
+        self.fail(f"job {job_id} never reached the expected state")
+
+    def test_cached_until_the_roster_changes(self):
+        params = {"start": "2026-01-05", "end": "2026-01-09"}
+        job = self.runner.submit("attendance_summary", params)
+        self.wait_for(job.id, lambda state: state["status"] == "done")
+        self.assertTrue(self.runner.submit("attendance_summary", params).state["cached"])
+
+        self.db.data["users"]["S1"].update(name="Ann B.", updated_at="2026-01-06T00:00:00+00:00")
+        job = self.runner.submit("attendance_summary", params)
+        self.assertFalse(job.state["cached"])
+        self.wait_for(job.id, lambda state: state["status"] == "done")
+
+    def test_running_jobs_heartbeat(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        def blocked(db, params, job, out):
+            release.wait(5)
+            return 0
+
+        with mock.patch.dict(REPORT_KINDS, {"attendance_export": blocked}):
+            job = self.runner.submit("attendance_export", {})
+            first = job.state["heartbeat_at"]
+            state = self.wait_for(job.id, lambda state: state["heartbeat_at"] != first)
+            self.assertEqual((state["status"], state["owner"]), ("running", self.runner.owner))
+            release.set()
+            self.wait_for(job.id, lambda state: state["status"] == "done")
+
+
+class StaleJobTests(ReportDirTestCase):
+    def job(self, heartbeat_age: float) -> Job:
+        created = datetime.now(timezone.utc) - timedelta(seconds=heartbeat_age)
+        job = Job({"id": f"job-{int(heartbeat_age)}", "kind": "attendance_export", "params": {},
+                   "status": "running", "progress": 0.2, "created_at": created.isoformat(),
+                   "owner": "host-a:123", "heartbeat_at": created.isoformat(), "finished_at": None,
+                   "rows": None, "cached": False, "error": None, "cache_key": "k"})
+        job.save()
+        return job
+
+    def poll(self, view, job_id: str):
+        response = view(RequestFactory().get(f"/reports/jobs/{job_id}/"), job_id)
+        return response.status_code, json.loads(response.content)
+
+    def test_dead_worker_fails_the_job_on_poll(self):
+        job = self.job(heartbeat_age=3600)
+        status, body = self.poll(job_status, job.id)
+        self.assertEqual(body["job"]["status"], "failed")
+        self.assertIn("host-a:123", body["job"]["error"])
+        self.assertEqual(Job.load(job.id).state["status"], "failed")
+
+        status, body = self.poll(download_job, job.id)
+        self.assertEqual((status, body["message"]), (409, "Job is failed"))
+
+    def test_live_worker_keeps_running(self):
+        job = self.job(heartbeat_age=1)
+        _, body = self.poll(job_status, job.id)
+        self.assertEqual(body["job"]["status"], "running")
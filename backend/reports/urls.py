@@ -0,0 +1,8 @@
+from django.urls import path
+from . import views
+
+urlpatterns = [
+    path("jobs/", views.submit_job, name="submit_report_job"),
+    path("jobs/<str:job_id>/", views.job_status, name="report_job_status"),
+    path("jobs/<str:job_id>/download/", views.download_job, name="download_report_job"),
+]
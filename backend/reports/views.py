@@ -0,0 +1,99 @@
+import json
+
+from django.conf import settings
+from django.http import FileResponse, JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+
+from firebase_config.firebase import FirebaseCredentialsError
+from reports.jobs import Job, QueueFullError, ReportError, get_job_runner
+
+
+def _json_error(message, status=400):
+    return JsonResponse({"status": "error", "message": message}, status=status)
+
+
+def _load_job(job_id):
+    """The job, failed first if its worker stopped heartbeating; None if unknown."""
+    job = Job.load(job_id)
+    if job is not None:
+        job.expire_if_stale(settings.REPORT_STALE_AFTER_SECONDS)
+    return job
+
+
+def _describe(job: Job) -> dict:
+    state = job.state
+    described = {
+        key: state.get(key)
+        for key in ("id", "kind", "params", "status", "progress", "rows", "cached",
+                    "created_at", "finished_at", "error")
+    }
+    if state["status"] == "done":
+        described["download_url"] = f"/reports/jobs/{job.id}/download/"
+    return described
+
+
+@csrf_exempt
+def submit_job(request):
+    """Queue a report job; returns immediately with the job to poll"""
+    if request.method != "POST":
+        return _json_error("Method not allowed", status=405)
+
+    try:
+        payload = json.loads(request.body.decode("utf-8") or "{}")
+    except json.JSONDecodeError:
+        return _json_error("Invalid JSON")
+
+    kind = payload.get("kind")
+    if not kind:
+        return _json_error("kind is required")
+
+    try:
+        job = get_job_runner().submit(kind, payload.get("params") or {})
+    except ReportError as e:
+        return _json_error(str(e))
+    except QueueFullError as e:
+        response = _json_error(str(e), status=503)
+        response["Retry-After"] = "30"
+        return response
+    except FirebaseCredentialsError as e:
+        return JsonResponse({"status": "error", "message": str(e)}, status=500)
+
+    return JsonResponse({"status": "success", "job": _describe(job)}, status=202)
+
+
+@csrf_exempt
+def job_status(request, job_id):
+    """Poll a report job's status and progress"""
+    if request.method != "GET":
+        return _json_error("Method not allowed", status=405)
+
+    job = _load_job(job_id)
+    if job is None:
+        return _json_error("Job not found", status=404)
+
+    return JsonResponse({"status": "success", "job": _describe(job)})
+
+
+@csrf_exempt
+def download_job(request, job_id):
+    """Download a finished report as CSV"""
+    if request.method != "GET":
+        return _json_error("Method not allowed", status=405)
+
+    job = _load_job(job_id)
+    if job is None:
+        return _json_error("Job not found", status=404)
+    if job.state["status"] != "done":
+        return _json_error(f"Job is {job.state['status']}", status=409)
+
+    try:
+        result = open(job.result_path(), "rb")
+    except FileNotFoundError:
+        return _json_error("Report result expired, submit the job again", status=410)
+
+    return FileResponse(
+        result,
+        as_attachment=True,
+        filename=f"{job.state['kind']}.csv",
+        content_type="text/csv",
+    )
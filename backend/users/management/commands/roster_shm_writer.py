@@ -0,0 +1,98 @@
+import os
+import signal
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from firebase_config.firebase import FirebaseCredentialsError, get_firestore_db
+from users.roster import RosterCache
+from users.roster_shm import SharedRosterWriter
+from users.roster_snapshot import SnapshotFormatError
+
+
+class Command(BaseCommand):
+    help = (
+        "Keep the shared-memory student roster up to date for every worker on "
+        "this host. Run exactly one per host, next to the web workers."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--name",
+            default=settings.ROSTER_SHM_NAME,
+            help="Shared memory name (defaults to ROSTER_SHM_NAME).",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=settings.ROSTER_SHM_REFRESH_SECONDS,
+            help="Seconds between catch-up reads (defaults to ROSTER_SHM_REFRESH_SECONDS).",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Publish once and exit, leaving the segments in place.",
+        )
+
+    def handle(self, *args, **options):
+        name = options["name"]
+        if not name:
+            raise CommandError("No shared memory name: pass --name or set ROSTER_SHM_NAME.")
+
+        try:
+            db = get_firestore_db()
+        except FirebaseCredentialsError as e:
+            raise CommandError(str(e))
+
+        roster = RosterCache(ttl=0, full_reload_after=settings.ROSTER_FULL_RELOAD_SECONDS)
+        path = settings.ROSTER_SNAPSHOT_PATH
+        if path and os.path.exists(path):
+            try:
+                roster.load_snapshot(path)
+            except (OSError, ValueError, SnapshotFormatError) as e:
+                self.stderr.write(f"Ignoring roster snapshot ({e}).")
+        if roster.resume_token:
+            roster.catch_up(db)
+        else:
+            roster.reload(db)
+
+        writer = SharedRosterWriter(name)
+        size = writer.publish(roster.students(), roster.read_time, roster.resume_token)
+        self.stdout.write(
+            f"Published {len(roster.students())} students to /{name} "
+            f"(generation {writer.generation}, {size} bytes)."
+        )
+        if options["once"]:
+            return
+
+        stopped = threading.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *_: stopped.set())
+
+        try:
+            while not stopped.wait(options["interval"]):
+                started = time.perf_counter()
+                try:
+                    if roster.due_for_full_reload():
+                        roster.reload(db)
+                        changes = len(roster.students())
+                    else:
+                        changes = roster.catch_up(db)
+                except Exception as e:
+                    # Keep serving the last generation; readers treat a missing heartbeat as stale.
+                    self.stderr.write(f"Catch-up failed: {e}")
+                    continue
+                if changes:
+                    size = writer.publish(roster.students(), roster.read_time, roster.resume_token)
+                    self.stdout.write(
+                        f"Published generation {writer.generation}: {changes} students changed, "
+                        f"{len(roster.students())} in total, {size} bytes "
+                        f"({time.perf_counter() - started:.2f}s)."
+                    )
+                else:
+                    writer.heartbeat()
+        finally:
+            writer.close()
+            self.stdout.write(self.style.SUCCESS(f"Unlinked /{name}."))
@@ -0,0 +1,60 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from firebase_config.firebase import FirebaseCredentialsError, get_firestore_db
+from users.roster import RosterCache
+from users.roster_snapshot import SnapshotFormatError
+
+
+class Command(BaseCommand):
+    help = (
+        "Write the on-disk roster snapshot workers load at startup. Catches up "
+        "the existing snapshot incrementally unless --full is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--path",
+            default=settings.ROSTER_SNAPSHOT_PATH,
+            help="Snapshot file (defaults to ROSTER_SNAPSHOT_PATH).",
+        )
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Rebuild from a full read of users instead of catching up.",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        if not path:
+            raise CommandError("No snapshot path: pass --path or set ROSTER_SNAPSHOT_PATH.")
+
+        try:
+            db = get_firestore_db()
+        except FirebaseCredentialsError as e:
+            raise CommandError(str(e))
+
+        started = time.perf_counter()
+        roster = RosterCache(ttl=0)
+        mode = "full read"
+        if not options["full"] and os.path.exists(path):
+            try:
+                roster.load_snapshot(path)
+                mode = "catch-up"
+            except (OSError, ValueError, SnapshotFormatError) as e:
+                self.stderr.write(f"Existing snapshot unreadable ({e}); doing a full read.")
+
+        if mode == "catch-up" and roster.resume_token:
+            roster.catch_up(db)
+        else:
+            mode = "full read"
+            roster.reload(db)
+
+        roster.save_snapshot(path)
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {len(roster.students())} students to {path} "
+            f"({mode}, {os.path.getsize(path)} bytes, {time.perf_counter() - started:.2f}s)."
+        ))
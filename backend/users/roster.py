@@ -0,0 +1,346 @@
+"""
+In-memory mirror of the student roster.
+
+Each worker keeps every ``role == "student"`` user from ``users`` in memory,
+plus a dense ordinal per uid so other modules can keep per-student state in
+bitsets. Writes made by ``register_user`` / ``delete_student`` on this worker
+are applied immediately; everything else is picked up when the mirror is
+older than ``ROSTER_TTL_SECONDS``.
+
+Refreshing is incremental once the mirror has a resume token: only users
+with ``updated_at`` after the token and tombstones in ``deleted_users`` are
+read. Writes that don't set ``updated_at`` (backfills, console edits,
+deletes without a tombstone) are invisible to that, so every
+``ROSTER_FULL_RELOAD_SECONDS`` the refresh is a full read instead.
+
+Workers start from the on-disk snapshot (``ROSTER_SNAPSHOT_PATH``, written by
+``manage.py roster_snapshot``) instead of streaming the whole collection, so
+boot cost doesn't depend on roster size and a deploy doesn't cause a read
+spike.
+
+With ``ROSTER_SHM_NAME`` set, workers instead read the roster that
+``manage.py roster_shm_writer`` publishes to shared memory (see
+``users.roster_shm``) and don't query ``users`` themselves.
+
+Ordinals are assigned on first sight and never reused for the lifetime of the
+process, so bitsets built against an older roster stay valid.
+"""
+import logging
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+
+from users.roster_shm import SharedRosterReader
+from users.roster_snapshot import read_snapshot, write_snapshot
+
+
+logger = logging.getLogger(__name__)
+
+DELETED_USERS_COLLECTION = "deleted_users"
+
+# Resume tokens are compared against timestamps written by other workers'
+# clocks, so back them off a little; replaying a change is harmless.
+CLOCK_SKEW = timedelta(seconds=60)
+
+
+def _token_before(moment: datetime) -> str:
+    return (moment - CLOCK_SKEW).isoformat()
+
+
+class RosterCache:
+    def __init__(self, ttl: float, full_reload_after: float = None):
+        self.ttl = ttl
+        self.full_reload_after = full_reload_after
+        self._full_loaded_at = None
+        self._lock = threading.RLock()
+        self._students = {}
+        self._ordinals = {}
+        self._uids = []
+        self._bits = 0
+        self._loaded_at = None
+        self.resume_token = None
+        self.read_time = None
+        self._listeners = []
+
+    def add_listener(self, listener):
+        """Keep ``listener`` in sync with the roster.
+
+        It is called with ``reset(students)`` now and after every full
+        replace, and with ``upsert(student)`` / ``remove(uid)`` for each
+        single change, always under the roster lock.
+        """
+        with self._lock:
+            self._listeners.append(listener)
+            listener.reset(self.students())
+
+    def ordinal(self, uid: str) -> int:
+        """Dense ordinal for ``uid``, assigned on first use."""
+        with self._lock:
+            ordinal = self._ordinals.get(uid)
+            if ordinal is None:
+                ordinal = len(self._uids)
+                self._ordinals[uid] = ordinal
+                self._uids.append(uid)
+            return ordinal
+
+    def uid_at(self, ordinal: int) -> str:
+        return self._uids[ordinal]
+
+    def _is_stale(self) -> bool:
+        return self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl
+
+    def due_for_full_reload(self) -> bool:
+        """True when catching up isn't enough: no resume token, or the last full read is too old."""
+        if self.resume_token is None:
+            return True
+        if self.full_reload_after is None or self._full_loaded_at is None:
+            return False
+        return time.monotonic() - self._full_loaded_at > self.full_reload_after
+
+    def ensure_fresh(self, db):
+        if not self._is_stale():
+            return
+        with self._lock:
+            if self._is_stale():
+                if self.due_for_full_reload():
+                    self.reload(db)
+                else:
+                    self.catch_up(db)
+
+    def _replace(self, students: dict):
+        with self._lock:
+            bits = 0
+            for uid in students:
+                bits |= 1 << self.ordinal(uid)
+            self._students = students
+            self._bits = bits
+            self._loaded_at = time.monotonic()
+            for listener in self._listeners:
+                listener.reset(students)
+
+    def reload(self, db):
+        """Replace the mirror with a full read of the student roster."""
+        started = datetime.now(timezone.utc)
+        students = {}
+        for doc in db.collection("users").where("role", "==", "student").stream():
+            data = doc.to_dict()
+            students[data.get("uid") or doc.id] = data
+
+        self._replace(students)
+        self.resume_token = _token_before(started)
+        self.read_time = started.timestamp()
+        self._full_loaded_at = time.monotonic()
+
+    def catch_up(self, db) -> int:
+        """Apply user writes and deletions made since the resume token.
+
+        Returns how many students actually changed; documents replayed
+        because of the clock-skew margin don't count.
+        """
+        started = datetime.now(timezone.utc)
+        token = self.resume_token
+
+        changes = 0
+        updated_at = {}
+        for doc in db.collection("users").where("updated_at", ">", token).stream():
+            data = doc.to_dict()
+            data.setdefault("uid", doc.id)
+            updated_at[data["uid"]] = data.get("updated_at")
+            before = self._students.get(data["uid"])
+            self.upsert(data)
+            changes += self._students.get(data["uid"]) != before
+
+        deleted = db.collection(DELETED_USERS_COLLECTION).where("deleted_at", ">", token).stream()
+        for doc in deleted:
+            # A uid deleted and then registered again keeps its newer document.
+            if (updated_at.get(doc.id) or "") < (doc.to_dict().get("deleted_at") or ""):
+                changes += doc.id in self._students
+                self.remove(doc.id)
+
+        with self._lock:
+            self._loaded_at = time.monotonic()
+            self.resume_token = _token_before(started)
+            self.read_time = started.timestamp()
+        return changes
+
+    def load_snapshot(self, path) -> int:
+        """Warm start from an on-disk snapshot; returns the number of students loaded."""
+        students, read_time, resume_token = read_snapshot(path)
+        self._replace(students)
+        # Catch up on the next read rather than trusting the snapshot's age;
+        # the first full read is then due a full interval after startup.
+        self._loaded_at = None
+        self._full_loaded_at = time.monotonic()
+        self.resume_token = resume_token
+        self.read_time = read_time
+        return len(students)
+
+    def save_snapshot(self, path):
+        with self._lock:
+            students = dict(self._students)
+            read_time, resume_token = self.read_time, self.resume_token
+        write_snapshot(path, students, read_time, resume_token)
+
+    def upsert(self, user: dict):
+        """Apply one user document (a local write or one read during catch-up)."""
+        uid = user.get("uid")
+        with self._lock:
+            bit = 1 << self.ordinal(uid)
+            if user.get("role") == "student":
+                self._students[uid] = dict(self._students.get(uid, {}), **user)
+                self._bits |= bit
+                for listener in self._listeners:
+                    listener.upsert(self._students[uid])
+            else:
+                self._students.pop(uid, None)
+                self._bits &= ~bit
+                for listener in self._listeners:
+                    listener.remove(uid)
+
+    def remove(self, uid: str):
+        with self._lock:
+            self._students.pop(uid, None)
+            ordinal = self._ordinals.get(uid)
+            if ordinal is not None:
+                self._bits &= ~(1 << ordinal)
+            for listener in self._listeners:
+                listener.remove(uid)
+
+    def bits(self) -> int:
+        """Bitset of the ordinals of every current student."""
+        return self._bits
+
+    def get(self, uid: str):
+        return self._students.get(uid)
+
+    def students(self) -> dict:
+        return self._students
+
+
+class SharedRosterCache(RosterCache):
+    """Roster read in place from the segment ``manage.py roster_shm_writer`` publishes.
+
+    Writes made on this worker are kept in a small overlay until a
+    generation read after them arrives. Without a live writer this falls
+    back to the per-worker Firestore mirror.
+    """
+
+    def __init__(self, reader, ttl: float, full_reload_after: float = None):
+        super().__init__(ttl, full_reload_after)
+        self.reader = reader
+        self._view = None
+        self._generation = None
+        self._overlay = {}
+
+    def _follow_writer(self):
+        """Pick up the writer's latest generation (a few struct reads when unchanged)."""
+        with self._lock:
+            view = self.reader.current()
+            if view is None:
+                self._view = self._generation = None
+            elif self.reader.generation != self._generation:
+                self._apply_view(view)
+            return self._view
+
+    def ensure_fresh(self, db):
+        if self._follow_writer() is None:
+            super().ensure_fresh(db)
+
+    def _apply_view(self, view):
+        """Switch to a new generation. Caller holds the lock."""
+        overlay = {uid: entry for uid, entry in self._overlay.items() if entry[0] >= view.read_time}
+        bits = 0
+        for uid in view.uids():
+            bits |= 1 << self.ordinal(uid)
+        for uid, (_, user) in overlay.items():
+            bit = 1 << self.ordinal(uid)
+            bits = bits | bit if user is not None else bits & ~bit
+        self._view, self._generation, self._overlay, self._bits = view, self.reader.generation, overlay, bits
+        self._loaded_at = time.monotonic()
+        if self._listeners:
+            students = self.students()
+            for listener in self._listeners:
+                listener.reset(students)
+
+    def upsert(self, user: dict):
+        with self._lock:
+            super().upsert(user)
+            if self._view is not None:
+                student = user if user.get("role") == "student" else None
+                self._overlay[user.get("uid")] = (time.time(), student)
+
+    def remove(self, uid: str):
+        with self._lock:
+            super().remove(uid)
+            if self._view is not None:
+                self._overlay[uid] = (time.time(), None)
+
+    def get(self, uid: str):
+        with self._lock:
+            view, overlay = self._view, self._overlay.get(uid)
+        if view is None:
+            return super().get(uid)
+        if overlay is not None:
+            return overlay[1]
+        return view.find(uid)
+
+    def students(self) -> dict:
+        with self._lock:
+            view, overlay = self._view, dict(self._overlay)
+        if view is None:
+            return super().students()
+        students = {record["uid"]: record for record in view}
+        for uid, (_, user) in overlay.items():
+            if user is None:
+                students.pop(uid, None)
+            else:
+                students[uid] = user
+        return students
+
+
+_roster = None
+_roster_lock = threading.Lock()
+
+
+def get_roster() -> RosterCache:
+    global _roster
+
+    if _roster is not None:
+        return _roster
+
+    with _roster_lock:
+        if _roster is None:
+            if settings.ROSTER_SHM_NAME:
+                reader = SharedRosterReader(settings.ROSTER_SHM_NAME, stale_after=settings.ROSTER_SHM_STALE_SECONDS)
+                _roster = SharedRosterCache(
+                    reader,
+                    ttl=settings.ROSTER_TTL_SECONDS,
+                    full_reload_after=settings.ROSTER_FULL_RELOAD_SECONDS,
+                )
+            else:
+                _roster = RosterCache(
+                    ttl=settings.ROSTER_TTL_SECONDS,
+                    full_reload_after=settings.ROSTER_FULL_RELOAD_SECONDS,
+                )
+    return _roster
+
+
+def load_startup_snapshot():
+    """Warm the roster from ``ROSTER_SNAPSHOT_PATH`` if a snapshot is there.
+
+    Skipped when the roster comes from shared memory.
+    """
+    path = settings.ROSTER_SNAPSHOT_PATH
+    if not path or settings.ROSTER_SHM_NAME:
+        return
+    try:
+        count = get_roster().load_snapshot(path)
+    except FileNotFoundError:
+        return
+    except Exception as e:
+        # Any unreadable snapshot just means a full read on first use.
+        logger.warning("Ignoring roster snapshot %s: %s", path, e)
+        return
+    logger.info("Loaded %d students from roster snapshot %s", count, path)
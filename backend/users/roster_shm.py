@@ -0,0 +1,175 @@
+"""
+Student roster shared between worker processes.
+
+``manage.py roster_shm_writer`` is the only process that reads ``users``
+from Firestore. It publishes the roster in the fixed ``roster_snapshot``
+layout to a ``multiprocessing.shared_memory`` segment, and every worker reads
+that segment in place through a ``SnapshotView``. The segments are mapped,
+not copied, so memory use and Firestore reads don't grow with the number of
+workers.
+
+Each publish goes to a new segment, ``{name}-{generation}``. A small control
+segment, ``{name}``, points readers at the current one::
+
+    magic "RSHM", u16 version, u16 reserved, u64 sequence, u64 generation,
+    u64 data size, f64 heartbeat (unix seconds)
+
+The writer bumps ``sequence`` to an odd value before it updates the other
+fields, and to an even value after (a seqlock). Readers retry any read that
+sees an odd or changed sequence. Unlinking an old segment doesn't affect
+workers that still map it. Readers release a segment one generation after it
+was replaced, so lookups still in flight can finish.
+"""
+import atexit
+import struct
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+from users.roster_snapshot import SnapshotView, encode
+
+
+CONTROL = struct.Struct("<4sHHQQQd")
+CONTROL_MAGIC = b"RSHM"
+CONTROL_VERSION = 1
+
+
+def _segment_name(name: str, generation: int) -> str:
+    return f"{name}-{generation}"
+
+
+def _attach(name: str):
+    """Open an existing segment without letting this process's exit unlink it."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Before Python 3.13 every attach is tracked and unlinked at exit.
+        segment = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(segment._name, "shared_memory")
+        return segment
+
+
+class SharedRosterWriter:
+    def __init__(self, name: str):
+        self.name = name
+        try:
+            self._control = shared_memory.SharedMemory(name=name, create=True, size=CONTROL.size)
+            self._control.buf[:CONTROL.size] = CONTROL.pack(CONTROL_MAGIC, CONTROL_VERSION, 0, 0, 0, 0, 0.0)
+        except FileExistsError:
+            # Left behind by a writer that didn't shut down cleanly: carry on its generations.
+            self._control = shared_memory.SharedMemory(name=name)
+        _, _, _, self._sequence, self.generation, _, _ = CONTROL.unpack_from(self._control.buf)
+        self._sequence += self._sequence % 2
+        self._segment = None
+
+    def _write_control(self, generation: int, size: int, heartbeat: float):
+        buf = self._control.buf
+        self._sequence += 1
+        struct.pack_into("<Q", buf, 8, self._sequence)
+        CONTROL.pack_into(buf, 0, CONTROL_MAGIC, CONTROL_VERSION, 0, self._sequence, generation, size, heartbeat)
+        self._sequence += 1
+        struct.pack_into("<Q", buf, 8, self._sequence)
+
+    def publish(self, students: dict, read_time: float, resume_token: str) -> int:
+        """Publish a new generation of the roster; returns its size in bytes."""
+        data = encode(students, read_time, resume_token)
+        generation = self.generation + 1
+        segment = shared_memory.SharedMemory(
+            name=_segment_name(self.name, generation), create=True, size=max(1, len(data))
+        )
+        segment.buf[:len(data)] = data
+        self._write_control(generation, len(data), time.time())
+
+        previous, self._segment, self.generation = self._segment, segment, generation
+        if previous is not None:
+            previous.close()
+            previous.unlink()
+        return len(data)
+
+    def heartbeat(self):
+        """Tell readers the writer is alive even when nothing changed."""
+        _, _, _, _, generation, size, _ = CONTROL.unpack_from(self._control.buf)
+        self._write_control(generation, size, time.time())
+
+    def close(self):
+        """Unlink every segment; workers fall back to their own Firestore mirror."""
+        # Generation 0 tells readers still mapping the control block that the writer is gone.
+        self._write_control(0, 0, 0.0)
+        if self._segment is not None:
+            self._segment.close()
+            self._segment.unlink()
+            self._segment = None
+        self._control.close()
+        self._control.unlink()
+
+
+class SharedRosterReader:
+    """Follows the writer's control block. Not thread-safe; callers serialize ``current``."""
+
+    def __init__(self, name: str, stale_after: float):
+        self.name = name
+        self.stale_after = stale_after
+        self.generation = None
+        self._control = None
+        self._retry_at = 0.0
+        self._current = None
+        self._retired = None
+        atexit.register(self.close)
+
+    def _read_control(self):
+        buf = self._control.buf
+        for _ in range(100):
+            magic, version, _, sequence, generation, size, heartbeat = CONTROL.unpack_from(buf)
+            if sequence % 2 == 0 and struct.unpack_from("<Q", buf, 8)[0] == sequence:
+                if magic != CONTROL_MAGIC or version != CONTROL_VERSION:
+                    return None
+                return generation, size, heartbeat
+        return None
+
+    def _detach_control(self):
+        self._control.close()
+        self._control = None
+        self._retry_at = time.monotonic() + 1.0
+
+    def current(self):
+        """The ``SnapshotView`` of the latest generation, or None without a live writer."""
+        if self._control is None:
+            if time.monotonic() < self._retry_at:
+                return None
+            try:
+                self._control = _attach(self.name)
+            except FileNotFoundError:
+                self._retry_at = time.monotonic() + 1.0
+                return None
+
+        control = self._read_control()
+        if control is None or control[0] == 0 or time.time() - control[2] > self.stale_after:
+            self._detach_control()
+            self._swap(None, None)
+            return None
+
+        generation, size, _ = control
+        if generation != self.generation and generation > 0:
+            try:
+                segment = _attach(_segment_name(self.name, generation))
+            except FileNotFoundError:
+                # Replaced again between reading the control block and attaching.
+                return self._current[2] if self._current else None
+            buffer = segment.buf[:size]
+            self._swap(generation, (segment, buffer, SnapshotView(buffer)))
+        return self._current[2] if self._current else None
+
+    def close(self):
+        """Release every mapping (registered with ``atexit``)."""
+        self._swap(None, None)
+        self._swap(None, None)
+        if self._control is not None:
+            self._detach_control()
+
+    def _swap(self, generation, current):
+        retired, self._retired, self._current = self._retired, self._current, current
+        self.generation = generation
+        if retired is not None:
+            segment, buffer, view = retired
+            view.release()
+            buffer.release()
+            segment.close()
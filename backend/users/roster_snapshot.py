@@ -0,0 +1,174 @@
+"""
+Fixed-layout binary roster snapshot.
+
+Layout (all little-endian)::
+
+    header   magic "RSTR", u16 version, u16 flags (unused, 0), u32 record count,
+             u32 string bytes, f64 read time (unix seconds),
+             40s resume token (ISO timestamp, NUL padded)
+    records  count x (i64 fingerprint_id or -1, u32 uid offset,
+             u32 name offset, u16 uid length, u16 name length),
+             sorted by uid
+    strings  UTF-8 uids and names referenced by the records
+
+Records have a fixed size and are sorted by uid, so a reader can binary
+search a memory-mapped file (or shared memory segment) without decoding it.
+Fingerprint lookups go through ``fingerprint_map``, not the snapshot; bytes
+after the strings (the fingerprint index some older snapshots carry) are
+ignored.
+"""
+import mmap
+import os
+import struct
+import tempfile
+from pathlib import Path
+
+
+MAGIC = b"RSTR"
+VERSION = 1
+HEADER = struct.Struct("<4sHHIId40s")
+RECORD = struct.Struct("<qIIHH")
+NO_FINGERPRINT = -1
+
+
+class SnapshotFormatError(ValueError):
+    """Raised when a buffer is not a roster snapshot this code can read."""
+
+
+def encode(students: dict, read_time: float, resume_token: str) -> bytes:
+    """Serialize ``{uid: {"name", "fingerprint_id", ...}}`` into the snapshot layout."""
+    strings = bytearray()
+    records = []
+    for uid in sorted(students):
+        student = students[uid]
+        uid_bytes = uid.encode("utf-8")
+        name_bytes = (student.get("name") or "").encode("utf-8")[:0xFFFF]
+        fingerprint_id = student.get("fingerprint_id")
+
+        uid_offset = len(strings)
+        strings += uid_bytes
+        name_offset = len(strings)
+        strings += name_bytes
+        records.append(RECORD.pack(
+            NO_FINGERPRINT if fingerprint_id is None else int(fingerprint_id),
+            uid_offset, name_offset, len(uid_bytes), len(name_bytes),
+        ))
+
+    header = HEADER.pack(
+        MAGIC, VERSION, 0, len(records), len(strings), read_time, (resume_token or "").encode("ascii"),
+    )
+    return b"".join([header, *records, bytes(strings)])
+
+
+class SnapshotView:
+    """Read-only view over an encoded snapshot (bytes, mmap or shared memory)."""
+
+    def __init__(self, buffer):
+        self._buffer = memoryview(buffer)
+        try:
+            self._read_header()
+        except BaseException:
+            # An exported view keeps an mmap or shared memory segment from closing.
+            self._buffer.release()
+            raise
+
+    def _read_header(self):
+        if len(self._buffer) < HEADER.size:
+            raise SnapshotFormatError("buffer too small for a roster snapshot")
+        magic, version, _, count, string_size, read_time, token = HEADER.unpack_from(self._buffer, 0)
+        if magic != MAGIC or version != VERSION:
+            raise SnapshotFormatError(f"not a version {VERSION} roster snapshot")
+
+        self.count = count
+        self.read_time = read_time
+        try:
+            self.resume_token = token.rstrip(b"\0").decode("ascii") or None
+        except UnicodeDecodeError:
+            raise SnapshotFormatError("corrupt roster snapshot resume token")
+        self._records_at = HEADER.size
+        self._strings_at = HEADER.size + count * RECORD.size
+        end = self._strings_at + string_size
+        if len(self._buffer) < end:
+            raise SnapshotFormatError("truncated roster snapshot")
+
+    def _string(self, offset: int, length: int) -> str:
+        start = self._strings_at + offset
+        return bytes(self._buffer[start:start + length]).decode("utf-8")
+
+    def record(self, index: int) -> dict:
+        fingerprint_id, uid_offset, name_offset, uid_length, name_length = RECORD.unpack_from(
+            self._buffer, self._records_at + index * RECORD.size
+        )
+        return {
+            "uid": self._string(uid_offset, uid_length),
+            "name": self._string(name_offset, name_length),
+            "fingerprint_id": None if fingerprint_id == NO_FINGERPRINT else fingerprint_id,
+            "role": "student",
+        }
+
+    def find(self, uid: str):
+        """Binary search for ``uid``; returns its record or None."""
+        target = uid.encode("utf-8")
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            _, uid_offset, _, uid_length, _ = RECORD.unpack_from(
+                self._buffer, self._records_at + middle * RECORD.size
+            )
+            start = self._strings_at + uid_offset
+            current = bytes(self._buffer[start:start + uid_length])
+            if current < target:
+                low = middle + 1
+            elif current > target:
+                high = middle
+            else:
+                return self.record(middle)
+        return None
+
+    def uids(self):
+        """Every uid, in order, without decoding names."""
+        for index in range(self.count):
+            _, uid_offset, _, uid_length, _ = RECORD.unpack_from(self._buffer, self._records_at + index * RECORD.size)
+            yield self._string(uid_offset, uid_length)
+
+    def __iter__(self):
+        for index in range(self.count):
+            yield self.record(index)
+
+    def release(self):
+        self._buffer.release()
+
+
+def write_snapshot(path, students: dict, read_time: float, resume_token: str):
+    """Atomically replace the snapshot at ``path``."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(encode(students, read_time, resume_token))
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def read_snapshot(path):
+    """Memory-map the snapshot at ``path`` and decode every record.
+
+    Raises SnapshotFormatError for a file that is empty, truncated or corrupt.
+    """
+    with open(path, "rb") as f:
+        try:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError as e:
+            raise SnapshotFormatError(str(e))
+        with mapped:
+            view = SnapshotView(mapped)
+            try:
+                students = {record["uid"]: record for record in view}
+                return students, view.read_time, view.resume_token
+            except (struct.error, UnicodeDecodeError) as e:
+                raise SnapshotFormatError(f"corrupt roster snapshot: {e}")
+            finally:
+                view.release()
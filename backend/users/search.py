@@ -0,0 +1,164 @@
+"""
+In-memory typeahead index over the student roster.
+
+Every student contributes a handful of sorted ``(term, uid, kind)`` entries:
+each word of their name, their uid and their fingerprint id, all lowercased
+and with accents folded. A query word matches every term it is a prefix of,
+found with ``bisect`` in O(log n) plus the number of matches. A multi-word
+query keeps the students that match every word.
+
+The index listens to ``users.roster``, so it is updated one student at a
+time by ``register_user``, ``delete_student`` and roster catch-ups, and
+rebuilt only when the roster itself is reloaded.
+"""
+import heapq
+import threading
+import unicodedata
+from bisect import bisect_left, insort
+
+from users.roster import get_roster
+
+
+# Lower ranks sort first: ids before the first word of a name before later words.
+KIND_RANK = {"uid": 0, "fingerprint_id": 0, "first_name": 1, "name": 2}
+
+
+def normalize(text) -> str:
+    """Lowercase and strip accents so ``"Émile"`` matches ``"emile"``."""
+    decomposed = unicodedata.normalize("NFKD", str(text))
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+
+def _terms(student: dict) -> list:
+    terms = []
+    words = normalize(student.get("name") or "").split()
+    for position, word in enumerate(words):
+        terms.append((word, "first_name" if position == 0 else "name"))
+    if student.get("uid"):
+        terms.append((normalize(student["uid"]), "uid"))
+    if student.get("fingerprint_id") is not None:
+        terms.append((str(student["fingerprint_id"]), "fingerprint_id"))
+    return terms
+
+
+class SearchIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = []
+        self._terms = {}
+        self._students = {}
+        self._sort_keys = {}
+
+    # Roster listener interface (see RosterCache.add_listener).
+
+    def reset(self, students: dict):
+        entries, terms, summaries, sort_keys = [], {}, {}, {}
+        for uid, student in students.items():
+            terms[uid] = _terms(student)
+            summaries[uid] = self._summary(student)
+            sort_keys[uid] = normalize(student.get("name") or "")
+            entries.extend((term, uid, kind) for term, kind in terms[uid])
+        entries.sort()
+        with self._lock:
+            self._entries, self._terms, self._students, self._sort_keys = entries, terms, summaries, sort_keys
+
+    def upsert(self, student: dict):
+        uid = student.get("uid")
+        terms = _terms(student)
+        with self._lock:
+            self._remove_terms(uid)
+            for term, kind in terms:
+                insort(self._entries, (term, uid, kind))
+            self._terms[uid] = terms
+            self._students[uid] = self._summary(student)
+            self._sort_keys[uid] = normalize(student.get("name") or "")
+
+    def remove(self, uid: str):
+        with self._lock:
+            self._remove_terms(uid)
+            self._students.pop(uid, None)
+            self._sort_keys.pop(uid, None)
+
+    def _remove_terms(self, uid: str):
+        for term, kind in self._terms.pop(uid, ()):
+            position = bisect_left(self._entries, (term, uid, kind))
+            if position < len(self._entries) and self._entries[position] == (term, uid, kind):
+                del self._entries[position]
+
+    @staticmethod
+    def _summary(student: dict) -> dict:
+        return {
+            "uid": student.get("uid"),
+            "name": student.get("name"),
+            "fingerprint_id": student.get("fingerprint_id"),
+        }
+
+    def _matches(self, word: str) -> dict:
+        """``{uid: (inexact, kind rank, kind)}`` for students with a term starting with ``word``."""
+        matches = {}
+        entries = self._entries
+        position = bisect_left(entries, (word,))
+        while position < len(entries):
+            term, uid, kind = entries[position]
+            if not term.startswith(word):
+                break
+            match = (term != word, KIND_RANK[kind], kind)
+            best = matches.get(uid)
+            if best is None or match < best:
+                matches[uid] = match
+            position += 1
+        return matches
+
+    def search(self, query: str, limit: int, offset: int = 0):
+        """Ranked matches for ``query``: ``(page, total)``.
+
+        Exact term matches rank before prefix matches, ids before names and
+        first names before other words; ties are broken by name. Only the
+        requested page is ordered, so broad prefixes stay cheap.
+        """
+        words = normalize(query).split()
+        if not words:
+            return [], 0
+
+        with self._lock:
+            found = {
+                uid: (inexact, rank, {kind})
+                for uid, (inexact, rank, kind) in self._matches(words[0]).items()
+            }
+            for word in words[1:]:
+                matches = self._matches(word)
+                found = {
+                    uid: (inexact + matches[uid][0], rank + matches[uid][1], kinds | {matches[uid][2]})
+                    for uid, (inexact, rank, kinds) in found.items()
+                    if uid in matches
+                }
+
+            sort_keys = self._sort_keys
+            top = heapq.nsmallest(
+                offset + limit,
+                found.items(),
+                key=lambda item: (item[1][0], item[1][1], sort_keys[item[0]], item[0]),
+            )
+            page = [
+                dict(self._students[uid], matched=sorted({"name" if kind == "first_name" else kind for kind in kinds}))
+                for uid, (_, _, kinds) in top[offset:]
+            ]
+        return page, len(found)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_search_index() -> SearchIndex:
+    global _index
+
+    if _index is not None:
+        return _index
+
+    with _index_lock:
+        if _index is None:
+            index = SearchIndex()
+            get_roster().add_listener(index)
+            _index = index
+    return _index
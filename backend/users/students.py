@@ -0,0 +1,39 @@
+"""
+Student reads shared by the users, attendance and dashboard views.
+
+Inside a batch (see ``backend_project/batch.py``) the student list is read
+once and shared by every sub-request that needs it; outside one each call
+queries Firestore, as the views always did.
+"""
+from backend_project.batch import active, memoized
+
+
+def student_records(db) -> list:
+    """Every ``users`` document with ``role == "student"``; treat the list as read-only."""
+
+    def load():
+        return [doc.to_dict() for doc in db.collection("users").where("role", "==", "student").stream()]
+
+    return memoized(("students",), load)
+
+
+def student_names(db, uids) -> dict:
+    """``{uid: name}`` for ``uids``, ``"Unknown"`` for users that don't exist.
+
+    In a batch the names come from the shared student list; only uids that
+    aren't students fall back to a document read each.
+    """
+    names = {}
+    if active():
+        names = {record.get("uid"): record.get("name", "Unknown") for record in student_records(db)}
+
+    result = {}
+    for uid in uids:
+        if uid in result:
+            continue
+        if uid in names:
+            result[uid] = names[uid]
+            continue
+        student_doc = db.collection("users").document(uid).get()
+        result[uid] = student_doc.to_dict().get("name", "Unknown") if student_doc.exists else "Unknown"
+    return result
@@ -1,3 +1,348 @@
-from django.test import TestCase
+import json
+import os
+import struct
+import tempfile
+import time
+import uuid
+from multiprocessing import shared_memory
+from unittest import mock
 
-# Create your tests here.
+from django.test import RequestFactory, SimpleTestCase
+
+from firebase_config.testing import use_fake_firestore
+from fingerprint import slots
+from fingerprint.mapping import allocate_slot, register_user_fingerprint
+from users import roster, search
+from users.roster import RosterCache, SharedRosterCache
+from users.roster_shm import SharedRosterReader, SharedRosterWriter
+from users.roster_snapshot import SnapshotFormatError, SnapshotView, encode, read_snapshot, write_snapshot
+from users.search import SearchIndex, normalize
+from users.views import delete_student, register_user, search_students
+
+
+STUDENTS = {
+    "b-uid": {"uid": "b-uid", "name": "Björn", "fingerprint_id": 7, "role": "student"},
+    "a-uid": {"uid": "a-uid", "name": "Ada", "fingerprint_id": None, "role": "student"},
+    "c-uid": {"uid": "c-uid", "name": "Cy", "fingerprint_id": 3, "role": "student"},
+}
+
+
+class SnapshotTests(SimpleTestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.path = os.path.join(self.dir.name, "roster.snap")
+
+    def write_bytes(self, data: bytes):
+        with open(self.path, "wb") as f:
+            f.write(data)
+
+    def test_round_trip(self):
+        write_snapshot(self.path, STUDENTS, 1700000000.5, "2024-01-01T00:00:00+00:00")
+        students, read_time, resume_token = read_snapshot(self.path)
+        self.assertEqual(students, STUDENTS)
+        self.assertEqual(read_time, 1700000000.5)
+        self.assertEqual(resume_token, "2024-01-01T00:00:00+00:00")
+
+    def test_view_lookups(self):
+        view = SnapshotView(encode(STUDENTS, 0.0, ""))
+        self.assertEqual(view.find("b-uid")["name"], "Björn")
+        self.assertIsNone(view.find("zzz"))
+        self.assertEqual(list(view.uids()), ["a-uid", "b-uid", "c-uid"])
+        self.assertIsNone(view.resume_token)
+        view.release()
+
+    def test_trailing_fingerprint_index_is_ignored(self):
+        # Older snapshots set flag 1 and appended a fingerprint index after the strings.
+        data = bytearray(encode(STUDENTS, 0.0, "token"))
+        data[6] = 1
+        self.write_bytes(bytes(data) + struct.pack("<IqI", 1, 7, 1))
+        students, _, _ = read_snapshot(self.path)
+        self.assertEqual(students, STUDENTS)
+
+    def test_empty_file(self):
+        self.write_bytes(b"")
+        with self.assertRaises(SnapshotFormatError):
+            read_snapshot(self.path)
+
+    def test_truncated_files(self):
+        data = encode(STUDENTS, 0.0, "token")
+        for size in (10, 60, len(data) - 1):
+            self.write_bytes(data[:size])
+            with self.assertRaises(SnapshotFormatError):
+                read_snapshot(self.path)
+
+    def test_garbage(self):
+        self.write_bytes(os.urandom(4096))
+        with self.assertRaises(SnapshotFormatError):
+            read_snapshot(self.path)
+
+    def test_corrupt_strings(self):
+        data = bytearray(encode(STUDENTS, 0.0, "token"))
+        # Overwrite the first string byte (the uid "a-uid") with invalid UTF-8.
+        data[data.index(b"a-uid")] = 0xFF
+        self.write_bytes(bytes(data))
+        with self.assertRaises(SnapshotFormatError):
+            read_snapshot(self.path)
+
+    def test_load_snapshot_after_error(self):
+        self.write_bytes(b"RSTR" + os.urandom(20))
+        roster = RosterCache(ttl=60)
+        with self.assertRaises(SnapshotFormatError):
+            roster.load_snapshot(self.path)
+        self.assertTrue(roster.due_for_full_reload())
+
+
+class RosterReloadTests(SimpleTestCase):
+    def setUp(self):
+        self.db = use_fake_firestore()
+        users = self.db.data.setdefault("users", {})
+        users["a-uid"] = {"uid": "a-uid", "name": "Ada", "role": "student", "updated_at": "2024-01-01T00:00:00"}
+
+    def test_catch_up_misses_writes_without_updated_at(self):
+        roster = RosterCache(ttl=0, full_reload_after=3600)
+        roster.ensure_fresh(self.db)
+        self.db.data["users"]["b-uid"] = {"uid": "b-uid", "name": "Bo", "role": "student"}
+        roster.ensure_fresh(self.db)
+        self.assertNotIn("b-uid", roster.students())
+
+    def test_periodic_full_reload(self):
+        roster = RosterCache(ttl=0, full_reload_after=3600)
+        roster.ensure_fresh(self.db)
+        self.db.data["users"]["b-uid"] = {"uid": "b-uid", "name": "Bo", "role": "student"}
+        del self.db.data["users"]["a-uid"]
+
+        roster._full_loaded_at = time.monotonic() - 3601
+        self.assertTrue(roster.due_for_full_reload())
+        roster.ensure_fresh(self.db)
+        self.assertEqual(set(roster.students()), {"b-uid"})
+        self.assertFalse(roster.due_for_full_reload())
+
+
+class ResetRecorder:
+    """Roster listener that remembers the students of each full reset."""
+
+    def __init__(self):
+        self.resets = []
+
+    def reset(self, students):
+        self.resets.append(set(students))
+
+    def upsert(self, student):
+        pass
+
+    def remove(self, uid):
+        pass
+
+
+class SharedRosterTests(SimpleTestCase):
+    def setUp(self):
+        self.db = use_fake_firestore()
+        self.db.data["users"] = {"f-uid": {"uid": "f-uid", "name": "Fay", "role": "student"}}
+        # Writer and reader share this process, so the reader must not untrack
+        # the writer's segments (as _attach does for a separate worker).
+        attach = mock.patch("users.roster_shm._attach", lambda name: shared_memory.SharedMemory(name=name))
+        attach.start()
+        self.addCleanup(attach.stop)
+        name = f"roster-test-{uuid.uuid4().hex[:8]}"
+        self.writer = SharedRosterWriter(name)
+        self.reader = SharedRosterReader(name, stale_after=30)
+        self.addCleanup(self.writer.close)
+        self.addCleanup(self.reader.close)
+        self.roster = SharedRosterCache(self.reader, ttl=0)
+
+    def test_follows_new_generations(self):
+        self.writer.publish({"a-uid": STUDENTS["a-uid"]}, time.time(), "")
+        recorder = ResetRecorder()
+        self.roster.add_listener(recorder)
+        self.roster.ensure_fresh(self.db)
+        self.assertEqual(set(self.roster.students()), {"a-uid"})
+
+        self.writer.publish(STUDENTS, time.time(), "")
+        self.roster.ensure_fresh(self.db)
+        self.assertEqual(self.reader.generation, 2)
+        self.assertEqual(self.roster.get("b-uid")["name"], "Björn")
+        self.assertEqual(recorder.resets[-2:], [{"a-uid"}, set(STUDENTS)])
+        self.assertEqual(self.db.queries, 0)
+
+    def test_local_writes_last_until_a_newer_generation(self):
+        self.writer.publish(STUDENTS, time.time() - 10, "")
+        self.roster.ensure_fresh(self.db)
+        self.roster.upsert({"uid": "d-uid", "name": "Dee", "role": "student"})
+        self.roster.remove("a-uid")
+
+        # Read before the local writes: they stay on top of it.
+        self.writer.publish(STUDENTS, time.time() - 5, "")
+        self.roster.ensure_fresh(self.db)
+        self.assertEqual(set(self.roster.students()), {"b-uid", "c-uid", "d-uid"})
+        self.assertIsNone(self.roster.get("a-uid"))
+        self.assertFalse(self.roster.bits() & 1 << self.roster.ordinal("a-uid"))
+
+        # Read after them: the writer's roster wins.
+        self.writer.publish(STUDENTS, time.time() + 1, "")
+        self.roster.ensure_fresh(self.db)
+        self.assertEqual(set(self.roster.students()), set(STUDENTS))
+        self.assertIsNone(self.roster.get("d-uid"))
+
+    def test_falls_back_to_firestore_without_a_live_writer(self):
+        self.writer.publish(STUDENTS, time.time(), "")
+        self.roster.ensure_fresh(self.db)
+        self.assertEqual(set(self.roster.students()), set(STUDENTS))
+
+        with mock.patch("users.roster_shm.time.time", return_value=time.time() + 60):
+            self.roster.ensure_fresh(self.db)
+        self.assertIsNone(self.reader.generation)
+        self.assertEqual(set(self.roster.students()), {"f-uid"})
+        self.assertEqual(self.db.queries, 1)
+
+    def test_closed_writer_means_fallback(self):
+        self.writer.publish(STUDENTS, time.time(), "")
+        self.assertIsNotNone(self.reader.current())
+        self.writer.heartbeat()
+        self.writer._write_control(0, 0, 0.0)
+        self.assertIsNone(self.reader.current())
+        self.roster.ensure_fresh(self.db)
+        self.assertEqual(set(self.roster.students()), {"f-uid"})
+
+
+class RegisterUserTests(SimpleTestCase):
+    def setUp(self):
+        self.db = use_fake_firestore()
+        slots._cache = None
+
+    def register(self, **payload):
+        request = RequestFactory().post("/users/register/", json.dumps(payload), content_type="application/json")
+        response = register_user(request)
+        return response.status_code, json.loads(response.content)
+
+    def used_slots(self):
+        return slots.SlotPool.from_doc("default", self.db.document_data("fingerprint_slots", "default")).used
+
+    def test_allocates_for_a_new_user(self):
+        status, body = self.register(uid="S1", name="Ann")
+        self.assertEqual(status, 200)
+        self.assertEqual(body["user"]["fingerprint_id"], 1)
+        self.assertEqual(self.db.document_data("fingerprint_map", "1")["uid"], "S1")
+
+    def test_re_registering_keeps_the_binding(self):
+        self.register(uid="S1", name="Ann")
+        status, body = self.register(uid="S1", name="Ann B.")
+        self.assertEqual(status, 200)
+        self.assertEqual(body["user"]["fingerprint_id"], 1)
+        self.assertEqual(self.db.document_data("fingerprint_map", "1")["name"], "Ann B.")
+        self.assertEqual(self.used_slots(), 1)
+
+    def test_explicit_zero_is_not_allocated(self):
+        status, body = self.register(uid="S1", name="Ann", fingerprint_id=0)
+        self.assertEqual(status, 200)
+        self.assertEqual(body["user"]["fingerprint_id"], 0)
+        self.assertIsNone(self.db.document_data("fingerprint_slots", "default"))
+
+    def test_failed_registration_releases_the_slot(self):
+        with mock.patch("users.views.register_user_fingerprint", side_effect=RuntimeError("commit failed")):
+            with self.assertRaises(RuntimeError):
+                self.register(uid="S1", name="Ann")
+        self.assertEqual(self.used_slots(), 0)
+        status, body = self.register(uid="S2", name="Bo")
+        self.assertEqual(body["user"]["fingerprint_id"], 1)
+
+    def test_slot_taken_between_allocate_and_register_is_a_409(self):
+        def allocate_then_lose_the_race(db, pool):
+            fingerprint_id = allocate_slot(db, pool)
+            register_user_fingerprint(db, {"uid": "S9", "name": "Sy", "role": "student",
+                                           "fingerprint_id": fingerprint_id})
+            return fingerprint_id
+
+        with mock.patch("users.views.allocate_slot", side_effect=allocate_then_lose_the_race):
+            status, body = self.register(uid="S1", name="Ann")
+        self.assertEqual(status, 409)
+        self.assertEqual(self.db.document_data("fingerprint_map", "1")["uid"], "S9")
+        self.assertIsNone(self.db.document_data("users", "S1"))
+
+    def test_explicit_fingerprint_keeps_the_stored_pool(self):
+        self.register(uid="S1", name="Ann", fingerprint_id=3, fingerprint_pool="lab")
+        status, body = self.register(uid="S1", name="Ann", fingerprint_id=4)
+        self.assertEqual(status, 200)
+        self.assertEqual(body["user"]["fingerprint_pool"], "lab")
+        self.assertEqual(self.db.document_data("users", "S1")["fingerprint_pool"], "lab")
+
+        status, body = self.register(uid="S1", name="Ann", fingerprint_id=4, pool="hall")
+        self.assertEqual(body["user"]["fingerprint_pool"], "hall")
+
+
+class SearchIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.index = SearchIndex()
+        self.index.reset({
+            "S1": {"uid": "S1", "name": "Ann Lee", "fingerprint_id": 1},
+            "S2": {"uid": "S2", "name": "Annabel Ng", "fingerprint_id": 2},
+            "S3": {"uid": "S3", "name": "Lee Annan", "fingerprint_id": None},
+            "S4": {"uid": "S4", "name": "Émile Zola", "fingerprint_id": 4},
+        })
+
+    def uids(self, query, limit=10, offset=0):
+        page, _ = self.index.search(query, limit=limit, offset=offset)
+        return [student["uid"] for student in page]
+
+    def test_exact_before_prefix_and_first_names_before_other_words(self):
+        self.assertEqual(self.uids("ann"), ["S1", "S2", "S3"])
+        self.assertEqual(self.uids("lee"), ["S3", "S1"])
+        page, _ = self.index.search("2", limit=10)
+        self.assertEqual(page, [
+            {"uid": "S2", "name": "Annabel Ng", "fingerprint_id": 2, "matched": ["fingerprint_id"]},
+        ])
+
+    def test_every_word_must_match(self):
+        self.assertEqual(self.uids("ann lee"), ["S1", "S3"])
+        self.assertEqual(self.uids("annab lee"), [])
+
+    def test_pages_report_the_full_total(self):
+        self.assertEqual(self.index.search("ann", limit=1, offset=1), (
+            [{"uid": "S2", "name": "Annabel Ng", "fingerprint_id": 2, "matched": ["name"]}], 3,
+        ))
+        self.assertEqual(self.index.search("ann", limit=5, offset=3), ([], 3))
+        self.assertEqual(self.index.search("   ", limit=5), ([], 0))
+
+    def test_accents_are_folded(self):
+        self.assertEqual(normalize("Émile"), "emile")
+        self.assertEqual(self.uids("emile"), ["S4"])
+        self.assertEqual(self.uids("ÉMI"), ["S4"])
+
+    def test_upsert_and_remove(self):
+        self.index.upsert({"uid": "S2", "name": "Bea Ng", "fingerprint_id": 2})
+        self.assertEqual(self.uids("ann"), ["S1", "S3"])
+        self.assertEqual(self.uids("bea"), ["S2"])
+        self.index.upsert({"uid": "S5", "name": "Anna Ray"})
+        self.assertEqual(self.uids("ann"), ["S1", "S5", "S3"])
+
+        self.index.remove("S1")
+        self.assertEqual(self.uids("ann"), ["S5", "S3"])
+        self.assertEqual(self.uids("1"), [])
+        self.index.remove("S1")
+
+
+class SearchStudentsTests(SimpleTestCase):
+    def setUp(self):
+        self.db = use_fake_firestore()
+        slots._cache = None
+        roster._roster = RosterCache(ttl=60)
+        search._index = None
+        self.addCleanup(setattr, roster, "_roster", None)
+        self.addCleanup(setattr, search, "_index", None)
+
+    def search(self, q):
+        response = search_students(RequestFactory().get("/users/search/", {"q": q}))
+        return json.loads(response.content)
+
+    def test_deleted_student_leaves_the_index(self):
+        factory = RequestFactory()
+        for uid, name in (("S1", "Ann Lee"), ("S2", "Anna Ray")):
+            register_user(factory.post("/users/register/", json.dumps({"uid": uid, "name": name}),
+                                       content_type="application/json"))
+        self.assertEqual(self.search("ann")["total"], 2)
+
+        response = delete_student(factory.delete("/users/S1/delete/"), "S1")
+        self.assertEqual(response.status_code, 200)
+        body = self.search("ann")
+        self.assertEqual([student["uid"] for student in body["results"]], ["S2"])
+        self.assertEqual(body["total"], 1)
@@ -4,6 +4,8 @@ from . import views
 urlpatterns = [
     path("register/", views.register_user, name="register_user"),
     path("students/", views.list_students, name="list_students"),
+    path("search/", views.search_students, name="search_students"),
     path("students/<str:uid>/", views.get_student, name="get_student"),
     path("students/<str:uid>/delete/", views.delete_student, name="delete_student"),
+    path("students/<str:uid>/calendar/", views.student_calendar, name="student_calendar"),
 ]
@@ -4,13 +4,36 @@ from datetime import datetime, timezone
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 
+from backend_project.breaker import stale_on_failure
 from firebase_config.firebase import FirebaseCredentialsError, get_firestore_db
+from fingerprint.mapping import (
+    FingerprintConflictError,
+    allocate_slot,
+    delete_user,
+    register_user_fingerprint,
+    release_slot,
+)
+from fingerprint.slots import SlotPoolFullError, pool_name
+from attendance.terms import calendar_ref, calendar_summary, term_for, term_named
+from backend_project.bitsets import from_bytes
+from users.roster import get_roster
+from users.search import get_search_index
+from users.students import student_records
 
 
 def _json_error(message, status=400):
     return JsonResponse({"status": "error", "message": message}, status=status)
 
 
+def _release_reserved(db, pool: str, fingerprint_id: int):
+    """Hand back a slot reserved for a registration that didn't go through."""
+    try:
+        release_slot(db, pool, fingerprint_id)
+    except FingerprintConflictError:
+        # Someone else bound the id in the meantime; it stays taken for them.
+        pass
+
+
 @csrf_exempt
 def register_user(request):
     if request.method != "POST":
@@ -23,20 +46,27 @@ def register_user(request):
 
     uid = payload.get("uid") or payload.get("student_id")
     name = payload.get("name")
-    fingerprint_id = payload.get("fingerprint_id") or payload.get("fingerprintId")
+    fingerprint_id = payload.get("fingerprint_id")
+    if fingerprint_id is None:
+        fingerprint_id = payload.get("fingerprintId")
     role = payload.get("role", "student")
 
     if not uid:
         return _json_error("uid is required")
     if not name:
         return _json_error("name is required")
-    if fingerprint_id is None:
-        return _json_error("fingerprint_id is required")
 
+    if fingerprint_id is not None:
+        try:
+            fingerprint_id = int(fingerprint_id)
+        except (TypeError, ValueError):
+            return _json_error("fingerprint_id must be an integer")
+
+    requested_pool = payload.get("fingerprint_pool") or payload.get("pool")
     try:
-        fingerprint_id = int(fingerprint_id)
-    except (TypeError, ValueError):
-        return _json_error("fingerprint_id must be an integer")
+        pool = pool_name(requested_pool)
+    except ValueError as e:
+        return _json_error(str(e))
 
     try:
         db = get_firestore_db()
@@ -46,16 +76,49 @@ def register_user(request):
             status=500,
         )
 
+    existing = db.collection("users").document(str(uid)).get()
+    existing_data = existing.to_dict() if existing.exists else {}
+    if not requested_pool and existing_data.get("fingerprint_pool"):
+        # Re-registering keeps the user's pool unless the request names one.
+        pool = existing_data["fingerprint_pool"]
+
+    # Without a fingerprint_id, keep the user's current binding, or reserve the
+    # lowest free slot in the pool for a user who has none yet.
+    allocated = False
+    if fingerprint_id is None:
+        if existing_data.get("fingerprint_id") is not None:
+            fingerprint_id = existing_data["fingerprint_id"]
+        else:
+            try:
+                fingerprint_id = allocate_slot(db, pool)
+            except SlotPoolFullError as e:
+                return _json_error(str(e), status=409)
+            allocated = True
+
+    now = datetime.now(timezone.utc).isoformat()
     user_doc = {
         "uid": str(uid),
         "name": name,
         "fingerprint_id": fingerprint_id,
+        "fingerprint_pool": pool,
         "role": role,
-        "created_at": datetime.now(timezone.utc).isoformat(),
+        "created_at": now,
+        "updated_at": now,
     }
 
-    # Use uid as document id for easy read.
-    db.collection("users").document(str(uid)).set(user_doc, merge=True)
+    # Use uid as document id for easy read; fingerprint_map is written in the
+    # same transaction so a fingerprint id can only ever belong to one user.
+    try:
+        register_user_fingerprint(db, user_doc)
+    except FingerprintConflictError as e:
+        if allocated:
+            _release_reserved(db, pool, fingerprint_id)
+        return _json_error(str(e), status=409)
+    except Exception:
+        if allocated:
+            _release_reserved(db, pool, fingerprint_id)
+        raise
+    get_roster().upsert(user_doc)
 
     return JsonResponse(
         {
@@ -67,6 +130,7 @@ def register_user(request):
 
 
 @csrf_exempt
+@stale_on_failure
 def list_students(request):
     """Get all students from Firestore"""
     if request.method != "GET":
@@ -78,12 +142,7 @@ def list_students(request):
         return JsonResponse({"status": "error", "message": str(e)}, status=500)
 
     # Query all users with role=student
-    students_ref = db.collection("users").where("role", "==", "student")
-    students = []
-    
-    for doc in students_ref.stream():
-        student_data = doc.to_dict()
-        students.append(student_data)
+    students = student_records(db)
 
     return JsonResponse({
         "status": "success",
@@ -92,6 +151,42 @@ def list_students(request):
     })
 
 
+@csrf_exempt
+def search_students(request):
+    """Typeahead search over student names, uids and fingerprint ids"""
+    if request.method != "GET":
+        return _json_error("Method not allowed", status=405)
+
+    query = request.GET.get("q", "").strip()
+    if not query:
+        return _json_error("q is required")
+    try:
+        limit = min(max(int(request.GET.get("limit", 20)), 1), 100)
+        offset = max(int(request.GET.get("offset", 0)), 0)
+    except ValueError:
+        return _json_error("limit and offset must be integers")
+
+    try:
+        db = get_firestore_db()
+    except FirebaseCredentialsError as e:
+        return JsonResponse({"status": "error", "message": str(e)}, status=500)
+
+    index = get_search_index()
+    get_roster().ensure_fresh(db)
+    results, total = index.search(query, limit=limit, offset=offset)
+
+    return JsonResponse({
+        "status": "success",
+        "query": query,
+        "results": results,
+        "count": len(results),
+        "total": total,
+        "offset": offset,
+        "limit": limit,
+        "has_more": offset + len(results) < total,
+    })
+
+
 @csrf_exempt
 def get_student(request, uid):
     """Get a single student by UID"""
@@ -127,15 +222,39 @@ def delete_student(request, uid):
     except FirebaseCredentialsError as e:
         return JsonResponse({"status": "error", "message": str(e)}, status=500)
 
-    student_doc = db.collection("users").document(uid).get()
-    
-    if not student_doc.exists:
+    # Delete the student document and release its fingerprint id
+    if not delete_user(db, uid):
         return _json_error("Student not found", status=404)
+    get_roster().remove(uid)
 
-    # Delete the student document
-    db.collection("users").document(uid).delete()
-    
     return JsonResponse({
         "status": "success",
         "message": f"Student {uid} deleted successfully"
     })
+
+
+@csrf_exempt
+def student_calendar(request, uid):
+    """Get a student's attendance calendar for a term from its bitset document"""
+    if request.method != "GET":
+        return _json_error("Method not allowed", status=405)
+
+    today = datetime.now(timezone.utc).date()
+    term_name = request.GET.get("term")
+    term = term_named(term_name) if term_name else term_for(today)
+    if term is None:
+        return _json_error(f"Unknown term: {term_name}", status=404)
+
+    try:
+        db = get_firestore_db()
+    except FirebaseCredentialsError as e:
+        return JsonResponse({"status": "error", "message": str(e)}, status=500)
+
+    calendar_doc = calendar_ref(db, uid, term).get()
+    bits = from_bytes(calendar_doc.to_dict().get("bits")) if calendar_doc.exists else 0
+
+    return JsonResponse({
+        "status": "success",
+        "student_id": uid,
+        "calendar": calendar_summary(bits, term, today),
+    })